@@ -9,6 +9,7 @@ from app.models.user import User
 from app.models.api_usage_log import APIUsageLog
 from app.api.deps import get_db, get_current_admin
 from app.models.admin import Admin
+from app.utils.billing_processor import invalidate_billing_mappings
 from datetime import datetime, timedelta
 import enum
 import logging
@@ -240,6 +241,7 @@ async def update_model(
 
     await db.commit()
     await db.refresh(model)
+    invalidate_billing_mappings()
 
     # Handle substitution logic
     if payload.status == AIModelStatus.under_updation and payload.substitute_model_id:
@@ -326,6 +328,7 @@ async def delete_model(
     # Delete the model
     await db.delete(model)
     await db.commit()
+    invalidate_billing_mappings()
     
     logger.info(f"Admin {current_admin.username} deleted AI model: {model.name}")
     
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -17,7 +19,7 @@ async def login_for_access_token(
     result = await db.execute(stmt)
     admin_user = result.scalar_one_or_none()
     
-    if not admin_user or not verify_password(form_data.password, admin_user.hashed_password):
+    if not admin_user or not await asyncio.to_thread(verify_password, form_data.password, admin_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
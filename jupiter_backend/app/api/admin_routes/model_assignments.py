@@ -1,26 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, or_, func, delete
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func, delete, exists, insert, literal, null, true, inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import aliased
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import List, Optional, Dict, Any, Literal
+from datetime import datetime
+import asyncpg
 import logging
 
 from app.api.deps import get_db, get_current_admin
+from app.database import get_read_pool
 from app.models.user_model_assignment import UserModelAssignment
 from app.models.user import User
 from app.models.ai_model import AIModel
 from app.models.admin import Admin
+from app.utils.cache import bump_cache_version
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # --- Pydantic Models ---
+AccessLevel = Literal["read_only", "read_write", "admin"]
+
 class ModelAssignmentCreate(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, protected_namespaces=())
+    
     user_id: int
     model_id: int
-    access_level: str = Field(default="read_write", description="Access level: read_only, read_write, admin")
+    access_level: AccessLevel = Field(default="read_write", description="Access level: read_only, read_write, admin")
     daily_request_limit: Optional[int] = Field(None, description="Daily request limit for this model")
     monthly_request_limit: Optional[int] = Field(None, description="Monthly request limit for this model")
     daily_token_limit: Optional[int] = Field(None, description="Daily token limit for this model")
@@ -32,14 +41,17 @@ class ModelAssignmentCreate(BaseModel):
     custom_pricing_enabled: bool = Field(default=False, description="Enable custom pricing")
     custom_cost_per_token: Optional[float] = Field(None, description="Custom cost per token")
     custom_cost_per_request: Optional[float] = Field(None, description="Custom cost per request")
-    discount_percentage: float = Field(default=0, description="Discount percentage (0-100)")
+    discount_percentage: float = Field(default=0, ge=0, le=100, description="Discount percentage (0-100)")
     expires_in_days: Optional[int] = Field(None, description="Assignment expires in X days")
     assignment_reason: Optional[str] = Field(None, description="Reason for assignment")
     ip_whitelist: Optional[List[str]] = Field(None, description="Allowed IP addresses")
-    model_config: Optional[Dict[str, Any]] = Field(None, description="Model-specific configuration")
+    # "model_config" is reserved by Pydantic, so the payload key is mapped through an alias
+    model_settings: Optional[Dict[str, Any]] = Field(None, alias="model_config", description="Model-specific configuration")
 
 class ModelAssignmentUpdate(BaseModel):
-    access_level: Optional[str] = Field(None, description="Access level: read_only, read_write, admin")
+    model_config = ConfigDict(populate_by_name=True, protected_namespaces=())
+    
+    access_level: Optional[AccessLevel] = Field(None, description="Access level: read_only, read_write, admin")
     is_active: Optional[bool] = Field(None, description="Whether assignment is active")
     daily_request_limit: Optional[int] = None
     monthly_request_limit: Optional[int] = None
@@ -52,14 +64,16 @@ class ModelAssignmentUpdate(BaseModel):
     custom_pricing_enabled: Optional[bool] = None
     custom_cost_per_token: Optional[float] = None
     custom_cost_per_request: Optional[float] = None
-    discount_percentage: Optional[float] = None
+    discount_percentage: Optional[float] = Field(None, ge=0, le=100)
     expires_in_days: Optional[int] = None
     assignment_reason: Optional[str] = None
     notes: Optional[str] = None
     ip_whitelist: Optional[List[str]] = None
-    model_config: Optional[Dict[str, Any]] = None
+    model_settings: Optional[Dict[str, Any]] = Field(None, alias="model_config")
 
 class ModelAssignmentResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True, defer_build=False)
+    
     id: int
     user_id: int
     model_id: int
@@ -98,6 +112,8 @@ class BulkAssignmentCreate(BaseModel):
     assignment_template: ModelAssignmentCreate
 
 class AssignmentStatsResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True, defer_build=False)
+    
     total_assignments: int
     active_assignments: int
     expired_assignments: int
@@ -105,78 +121,163 @@ class AssignmentStatsResponse(BaseModel):
     models_assigned: int
     total_usage_cost: float
 
+# Columns for a single assignment, labelled to match ModelAssignmentResponse so
+# rows validate directly without hydrating UserModelAssignment ORM instances
+_ASSIGNMENT_LIST_COLUMNS = (
+    UserModelAssignment.id,
+    UserModelAssignment.user_id,
+    UserModelAssignment.model_id,
+    UserModelAssignment.is_active,
+    UserModelAssignment.access_level,
+    UserModelAssignment.daily_request_limit,
+    UserModelAssignment.monthly_request_limit,
+    UserModelAssignment.daily_token_limit,
+    UserModelAssignment.monthly_token_limit,
+    UserModelAssignment.daily_cost_limit,
+    UserModelAssignment.monthly_cost_limit,
+    UserModelAssignment.requests_per_minute,
+    UserModelAssignment.requests_per_hour,
+    UserModelAssignment.custom_pricing_enabled,
+    UserModelAssignment.custom_cost_per_token,
+    UserModelAssignment.custom_cost_per_request,
+    UserModelAssignment.discount_percentage,
+    UserModelAssignment.total_requests_made,
+    UserModelAssignment.total_tokens_used,
+    UserModelAssignment.total_cost_incurred,
+    UserModelAssignment.last_used_at,
+    UserModelAssignment.assigned_at,
+    UserModelAssignment.expires_at,
+    UserModelAssignment.assignment_reason,
+    UserModelAssignment.notes,
+    User.email.label("user_email"),
+    User.organization_name.label("user_organization"),
+    AIModel.name.label("model_name"),
+    AIModel.provider.label("model_provider"),
+)
+
+# The list and stats endpoints are read-only and go through the raw asyncpg
+# pool, whose per-connection statement cache keeps these prepared
+_ASSIGNMENT_LIST_SQL = """
+SELECT uma.id, uma.user_id, uma.model_id, uma.is_active, uma.access_level,
+       uma.daily_request_limit, uma.monthly_request_limit,
+       uma.daily_token_limit, uma.monthly_token_limit,
+       uma.daily_cost_limit, uma.monthly_cost_limit,
+       uma.requests_per_minute, uma.requests_per_hour,
+       uma.custom_pricing_enabled, uma.custom_cost_per_token, uma.custom_cost_per_request,
+       uma.discount_percentage, uma.total_requests_made, uma.total_tokens_used,
+       uma.total_cost_incurred, uma.last_used_at, uma.assigned_at, uma.expires_at,
+       uma.assignment_reason, uma.notes,
+       u.email AS user_email, u.organization_name AS user_organization,
+       m.name AS model_name, m.provider AS model_provider
+FROM user_model_assignments uma
+JOIN users u ON u.id = uma.user_id
+JOIN ai_models m ON m.id = uma.model_id
+WHERE ($1::int IS NULL OR uma.user_id = $1)
+  AND ($2::int IS NULL OR uma.model_id = $2)
+  AND ($3::bool IS NULL OR uma.is_active = $3)
+  AND ($4::text IS NULL OR uma.access_level = $4)
+  AND ($5::timestamp IS NULL OR (uma.assigned_at, uma.id) < ($5, $6::int))
+ORDER BY uma.assigned_at DESC, uma.id DESC
+LIMIT $7
+"""
+
+_ASSIGNMENT_STATS_SQL = """
+SELECT count(*) AS total_assignments,
+       count(*) FILTER (WHERE is_active) AS active_assignments,
+       count(*) FILTER (WHERE expires_at < now()) AS expired_assignments,
+       count(DISTINCT user_id) AS users_with_assignments,
+       count(DISTINCT model_id) AS models_assigned,
+       coalesce(sum(total_cost_incurred), 0) AS total_usage_cost
+FROM user_model_assignments
+"""
+
+# Compiled once per process; endpoints serialize straight to JSON bytes through
+# these instead of constructing models and letting FastAPI re-validate them
+_ASSIGNMENT_ADAPTER = TypeAdapter(ModelAssignmentResponse)
+_ASSIGNMENT_LIST_ADAPTER = TypeAdapter(List[ModelAssignmentResponse])
+
+def _json_response(adapter: TypeAdapter, data: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Validate data with a cached adapter and return it as a JSON response"""
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(data)),
+        media_type="application/json",
+        headers=headers
+    )
+
+# Column names that can be assigned directly on update, resolved once at import
+_ASSIGNMENT_COLUMNS = frozenset(attr.key for attr in sa_inspect(UserModelAssignment).column_attrs)
+
+def _expires_after(days: int):
+    """SQL expression for an expiry `days` from now, evaluated by Postgres"""
+    return func.now() + func.make_interval(0, 0, 0, days)
+
+def _set_expires_in_days(assignment: UserModelAssignment, days: int):
+    assignment.expires_at = _expires_after(days)
+
+# Update fields that need conversion before they are stored
+_SPECIAL_UPDATE_HANDLERS = {
+    "ip_whitelist": UserModelAssignment.set_ip_whitelist,
+    "model_settings": UserModelAssignment.set_model_config,
+    "expires_in_days": _set_expires_in_days,
+}
+
+async def _fetch_assignment(db: AsyncSession, assignment_id: int):
+    """Load one assignment joined with its user and model as a response-shaped row"""
+    query = select(*_ASSIGNMENT_LIST_COLUMNS).join(
+        User, UserModelAssignment.user_id == User.id
+    ).join(
+        AIModel, UserModelAssignment.model_id == AIModel.id
+    ).where(UserModelAssignment.id == assignment_id)
+    
+    result = await db.execute(query)
+    return result.mappings().first()
+
 # --- CRUD Endpoints ---
 
 @router.get("/model-assignments", response_model=List[ModelAssignmentResponse])
 async def get_all_assignments(
-    skip: int = Query(0, description="Records to skip"),
-    limit: int = Query(100, description="Max records to return"),
+    after_assigned_at: Optional[datetime] = Query(None, description="Cursor: assigned_at of the last row from the previous page"),
+    after_id: Optional[int] = Query(None, description="Cursor: id of the last row from the previous page"),
+    limit: int = Query(100, description="Max records to return", ge=1, le=1000),
     user_id: Optional[int] = Query(None, description="Filter by user ID"),
     model_id: Optional[int] = Query(None, description="Filter by model ID"),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
-    access_level: Optional[str] = Query(None, description="Filter by access level"),
-    db: AsyncSession = Depends(get_db),
+    access_level: Optional[AccessLevel] = Query(None, description="Filter by access level"),
+    pool: asyncpg.Pool = Depends(get_read_pool),
     current_admin: Admin = Depends(get_current_admin)
 ):
-    """Get all model assignments with filtering options"""
-    
-    # Build query with filters
-    query = select(UserModelAssignment, User.email, User.organization_name, AIModel.name, AIModel.provider).join(
-        User, UserModelAssignment.user_id == User.id
-    ).join(
-        AIModel, UserModelAssignment.model_id == AIModel.id
+    """
+    Get all model assignments with filtering options.
+    Uses keyset pagination on (assigned_at, id); the cursor for the next page is
+    returned in the X-Next-After-Assigned-At / X-Next-After-Id response headers.
+    """
+    
+    # Keyset cursor only applies when both halves are supplied
+    if after_assigned_at is None or after_id is None:
+        after_assigned_at = after_id = None
+    
+    rows = await pool.fetch(
+        _ASSIGNMENT_LIST_SQL,
+        user_id or None,
+        model_id or None,
+        is_active,
+        access_level or None,
+        after_assigned_at,
+        after_id,
+        limit
     )
-    
-    if user_id:
-        query = query.where(UserModelAssignment.user_id == user_id)
-    if model_id:
-        query = query.where(UserModelAssignment.model_id == model_id)
-    if is_active is not None:
-        query = query.where(UserModelAssignment.is_active == is_active)
-    if access_level:
-        query = query.where(UserModelAssignment.access_level == access_level)
-    
-    query = query.order_by(UserModelAssignment.assigned_at.desc()).offset(skip).limit(limit)
-    
-    result = await db.execute(query)
-    assignments_data = result.all()
-    
-    assignments = []
-    for assignment, user_email, user_org, model_name, model_provider in assignments_data:
-        assignment_dict = {
-            "id": assignment.id,
-            "user_id": assignment.user_id,
-            "model_id": assignment.model_id,
-            "is_active": assignment.is_active,
-            "access_level": assignment.access_level,
-            "daily_request_limit": assignment.daily_request_limit,
-            "monthly_request_limit": assignment.monthly_request_limit,
-            "daily_token_limit": assignment.daily_token_limit,
-            "monthly_token_limit": assignment.monthly_token_limit,
-            "daily_cost_limit": float(assignment.daily_cost_limit) if assignment.daily_cost_limit else None,
-            "monthly_cost_limit": float(assignment.monthly_cost_limit) if assignment.monthly_cost_limit else None,
-            "requests_per_minute": assignment.requests_per_minute,
-            "requests_per_hour": assignment.requests_per_hour,
-            "custom_pricing_enabled": assignment.custom_pricing_enabled,
-            "custom_cost_per_token": float(assignment.custom_cost_per_token) if assignment.custom_cost_per_token else None,
-            "custom_cost_per_request": float(assignment.custom_cost_per_request) if assignment.custom_cost_per_request else None,
-            "discount_percentage": float(assignment.discount_percentage),
-            "total_requests_made": assignment.total_requests_made,
-            "total_tokens_used": assignment.total_tokens_used,
-            "total_cost_incurred": float(assignment.total_cost_incurred),
-            "last_used_at": assignment.last_used_at,
-            "assigned_at": assignment.assigned_at,
-            "expires_at": assignment.expires_at,
-            "assignment_reason": assignment.assignment_reason,
-            "notes": assignment.notes,
-            "user_email": user_email,
-            "user_organization": user_org,
-            "model_name": model_name,
-            "model_provider": model_provider
+    assignments_data = [dict(row) for row in rows]
+    
+    # Expose the cursor for the next page when this page is full
+    headers = None
+    if assignments_data and len(assignments_data) == limit:
+        last_assignment = assignments_data[-1]
+        headers = {
+            "X-Next-After-Assigned-At": last_assignment["assigned_at"].isoformat(),
+            "X-Next-After-Id": str(last_assignment["id"])
         }
-        assignments.append(ModelAssignmentResponse(**assignment_dict))
     
-    return assignments
+    return _json_response(_ASSIGNMENT_LIST_ADAPTER, assignments_data, headers)
 
 @router.post("/model-assignments", response_model=ModelAssignmentResponse)
 async def create_assignment(
@@ -186,32 +287,25 @@ async def create_assignment(
 ):
     """Create a new user-model assignment"""
     
-    # Validate user exists
-    user_stmt = select(User).where(User.id == assignment_data.user_id)
-    user_result = await db.execute(user_stmt)
-    user = user_result.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User with ID {assignment_data.user_id} not found")
-    
-    # Validate model exists
-    model_stmt = select(AIModel).where(AIModel.id == assignment_data.model_id)
-    model_result = await db.execute(model_stmt)
-    model = model_result.scalar_one_or_none()
-    if not model:
-        raise HTTPException(status_code=404, detail=f"Model with ID {assignment_data.model_id} not found")
-    
-    # Check if assignment already exists
-    existing_stmt = select(UserModelAssignment).where(
-        and_(
-            UserModelAssignment.user_id == assignment_data.user_id,
-            UserModelAssignment.model_id == assignment_data.model_id,
-            UserModelAssignment.is_active == True
-        )
+    # Validate user, model and duplicate assignment in a single round trip
+    checks_stmt = select(
+        exists().where(User.id == assignment_data.user_id).label("user_exists"),
+        exists().where(AIModel.id == assignment_data.model_id).label("model_exists"),
+        exists().where(
+            and_(
+                UserModelAssignment.user_id == assignment_data.user_id,
+                UserModelAssignment.model_id == assignment_data.model_id,
+                UserModelAssignment.is_active == True
+            )
+        ).label("assignment_exists")
     )
-    existing_result = await db.execute(existing_stmt)
-    existing_assignment = existing_result.scalar_one_or_none()
+    checks = (await db.execute(checks_stmt)).one()
     
-    if existing_assignment:
+    if not checks.user_exists:
+        raise HTTPException(status_code=404, detail=f"User with ID {assignment_data.user_id} not found")
+    if not checks.model_exists:
+        raise HTTPException(status_code=404, detail=f"Model with ID {assignment_data.model_id} not found")
+    if checks.assignment_exists:
         raise HTTPException(
             status_code=400, 
             detail=f"Active assignment already exists between user {assignment_data.user_id} and model {assignment_data.model_id}"
@@ -240,56 +334,26 @@ async def create_assignment(
     
     # Set expiration if provided
     if assignment_data.expires_in_days:
-        assignment.expires_at = datetime.utcnow() + timedelta(days=assignment_data.expires_in_days)
+        assignment.expires_at = _expires_after(assignment_data.expires_in_days)
     
     # Set IP whitelist if provided
     if assignment_data.ip_whitelist:
         assignment.set_ip_whitelist(assignment_data.ip_whitelist)
     
     # Set model config if provided
-    if assignment_data.model_config:
-        assignment.set_model_config(assignment_data.model_config)
+    if assignment_data.model_settings:
+        assignment.set_model_config(assignment_data.model_settings)
     
     db.add(assignment)
     await db.commit()
-    await db.refresh(assignment)
-    
-    # Get the complete assignment data for response
-    response_data = {
-        "id": assignment.id,
-        "user_id": assignment.user_id,
-        "model_id": assignment.model_id,
-        "is_active": assignment.is_active,
-        "access_level": assignment.access_level,
-        "daily_request_limit": assignment.daily_request_limit,
-        "monthly_request_limit": assignment.monthly_request_limit,
-        "daily_token_limit": assignment.daily_token_limit,
-        "monthly_token_limit": assignment.monthly_token_limit,
-        "daily_cost_limit": float(assignment.daily_cost_limit) if assignment.daily_cost_limit else None,
-        "monthly_cost_limit": float(assignment.monthly_cost_limit) if assignment.monthly_cost_limit else None,
-        "requests_per_minute": assignment.requests_per_minute,
-        "requests_per_hour": assignment.requests_per_hour,
-        "custom_pricing_enabled": assignment.custom_pricing_enabled,
-        "custom_cost_per_token": float(assignment.custom_cost_per_token) if assignment.custom_cost_per_token else None,
-        "custom_cost_per_request": float(assignment.custom_cost_per_request) if assignment.custom_cost_per_request else None,
-        "discount_percentage": float(assignment.discount_percentage),
-        "total_requests_made": assignment.total_requests_made,
-        "total_tokens_used": assignment.total_tokens_used,
-        "total_cost_incurred": float(assignment.total_cost_incurred),
-        "last_used_at": assignment.last_used_at,
-        "assigned_at": assignment.assigned_at,
-        "expires_at": assignment.expires_at,
-        "assignment_reason": assignment.assignment_reason,
-        "notes": assignment.notes,
-        "user_email": user.email,
-        "user_organization": user.organization_name,
-        "model_name": model.name,
-        "model_provider": model.provider
-    }
+    await bump_cache_version("users")
     
-    logger.info(f"Admin {current_admin.username} created assignment {assignment.id} for user {user.email} and model {model.name}")
+    # Read back the stored row together with the user and model details
+    response_data = await _fetch_assignment(db, assignment.id)
     
-    return ModelAssignmentResponse(**response_data)
+    logger.info(f"Admin {current_admin.username} created assignment {assignment.id} for user {response_data['user_email']} and model {response_data['model_name']}")
+    
+    return _json_response(_ASSIGNMENT_ADAPTER, response_data)
 
 @router.get("/model-assignments/{assignment_id}", response_model=ModelAssignmentResponse)
 async def get_assignment(
@@ -299,53 +363,12 @@ async def get_assignment(
 ):
     """Get a specific assignment by ID"""
     
-    query = select(UserModelAssignment, User.email, User.organization_name, AIModel.name, AIModel.provider).join(
-        User, UserModelAssignment.user_id == User.id
-    ).join(
-        AIModel, UserModelAssignment.model_id == AIModel.id
-    ).where(UserModelAssignment.id == assignment_id)
-    
-    result = await db.execute(query)
-    assignment_data = result.first()
+    assignment_data = await _fetch_assignment(db, assignment_id)
     
     if not assignment_data:
         raise HTTPException(status_code=404, detail=f"Assignment with ID {assignment_id} not found")
     
-    assignment, user_email, user_org, model_name, model_provider = assignment_data
-    
-    response_data = {
-        "id": assignment.id,
-        "user_id": assignment.user_id,
-        "model_id": assignment.model_id,
-        "is_active": assignment.is_active,
-        "access_level": assignment.access_level,
-        "daily_request_limit": assignment.daily_request_limit,
-        "monthly_request_limit": assignment.monthly_request_limit,
-        "daily_token_limit": assignment.daily_token_limit,
-        "monthly_token_limit": assignment.monthly_token_limit,
-        "daily_cost_limit": float(assignment.daily_cost_limit) if assignment.daily_cost_limit else None,
-        "monthly_cost_limit": float(assignment.monthly_cost_limit) if assignment.monthly_cost_limit else None,
-        "requests_per_minute": assignment.requests_per_minute,
-        "requests_per_hour": assignment.requests_per_hour,
-        "custom_pricing_enabled": assignment.custom_pricing_enabled,
-        "custom_cost_per_token": float(assignment.custom_cost_per_token) if assignment.custom_cost_per_token else None,
-        "custom_cost_per_request": float(assignment.custom_cost_per_request) if assignment.custom_cost_per_request else None,
-        "discount_percentage": float(assignment.discount_percentage),
-        "total_requests_made": assignment.total_requests_made,
-        "total_tokens_used": assignment.total_tokens_used,
-        "total_cost_incurred": float(assignment.total_cost_incurred),
-        "last_used_at": assignment.last_used_at,
-        "assigned_at": assignment.assigned_at,
-        "expires_at": assignment.expires_at,
-        "assignment_reason": assignment.assignment_reason,
-        "notes": assignment.notes,
-        "user_email": user_email,
-        "user_organization": user_org,
-        "model_name": model_name,
-        "model_provider": model_provider
-    }
-    
-    return ModelAssignmentResponse(**response_data)
+    return _json_response(_ASSIGNMENT_ADAPTER, assignment_data)
 
 @router.put("/model-assignments/{assignment_id}", response_model=ModelAssignmentResponse)
 async def update_assignment(
@@ -367,17 +390,14 @@ async def update_assignment(
     update_data = assignment_update.model_dump(exclude_unset=True)
     
     for field, value in update_data.items():
-        if field == "ip_whitelist" and value is not None:
-            assignment.set_ip_whitelist(value)
-        elif field == "model_config" and value is not None:
-            assignment.set_model_config(value)
-        elif field == "expires_in_days" and value is not None:
-            assignment.expires_at = datetime.utcnow() + timedelta(days=value)
-        elif hasattr(assignment, field):
+        handler = _SPECIAL_UPDATE_HANDLERS.get(field)
+        if handler and value is not None:
+            handler(assignment, value)
+        elif field in _ASSIGNMENT_COLUMNS:
             setattr(assignment, field, value)
     
     await db.commit()
-    await db.refresh(assignment)
+    await bump_cache_version("users")
     
     # Return updated assignment (reuse get_assignment logic)
     return await get_assignment(assignment_id, db, current_admin)
@@ -406,6 +426,7 @@ async def delete_assignment(
         message = f"Assignment {assignment_id} deactivated"
     
     await db.commit()
+    await bump_cache_version("users")
     
     logger.info(f"Admin {current_admin.username} {'deleted' if permanent else 'deactivated'} assignment {assignment_id}")
     
@@ -419,64 +440,68 @@ async def create_bulk_assignments(
 ):
     """Create multiple assignments at once"""
     
+    template = bulk_data.assignment_template
+    user_ids = list(dict.fromkeys(bulk_data.user_ids))
+    model_ids = list(dict.fromkeys(bulk_data.model_ids))
+    
+    # Generate the user x model cross product server-side and skip pairs that
+    # already have an active assignment, so the whole batch is one INSERT
+    users = func.unnest(literal(user_ids, ARRAY(UserModelAssignment.user_id.type))).table_valued("id").render_derived(name="u")
+    models = func.unnest(literal(model_ids, ARRAY(UserModelAssignment.model_id.type))).table_valued("id").render_derived(name="m")
+    existing = aliased(UserModelAssignment)
+    
+    template_values = {
+        "assigned_by": current_admin.id,
+        "access_level": template.access_level,
+        "daily_request_limit": template.daily_request_limit,
+        "monthly_request_limit": template.monthly_request_limit,
+        "requests_per_minute": template.requests_per_minute,
+        "requests_per_hour": template.requests_per_hour,
+        "custom_pricing_enabled": template.custom_pricing_enabled,
+        "discount_percentage": template.discount_percentage,
+        "assignment_reason": template.assignment_reason,
+    }
+    columns = ["user_id", "model_id", *template_values, "expires_at"]
+    source = select(
+        users.c.id,
+        models.c.id,
+        *(
+            literal(value, UserModelAssignment.__table__.c[name].type)
+            for name, value in template_values.items()
+        ),
+        _expires_after(template.expires_in_days) if template.expires_in_days else null()
+    ).select_from(
+        users.join(models, true()).outerjoin(
+            existing,
+            and_(
+                existing.user_id == users.c.id,
+                existing.model_id == models.c.id,
+                existing.is_active == True
+            )
+        )
+    ).where(existing.id.is_(None))
+    
+    stmt = insert(UserModelAssignment).from_select(columns, source).returning(
+        UserModelAssignment.user_id, UserModelAssignment.model_id
+    )
+    result = await db.execute(stmt)
+    created_pairs = {(row.user_id, row.model_id) for row in result}
+    
     created_assignments = []
     failed_assignments = []
-    
-    for user_id in bulk_data.user_ids:
-        for model_id in bulk_data.model_ids:
-            try:
-                # Create individual assignment
-                assignment_data = bulk_data.assignment_template.model_copy()
-                assignment_data.user_id = user_id
-                assignment_data.model_id = model_id
-                
-                # Check if assignment already exists
-                existing_stmt = select(UserModelAssignment).where(
-                    and_(
-                        UserModelAssignment.user_id == user_id,
-                        UserModelAssignment.model_id == model_id,
-                        UserModelAssignment.is_active == True
-                    )
-                )
-                existing_result = await db.execute(existing_stmt)
-                existing_assignment = existing_result.scalar_one_or_none()
-                
-                if existing_assignment:
-                    failed_assignments.append({
-                        "user_id": user_id,
-                        "model_id": model_id,
-                        "error": "Assignment already exists"
-                    })
-                    continue
-                
-                assignment = UserModelAssignment(
-                    user_id=user_id,
-                    model_id=model_id,
-                    assigned_by=current_admin.id,
-                    access_level=assignment_data.access_level,
-                    daily_request_limit=assignment_data.daily_request_limit,
-                    monthly_request_limit=assignment_data.monthly_request_limit,
-                    requests_per_minute=assignment_data.requests_per_minute,
-                    requests_per_hour=assignment_data.requests_per_hour,
-                    custom_pricing_enabled=assignment_data.custom_pricing_enabled,
-                    discount_percentage=assignment_data.discount_percentage,
-                    assignment_reason=assignment_data.assignment_reason
-                )
-                
-                if assignment_data.expires_in_days:
-                    assignment.expires_at = datetime.utcnow() + timedelta(days=assignment_data.expires_in_days)
-                
-                db.add(assignment)
+    for user_id in user_ids:
+        for model_id in model_ids:
+            if (user_id, model_id) in created_pairs:
                 created_assignments.append({"user_id": user_id, "model_id": model_id})
-                
-            except Exception as e:
+            else:
                 failed_assignments.append({
                     "user_id": user_id,
                     "model_id": model_id,
-                    "error": str(e)
+                    "error": "Assignment already exists"
                 })
     
     await db.commit()
+    await bump_cache_version("users")
     
     logger.info(f"Admin {current_admin.username} created {len(created_assignments)} bulk assignments")
     
@@ -489,51 +514,18 @@ async def create_bulk_assignments(
 
 @router.get("/model-assignments/stats/overview", response_model=AssignmentStatsResponse)
 async def get_assignment_stats(
-    db: AsyncSession = Depends(get_db),
+    pool: asyncpg.Pool = Depends(get_read_pool),
     current_admin: Admin = Depends(get_current_admin)
 ):
     """Get overview statistics for model assignments"""
     
-    # Total assignments
-    total_stmt = select(func.count()).select_from(UserModelAssignment)
-    total_result = await db.execute(total_stmt)
-    total_assignments = total_result.scalar() or 0
-    
-    # Active assignments
-    active_stmt = select(func.count()).select_from(UserModelAssignment).where(UserModelAssignment.is_active == True)
-    active_result = await db.execute(active_stmt)
-    active_assignments = active_result.scalar() or 0
-    
-    # Expired assignments
-    expired_stmt = select(func.count()).select_from(UserModelAssignment).where(
-        and_(
-            UserModelAssignment.expires_at.isnot(None),
-            UserModelAssignment.expires_at < datetime.utcnow()
-        )
-    )
-    expired_result = await db.execute(expired_stmt)
-    expired_assignments = expired_result.scalar() or 0
-    
-    # Users with assignments
-    users_stmt = select(func.count(func.distinct(UserModelAssignment.user_id))).select_from(UserModelAssignment)
-    users_result = await db.execute(users_stmt)
-    users_with_assignments = users_result.scalar() or 0
-    
-    # Models assigned
-    models_stmt = select(func.count(func.distinct(UserModelAssignment.model_id))).select_from(UserModelAssignment)
-    models_result = await db.execute(models_stmt)
-    models_assigned = models_result.scalar() or 0
-    
-    # Total usage cost
-    cost_stmt = select(func.sum(UserModelAssignment.total_cost_incurred)).select_from(UserModelAssignment)
-    cost_result = await db.execute(cost_stmt)
-    total_usage_cost = float(cost_result.scalar() or 0)
+    stats = await pool.fetchrow(_ASSIGNMENT_STATS_SQL)
     
     return AssignmentStatsResponse(
-        total_assignments=total_assignments,
-        active_assignments=active_assignments,
-        expired_assignments=expired_assignments,
-        users_with_assignments=users_with_assignments,
-        models_assigned=models_assigned,
-        total_usage_cost=total_usage_cost
+        total_assignments=stats["total_assignments"],
+        active_assignments=stats["active_assignments"],
+        expired_assignments=stats["expired_assignments"],
+        users_with_assignments=stats["users_with_assignments"],
+        models_assigned=stats["models_assigned"],
+        total_usage_cost=float(stats["total_usage_cost"])
     )
\ No newline at end of file
@@ -1,23 +1,21 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models.subscription_tier import SubscriptionTier
-from app.api.deps import get_db
+import asyncpg
+from app.database import get_read_pool
 
 router = APIRouter()
 
 @router.get("/subscription-tiers")
-async def get_subscription_tiers(db: AsyncSession = Depends(get_db)):
-    stmt = select(SubscriptionTier).where(SubscriptionTier.is_active == True)
-    result = await db.execute(stmt)
-    tiers = result.scalars().all()
+async def get_subscription_tiers(pool: asyncpg.Pool = Depends(get_read_pool)):
+    tiers = await pool.fetch(
+        "SELECT id, name, monthly_cost, plan_details FROM subscription_tiers WHERE is_active = true"
+    )
 
     return [
         {
-            "id": tier.id,
-            "name": tier.name,
-            "monthly_cost": float(tier.monthly_cost),
-            "plan_details": tier.plan_details
+            "id": tier["id"],
+            "name": tier["name"],
+            "monthly_cost": float(tier["monthly_cost"]),
+            "plan_details": tier["plan_details"]
         }
         for tier in tiers
-    ]
+    ]
\ No newline at end of file
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, case, Date, and_, or_, desc
+from sqlalchemy import select, func, bindparam, lambda_stmt, Date, DateTime, Float, Integer, JSON, and_, or_, desc, literal_column, text, true, tuple_, union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
 from datetime import date, datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal, Tuple
+import asyncio
+import base64
+import functools
+import hashlib
+from collections import defaultdict
 
 from app.models.api_usage_log import APIUsageLog
 from app.models.user import User
@@ -10,19 +17,99 @@ from app.models.ai_model import AIModel
 from app.models.user_model_assignment import UserModelAssignment
 from app.models.organization_model import OrganizationModel
 from app.models.user_api_key import UserAPIKey
+from app.models.usage_daily_rollup import usage_daily_rollup
 from app.api.deps import get_db, get_current_admin
+from app.database import async_session
+from app.utils.cache import cached, CONDITIONAL_CACHE_CONTROL
+from app.utils.responses import DecimalORJSONResponse
+from app.utils.billing_health import HEALTH_WINDOW_HOURS, get_billing_health_counters
 from app.models.admin import Admin
 
 router = APIRouter()
 
-@router.get("/usage-summary")
+async def _fetch_all(stmt, params=None):
+    """Run a read-only statement on its own session so it can overlap with others"""
+    async with async_session() as session:
+        result = await session.execute(stmt, params)
+        return result.all()
+
+async def _stream_all(stmt, params=None):
+    """Like _fetch_all, but reads the rows through a server-side cursor"""
+    async with async_session() as session:
+        result = await session.stream(stmt, params)
+        return [row async for row in result]
+
+# The fixed-shape statements below are lambda statements: SQLAlchemy builds and
+# caches them once per process and each call only supplies bound parameters.
+# Bound parameters shared by the usage window queries:
+_window_start = bindparam("start_dt", type_=DateTime)
+_window_end = bindparam("end_dt", type_=DateTime)
+_user_cost = func.coalesce(func.sum(APIUsageLog.total_cost), 0).cast(Float)
+
+# precision=fast reads a fixed block sample of api_usage_logs for the summary
+# sections and scales counts and sums back up by the sampling factor
+USAGE_SAMPLE_PERCENT = 1
+
+@functools.cache
+def _usage_sample():
+    """
+    The sampled alias of APIUsageLog, built on first use: aliasing configures
+    the mappers, which must not happen while the models are still importing
+    """
+    return aliased(
+        APIUsageLog,
+        APIUsageLog.__table__.tablesample(func.system(USAGE_SAMPLE_PERCENT), name="usage_sample", seed=42)
+    )
+
+def _scaled(measure, scale: int):
+    """Scale a sampled count or sum back up to an estimate for the full table"""
+    return measure if scale == 1 else measure * scale
+
+def _json_object(**fields):
+    """json_build_object() with the keys rendered inline rather than bound"""
+    return func.json_build_object(
+        *(part for key, value in fields.items() for part in (literal_column(f"'{key}'"), value))
+    )
+
+def _json_array(element, order_by, where):
+    """json_agg() of the rows matching `where`, or an empty array when none do"""
+    return func.coalesce(
+        func.json_agg(aggregate_order_by(element, order_by)).filter(where),
+        literal_column("'[]'::json"),
+        type_=JSON
+    )
+
+def _usage_etag(request: Request, last_updated: Optional[datetime], row_count: int) -> str:
+    """Strong ETag for a usage response, from the window's state and the query params"""
+    params = sorted(request.query_params.multi_items())
+    digest = hashlib.blake2b(f"{last_updated}:{row_count}:{params}".encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def _encode_org_stats_cursor(total_cost: float, user_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{total_cost!r}:{user_id}".encode()).decode()
+
+def _decode_org_stats_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        total_cost, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(total_cost), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/usage-summary", response_class=DecimalORJSONResponse)
+@cached("usage", "summary", ttl=15)
 async def get_usage_summary(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
     organization_name: Optional[str] = Query(None, description="Filter by organization"),
     model_id: Optional[int] = Query(None, description="Filter by specific model"),
-    include_unprocessed: bool = Query(False, description="Include unprocessed billing entries")
+    include_unprocessed: bool = Query(False, description="Include unprocessed billing entries"),
+    limit: int = Query(50, ge=1, le=500, description="Max organization_stats entries to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page of organization_stats"),
+    precision: Literal["exact", "fast"] = Query(
+        "exact", description="'fast' estimates the summary sections from a sample of the usage log"
+    )
 ):
     today = date.today()
     if not start_date:
@@ -33,203 +120,311 @@ async def get_usage_summary(
     start_dt = datetime.combine(start_date, datetime.min.time())
     end_dt = datetime.combine(end_date, datetime.max.time())
 
-    # Build base query with filters
-    base_filter = and_(
-        APIUsageLog.created_at >= start_dt,
-        APIUsageLog.created_at <= end_dt
-    )
-    
+    after_cost, after_user_id = _decode_org_stats_cursor(cursor) if cursor else (None, None)
+
+    # Conditional GET: the summary only changes when usage rows in the window
+    # are added or updated, so a cheap probe decides whether the client's copy
+    # is still current before any aggregation runs
+    window_params = {"start_dt": start_dt, "end_dt": end_dt}
+    probe_stmt = lambda_stmt(lambda: select(
+        func.max(APIUsageLog.updated_at),
+        func.count()
+    ).where(
+        APIUsageLog.created_at >= _window_start,
+        APIUsageLog.created_at <= _window_end
+    ))
+    last_updated, row_count = (await db.execute(probe_stmt, window_params)).one()
+    etag = _usage_etag(request, last_updated, row_count)
+    conditional_headers = {"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=conditional_headers)
+
+    # In fast mode the summary sections are estimated from a sample; distinct
+    # counts, averages and rates come straight from the sampled rows
+    if precision == "fast":
+        usage, sample_scale = _usage_sample(), 100 // USAGE_SAMPLE_PERCENT
+    else:
+        usage, sample_scale = APIUsageLog, 1
+
+    # Rows in the date window are scanned once; the organization/model filters
+    # only scope the global and model sections, as the company analytics
+    # always cover the whole window
+    in_scope = true()
     if organization_name:
-        base_filter = and_(base_filter, User.organization_name.ilike(f"%{organization_name}%"))
-    
+        in_scope = and_(in_scope, User.organization_name.ilike(f"%{organization_name}%"))
     if model_id:
-        base_filter = and_(base_filter, APIUsageLog.model_id == model_id)
-
-    # Global Summary
-    global_stmt = select(
-        func.count().label("total_requests"),
-        func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-        func.sum(APIUsageLog.total_cost).label("total_cost"),
-        func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
-        (
-            func.sum(
-                case((APIUsageLog.status == 'success', 1), else_=0)
-            ) / func.count()
-        ).label("success_rate"),
-        func.sum(case((APIUsageLog.billing_processed == True, 1), else_=0)).label("processed_entries"),
-        func.sum(case((APIUsageLog.billing_processed == False, 1), else_=0)).label("unprocessed_entries")
-    ).where(base_filter)
-    
+        in_scope = and_(in_scope, usage.model_id == model_id)
+
+    filtered_stmt = (
+        select(
+            usage.model_id,
+            usage.company_name,
+            usage.raw_model_name,
+            usage.user_id,
+            usage.status,
+            usage.billing_processed,
+            usage.total_tokens,
+            usage.total_cost,
+            usage.response_time_ms,
+            AIModel.name.label("model_name"),
+            AIModel.provider.label("model_provider"),
+            AIModel.status.label("model_status"),
+            in_scope.label("in_scope")
+        )
+        .outerjoin(AIModel, AIModel.id == usage.model_id)
+        .where(
+            usage.created_at >= start_dt,
+            usage.created_at <= end_dt
+        )
+    )
+    # users is only needed for the organization filter; without it the
+    # window is aggregated straight off the usage log indexes
     if organization_name:
-        global_stmt = global_stmt.join(User, User.id == APIUsageLog.user_id)
-    
-    global_result = await db.execute(global_stmt)
-    global_data = global_result.fetchone()
+        filtered_stmt = filtered_stmt.outerjoin(User, User.id == usage.user_id)
+    filtered = filtered_stmt.cte("filtered")
+    f = filtered.c
+    scoped = f.in_scope
+    model_cols = (f.model_id, f.model_name, f.model_provider, f.model_status)
+
+    # GROUPING() sets a bit for every column not grouped in that row's set:
+    # model_id = 2, company_name = 1
+    grouping_id = func.grouping(f.model_id, f.company_name)
 
-    # Organization-wise Summary with enhanced metrics
-    user_stmt = (
+    rollup = (
+        select(
+            grouping_id.label("grouping_id"),
+            *model_cols,
+            f.company_name,
+            # Measures over rows matching the organization/model filters
+            _scaled(func.count().filter(scoped), sample_scale).label("total_requests"),
+            _scaled(func.sum(f.total_tokens).filter(scoped), sample_scale).label("total_tokens"),
+            _scaled(func.coalesce(func.sum(f.total_cost).filter(scoped), 0).cast(Float), sample_scale).label("total_cost"),
+            func.avg(f.response_time_ms).filter(scoped).label("avg_response_time"),
+            (
+                func.count().filter(and_(scoped, f.status == 'success')) * 1.0 / func.nullif(func.count().filter(scoped), 0)
+            ).label("success_rate"),
+            _scaled(func.count().filter(and_(scoped, f.billing_processed == True)), sample_scale).label("processed_requests"),
+            _scaled(func.count().filter(and_(scoped, f.billing_processed == False)), sample_scale).label("unprocessed_requests"),
+            func.count(func.distinct(f.user_id)).filter(scoped).label("unique_users"),
+            # Measures over the whole date window
+            _scaled(func.count(), sample_scale).label("window_requests"),
+            _scaled(func.coalesce(func.sum(f.total_cost), 0).cast(Float), sample_scale).label("window_cost"),
+            func.count(func.distinct(f.raw_model_name)).label("window_unique_models"),
+            _scaled(func.count().filter(f.billing_processed == True), sample_scale).label("window_processed_requests"),
+            _scaled(func.count().filter(f.billing_processed == False), sample_scale).label("window_unprocessed_requests")
+        )
+        .group_by(
+            func.grouping_sets(
+                text("()"),
+                tuple_(*model_cols),
+                tuple_(f.company_name)
+            )
+        )
+    ).subquery("rollup")
+
+    # Postgres shapes the model and company sections into JSON arrays itself,
+    # so they are spliced into the response without a Python pass. The global
+    # section is the single row of the empty grouping set.
+    is_global = rollup.c.grouping_id == 0b11
+    summary_stmt = select(
+        *(
+            func.max(column).filter(is_global).label(column.name)
+            for column in (
+                rollup.c.total_requests,
+                rollup.c.total_tokens,
+                rollup.c.total_cost,
+                rollup.c.avg_response_time,
+                rollup.c.success_rate,
+                rollup.c.processed_requests,
+                rollup.c.unprocessed_requests
+            )
+        ),
+        _json_array(
+            _json_object(
+                model_name=rollup.c.model_name,
+                model_provider=rollup.c.model_provider,
+                model_status=rollup.c.model_status,
+                total_requests=rollup.c.total_requests,
+                total_tokens=func.coalesce(rollup.c.total_tokens, 0),
+                total_cost=rollup.c.total_cost,
+                avg_response_time=func.round(func.coalesce(rollup.c.avg_response_time, 0), 2),
+                unique_users=rollup.c.unique_users,
+                success_rate=func.round(func.coalesce(rollup.c.success_rate, 0), 4)
+            ),
+            order_by=rollup.c.total_cost.desc(),
+            where=and_(
+                rollup.c.grouping_id == 0b01,
+                rollup.c.model_id.isnot(None),
+                rollup.c.total_requests > 0
+            )
+        ).label("global_model_wise_summary"),
+        _json_array(
+            _json_object(
+                company_name=rollup.c.company_name,
+                total_requests=rollup.c.window_requests,
+                total_cost=rollup.c.window_cost,
+                unique_models=rollup.c.window_unique_models,
+                processed_requests=rollup.c.window_processed_requests,
+                unprocessed_requests=rollup.c.window_unprocessed_requests,
+                processing_rate=func.round(
+                    rollup.c.window_processed_requests * 100.0 / func.greatest(rollup.c.window_requests, 1), 2
+                )
+            ),
+            order_by=rollup.c.window_cost.desc(),
+            where=and_(
+                rollup.c.grouping_id == 0b10,
+                rollup.c.company_name.isnot(None)
+            )
+        ).label("company_analytics")
+    )
+
+    # One page of per-user stats, keyset-paginated on (total_cost, user_id)
+    user_page_stmt = lambda_stmt(lambda: (
         select(
             User.organization_name.label("organization_name"),
             User.id.label("user_id"),
             User.email.label("user_email"),
             func.count().label("total_requests"),
             func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-            func.sum(APIUsageLog.total_cost).label("total_cost"),
+            _user_cost.label("total_cost"),
             func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
             (
-                func.sum(
-                    case((APIUsageLog.status == 'success', 1), else_=0)
-                ) / func.count()
+                func.count().filter(APIUsageLog.status == 'success') * 1.0 / func.count()
             ).label("success_rate"),
-            func.sum(case((APIUsageLog.billing_processed == True, 1), else_=0)).label("processed_requests"),
-            func.sum(case((APIUsageLog.billing_processed == False, 1), else_=0)).label("unprocessed_requests"),
+            func.count().filter(APIUsageLog.billing_processed == True).label("processed_requests"),
+            func.count().filter(APIUsageLog.billing_processed == False).label("unprocessed_requests"),
             func.count(func.distinct(APIUsageLog.model_id)).label("unique_models_used")
         )
         .join(User, User.id == APIUsageLog.user_id)
-        .where(base_filter)
+        .where(
+            APIUsageLog.created_at >= _window_start,
+            APIUsageLog.created_at <= _window_end
+        )
         .group_by(User.id, User.organization_name, User.email)
-        .order_by(desc(func.sum(APIUsageLog.total_cost)))
-    )
-    user_result = await db.execute(user_stmt)
-    user_rows = user_result.fetchall()
+        .order_by(_user_cost.desc(), User.id.desc())
+        .limit(bindparam("page_size", type_=Integer))
+    ))
+    user_page_params = {**window_params, "page_size": limit + 1}
+    if organization_name:
+        user_page_stmt += lambda s: s.where(User.organization_name.ilike(bindparam("organization_pattern")))
+        user_page_params["organization_pattern"] = f"%{organization_name}%"
+    if model_id:
+        user_page_stmt += lambda s: s.where(APIUsageLog.model_id == bindparam("model_id"))
+        user_page_params["model_id"] = model_id
+    if after_user_id is not None:
+        user_page_stmt += lambda s: s.having(
+            tuple_(_user_cost, User.id) < tuple_(
+                bindparam("after_cost", type_=Float), bindparam("after_user_id", type_=Integer)
+            )
+        )
+        user_page_params.update(after_cost=after_cost, after_user_id=after_user_id)
+
+    # Most recent unprocessed entries in the window, if requested
+    unprocessed_stmt = lambda_stmt(lambda: (
+        select(
+            APIUsageLog.id,
+            APIUsageLog.raw_model_name,
+            APIUsageLog.company_name,
+            APIUsageLog.status,
+            APIUsageLog.error_message,
+            APIUsageLog.retry_count,
+            APIUsageLog.created_at,
+            APIUsageLog.user_id,
+            APIUsageLog.model_id
+        )
+        .where(
+            and_(
+                APIUsageLog.billing_processed == False,
+                APIUsageLog.created_at >= _window_start,
+                APIUsageLog.created_at <= _window_end
+            )
+        )
+        .order_by(APIUsageLog.created_at.desc())
+        .limit(50)  # Limit to recent 50 unprocessed entries
+    ))
+
+    # These queries are independent, so they run concurrently; the extra ones
+    # each get their own session since a session cannot run statements in
+    # parallel
+    queries = [db.execute(summary_stmt), _fetch_all(user_page_stmt, user_page_params)]
+    if include_unprocessed:
+        queries.append(_stream_all(unprocessed_stmt, window_params))
+    summary_result, user_rows, *unprocessed_rows = await asyncio.gather(*queries)
+    global_data = summary_result.one()
 
-    organization_stats = []
-    for user_row in user_rows:
-        # Get model-wise breakdown for this user
-        model_wise_stmt = (
+    next_cursor = None
+    if len(user_rows) > limit:
+        user_rows = user_rows[:limit]
+        next_cursor = _encode_org_stats_cursor(user_rows[-1].total_cost, user_rows[-1].user_id)
+
+    # Model breakdowns and assignment counts are only loaded for this page's users
+    model_wise_by_user: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    assignment_counts: Dict[int, int] = {}
+    user_ids = [user_row.user_id for user_row in user_rows]
+    if user_ids:
+        page_params = {**window_params, "user_ids": user_ids}
+        model_wise_stmt = lambda_stmt(lambda: (
             select(
+                APIUsageLog.user_id.label("user_id"),
                 AIModel.name.label("model_name"),
                 AIModel.provider.label("model_provider"),
                 func.count().label("total_requests"),
                 func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-                func.sum(APIUsageLog.total_cost).label("total_cost"),
+                func.coalesce(func.sum(APIUsageLog.total_cost), 0).cast(Float).label("total_cost"),
                 func.avg(APIUsageLog.response_time_ms).label("avg_response_time")
             )
             .join(AIModel, AIModel.id == APIUsageLog.model_id)
             .where(
-                APIUsageLog.user_id == user_row.user_id,
-                APIUsageLog.created_at >= start_dt,
-                APIUsageLog.created_at <= end_dt
+                APIUsageLog.user_id.in_(bindparam("user_ids", expanding=True)),
+                APIUsageLog.created_at >= _window_start,
+                APIUsageLog.created_at <= _window_end
             )
-            .group_by(AIModel.id, AIModel.name, AIModel.provider)
+            .group_by(APIUsageLog.user_id, AIModel.id, AIModel.name, AIModel.provider)
             .order_by(desc(func.sum(APIUsageLog.total_cost)))
+        ))
+        assignments_stmt = lambda_stmt(lambda: (
+            select(
+                UserModelAssignment.user_id,
+                func.count().label("assignment_count")
+            )
+            .where(
+                UserModelAssignment.user_id.in_(bindparam("user_ids", expanding=True)),
+                UserModelAssignment.is_active == True
+            )
+            .group_by(UserModelAssignment.user_id)
+        ))
+        model_rows, assignment_rows = await asyncio.gather(
+            _fetch_all(model_wise_stmt, page_params),
+            _fetch_all(assignments_stmt, {"user_ids": user_ids})
         )
-        model_result = await db.execute(model_wise_stmt)
-        model_rows = model_result.fetchall()
-        
-        # Get user's model assignments
-        assignments_stmt = select(
-            UserModelAssignment,
-            AIModel.name.label("model_name")
-        ).join(
-            AIModel, UserModelAssignment.model_id == AIModel.id
-        ).where(
-            UserModelAssignment.user_id == user_row.user_id,
-            UserModelAssignment.is_active == True
-        )
-        assignments_result = await db.execute(assignments_stmt)
-        assignments_data = assignments_result.all()
-        
-        organization_stats.append({
+        for row in model_rows:
+            model_wise_by_user[row.user_id].append({
+                "model_name": row.model_name,
+                "model_provider": row.model_provider,
+                "total_requests": row.total_requests,
+                "total_tokens": row.total_tokens or 0,
+                "total_cost": row.total_cost,
+                "avg_response_time": round(row.avg_response_time or 0, 2)
+            })
+        assignment_counts = {row.user_id: row.assignment_count for row in assignment_rows}
+
+    organization_stats = [
+        {
             "organization_name": user_row.organization_name,
             "user_id": user_row.user_id,
             "user_email": user_row.user_email,
-            "total_requests": user_row.total_requests or 0,
+            "total_requests": user_row.total_requests,
             "total_tokens": user_row.total_tokens or 0,
-            "total_cost": float(user_row.total_cost or 0),
+            "total_cost": user_row.total_cost,
             "avg_response_time": round(user_row.avg_response_time or 0, 2),
-            "success_rate": round(float(user_row.success_rate or 0), 4),
-            "processed_requests": user_row.processed_requests or 0,
-            "unprocessed_requests": user_row.unprocessed_requests or 0,
-            "unique_models_used": user_row.unique_models_used or 0,
-            "total_model_assignments": len(assignments_data),
-            "model_wise_summary": [
-                {
-                    "model_name": row.model_name,
-                    "model_provider": row.model_provider,
-                    "total_requests": row.total_requests or 0,
-                    "total_tokens": row.total_tokens or 0,
-                    "total_cost": float(row.total_cost or 0),
-                    "avg_response_time": round(row.avg_response_time or 0, 2)
-                }
-                for row in model_rows
-            ]
-        })
-
-    # Global Model-wise Summary with enhanced metrics
-    global_model_stmt = (
-        select(
-            AIModel.name.label("model_name"),
-            AIModel.provider.label("model_provider"),
-            AIModel.status.label("model_status"),
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-            func.sum(APIUsageLog.total_cost).label("total_cost"),
-            func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
-            func.count(func.distinct(APIUsageLog.user_id)).label("unique_users"),
-            (
-                func.sum(
-                    case((APIUsageLog.status == 'success', 1), else_=0)
-                ) / func.count()
-            ).label("success_rate")
-        )
-        .join(AIModel, AIModel.id == APIUsageLog.model_id)
-        .where(base_filter)
-        .group_by(AIModel.id, AIModel.name, AIModel.provider, AIModel.status)
-        .order_by(desc(func.sum(APIUsageLog.total_cost)))
-    )
-    global_model_result = await db.execute(global_model_stmt)
-    global_model_rows = global_model_result.fetchall()
-
-    global_model_wise_summary = [
-        {
-            "model_name": row.model_name,
-            "model_provider": row.model_provider,
-            "model_status": row.model_status,
-            "total_requests": row.total_requests or 0,
-            "total_tokens": row.total_tokens or 0,
-            "total_cost": float(row.total_cost or 0),
-            "avg_response_time": round(row.avg_response_time or 0, 2),
-            "unique_users": row.unique_users or 0,
-            "success_rate": round(float(row.success_rate or 0), 4)
-        }
-        for row in global_model_rows
-    ]
-
-    # Company-based analytics (from raw model names)
-    company_stmt = (
-        select(
-            APIUsageLog.company_name.label("company_name"),
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_cost).label("total_cost"),
-            func.count(func.distinct(APIUsageLog.raw_model_name)).label("unique_models"),
-            func.sum(case((APIUsageLog.billing_processed == True, 1), else_=0)).label("processed_requests"),
-            func.sum(case((APIUsageLog.billing_processed == False, 1), else_=0)).label("unprocessed_requests")
-        )
-        .where(
-            and_(
-                APIUsageLog.created_at >= start_dt,
-                APIUsageLog.created_at <= end_dt,
-                APIUsageLog.company_name.isnot(None)
-            )
-        )
-        .group_by(APIUsageLog.company_name)
-        .order_by(desc(func.sum(APIUsageLog.total_cost)))
-    )
-    company_result = await db.execute(company_stmt)
-    company_rows = company_result.fetchall()
-
-    company_analytics = [
-        {
-            "company_name": row.company_name,
-            "total_requests": row.total_requests or 0,
-            "total_cost": float(row.total_cost or 0),
-            "unique_models": row.unique_models or 0,
-            "processed_requests": row.processed_requests or 0,
-            "unprocessed_requests": row.unprocessed_requests or 0,
-            "processing_rate": round((row.processed_requests or 0) / (row.total_requests or 1) * 100, 2)
+            "success_rate": round(user_row.success_rate or 0, 4),
+            "processed_requests": user_row.processed_requests,
+            "unprocessed_requests": user_row.unprocessed_requests,
+            "unique_models_used": user_row.unique_models_used,
+            "total_model_assignments": assignment_counts.get(user_row.user_id, 0),
+            "model_wise_summary": model_wise_by_user.get(user_row.user_id, [])
         }
-        for row in company_rows
+        for user_row in user_rows
     ]
 
     response_data = {
@@ -240,35 +435,24 @@ async def get_usage_summary(
         "global_summary": {
             "total_requests": global_data.total_requests or 0,
             "total_tokens": global_data.total_tokens or 0,
-            "total_cost": float(global_data.total_cost or 0),
+            "total_cost": global_data.total_cost,
             "avg_response_time": round(global_data.avg_response_time or 0, 2),
-            "success_rate": round(float(global_data.success_rate or 0), 4),
-            "processed_entries": global_data.processed_entries or 0,
-            "unprocessed_entries": global_data.unprocessed_entries or 0,
-            "processing_rate": round((global_data.processed_entries or 0) / (global_data.total_requests or 1) * 100, 2)
+            "success_rate": round(global_data.success_rate or 0, 4),
+            "processed_entries": global_data.processed_requests or 0,
+            "unprocessed_entries": global_data.unprocessed_requests or 0,
+            "processing_rate": round((global_data.processed_requests or 0) / (global_data.total_requests or 1) * 100, 2)
         },
         "organization_stats": organization_stats,
-        "global_model_wise_summary": global_model_wise_summary,
-        "company_analytics": company_analytics
+        "next_cursor": next_cursor,
+        "global_model_wise_summary": global_data.global_model_wise_summary,
+        "company_analytics": global_data.company_analytics
     }
+    if precision == "fast":
+        # Global, model and company sections are sampled; organization_stats stays exact
+        response_data["precision"] = "estimated"
 
     # Include unprocessed entries details if requested
-    if include_unprocessed and global_data.unprocessed_entries > 0:
-        unprocessed_stmt = (
-            select(APIUsageLog)
-            .where(
-                and_(
-                    APIUsageLog.billing_processed == False,
-                    APIUsageLog.created_at >= start_dt,
-                    APIUsageLog.created_at <= end_dt
-                )
-            )
-            .order_by(APIUsageLog.created_at.desc())
-            .limit(50)  # Limit to recent 50 unprocessed entries
-        )
-        unprocessed_result = await db.execute(unprocessed_stmt)
-        unprocessed_entries = unprocessed_result.scalars().all()
-
+    if include_unprocessed and global_data.unprocessed_requests > 0:
         response_data["unprocessed_entries_sample"] = [
             {
                 "id": entry.id,
@@ -281,12 +465,13 @@ async def get_usage_summary(
                 "user_mapped": entry.user_id is not None,
                 "model_mapped": entry.model_id is not None
             }
-            for entry in unprocessed_entries
+            for entry in unprocessed_rows[0]
         ]
 
-    return response_data
+    return DecimalORJSONResponse(response_data, headers=conditional_headers)
 
 @router.get("/usage-summary/trends")
+@cached("usage", "trends", ttl=60)
 async def get_usage_trends(
     db: AsyncSession = Depends(get_db),
     days: int = Query(30, description="Number of days to analyze"),
@@ -297,30 +482,53 @@ async def get_usage_trends(
     
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=days)
+    today_start = datetime.combine(end_date, datetime.min.time())
     
-    # Daily usage trends
-    daily_stmt = (
-        select(
-            func.date(APIUsageLog.created_at).label("usage_date"),
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_cost).label("total_cost"),
-            func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-            func.avg(APIUsageLog.response_time_ms).label("avg_response_time")
-        )
-        .where(
-            and_(
-                APIUsageLog.created_at >= datetime.combine(start_date, datetime.min.time()),
-                APIUsageLog.created_at <= datetime.combine(end_date, datetime.max.time())
-            )
-        )
-        .group_by(func.date(APIUsageLog.created_at))
-        .order_by(func.date(APIUsageLog.created_at))
+    # Completed days come from the daily rollup; today is still being written
+    # to, so it is aggregated from the raw log
+    rollup_stmt = select(
+        usage_daily_rollup.c.day.label("usage_date"),
+        usage_daily_rollup.c.requests,
+        usage_daily_rollup.c.tokens,
+        usage_daily_rollup.c.cost,
+        usage_daily_rollup.c.sum_response_time,
+        usage_daily_rollup.c.response_time_count
+    ).where(
+        usage_daily_rollup.c.day >= start_date,
+        usage_daily_rollup.c.day < end_date
     )
     
+    today_stmt = select(
+        func.date(APIUsageLog.created_at).label("usage_date"),
+        func.count().label("requests"),
+        func.sum(APIUsageLog.total_tokens).label("tokens"),
+        func.sum(APIUsageLog.total_cost).label("cost"),
+        func.sum(APIUsageLog.response_time_ms).label("sum_response_time"),
+        func.count(APIUsageLog.response_time_ms).label("response_time_count")
+    ).where(
+        APIUsageLog.created_at >= today_start,
+        APIUsageLog.created_at <= datetime.combine(end_date, datetime.max.time())
+    ).group_by(func.date(APIUsageLog.created_at))
+    
     if organization_name:
-        daily_stmt = daily_stmt.join(User, User.id == APIUsageLog.user_id).where(
-            User.organization_name.ilike(f"%{organization_name}%")
+        org_filter = User.organization_name.ilike(f"%{organization_name}%")
+        rollup_stmt = rollup_stmt.join(User, User.id == usage_daily_rollup.c.user_id).where(org_filter)
+        today_stmt = today_stmt.join(User, User.id == APIUsageLog.user_id).where(org_filter)
+    
+    combined = union_all(rollup_stmt, today_stmt).subquery()
+    daily_stmt = (
+        select(
+            combined.c.usage_date,
+            func.sum(combined.c.requests).label("total_requests"),
+            func.coalesce(func.sum(combined.c.cost), 0).cast(Float).label("total_cost"),
+            func.sum(combined.c.tokens).label("total_tokens"),
+            (
+                func.sum(combined.c.sum_response_time) / func.nullif(func.sum(combined.c.response_time_count), 0)
+            ).label("avg_response_time")
         )
+        .group_by(combined.c.usage_date)
+        .order_by(combined.c.usage_date)
+    )
     
     daily_result = await db.execute(daily_stmt)
     daily_trends = daily_result.fetchall()
@@ -334,9 +542,9 @@ async def get_usage_trends(
         "daily_trends": [
             {
                 "date": trend.usage_date.isoformat(),
-                "total_requests": trend.total_requests or 0,
-                "total_cost": float(trend.total_cost or 0),
-                "total_tokens": trend.total_tokens or 0,
+                "total_requests": int(trend.total_requests or 0),
+                "total_cost": trend.total_cost,
+                "total_tokens": int(trend.total_tokens or 0),
                 "avg_response_time": round(trend.avg_response_time or 0, 2)
             }
             for trend in daily_trends
@@ -344,6 +552,7 @@ async def get_usage_trends(
     }
 
 @router.get("/usage-summary/model-performance")
+@cached("usage", "model-performance", ttl=60)
 async def get_model_performance_metrics(
     db: AsyncSession = Depends(get_db),
     days: int = Query(7, description="Number of days to analyze"),
@@ -351,25 +560,65 @@ async def get_model_performance_metrics(
 ):
     """Get performance metrics for all models"""
     
-    start_date = datetime.utcnow() - timedelta(days=days)
+    now = datetime.utcnow()
+    start_date = now - timedelta(days=days)
+    
+    # Whole days inside the window are read from the daily rollup; the partial
+    # first day and today are aggregated from the raw log
+    first_full_day = start_date.date() + timedelta(days=1)
+    first_full_day_start = datetime.combine(first_full_day, datetime.min.time())
+    today_start = datetime.combine(now.date(), datetime.min.time())
+    
+    rollup_stmt = select(
+        usage_daily_rollup.c.model_id,
+        usage_daily_rollup.c.requests,
+        usage_daily_rollup.c.sum_response_time,
+        usage_daily_rollup.c.response_time_count,
+        usage_daily_rollup.c.min_response_time,
+        usage_daily_rollup.c.max_response_time,
+        usage_daily_rollup.c.success_count,
+        usage_daily_rollup.c.cost
+    ).where(
+        usage_daily_rollup.c.day >= first_full_day,
+        usage_daily_rollup.c.day < now.date()
+    )
+    
+    raw_stmt = select(
+        APIUsageLog.model_id,
+        func.count().label("requests"),
+        func.sum(APIUsageLog.response_time_ms).label("sum_response_time"),
+        func.count(APIUsageLog.response_time_ms).label("response_time_count"),
+        func.min(APIUsageLog.response_time_ms).label("min_response_time"),
+        func.max(APIUsageLog.response_time_ms).label("max_response_time"),
+        func.count().filter(APIUsageLog.status == 'success').label("success_count"),
+        func.sum(APIUsageLog.total_cost).label("cost")
+    ).where(
+        APIUsageLog.created_at >= start_date,
+        or_(
+            APIUsageLog.created_at < first_full_day_start,
+            APIUsageLog.created_at >= today_start
+        )
+    ).group_by(APIUsageLog.model_id)
     
+    combined = union_all(rollup_stmt, raw_stmt).subquery()
     performance_stmt = (
         select(
             AIModel.name.label("model_name"),
             AIModel.provider.label("provider"),
-            func.count().label("total_requests"),
-            func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
-            func.min(APIUsageLog.response_time_ms).label("min_response_time"),
-            func.max(APIUsageLog.response_time_ms).label("max_response_time"),
+            func.sum(combined.c.requests).label("total_requests"),
             (
-                func.sum(case((APIUsageLog.status == 'success', 1), else_=0)) / func.count() * 100
-            ).label("success_rate"),
-            func.sum(APIUsageLog.total_cost).label("total_revenue")
+                func.sum(combined.c.sum_response_time) / func.nullif(func.sum(combined.c.response_time_count), 0)
+            ).label("avg_response_time"),
+            func.min(combined.c.min_response_time).label("min_response_time"),
+            func.max(combined.c.max_response_time).label("max_response_time"),
+            (
+                func.sum(combined.c.success_count) * 100.0 / func.nullif(func.sum(combined.c.requests), 0)
+            ).cast(Float).label("success_rate"),
+            func.coalesce(func.sum(combined.c.cost), 0).cast(Float).label("total_revenue")
         )
-        .join(AIModel, AIModel.id == APIUsageLog.model_id)
-        .where(APIUsageLog.created_at >= start_date)
+        .join(AIModel, AIModel.id == combined.c.model_id)
         .group_by(AIModel.id, AIModel.name, AIModel.provider)
-        .order_by(desc(func.count()))
+        .order_by(desc(func.sum(combined.c.requests)))
     )
     
     performance_result = await db.execute(performance_stmt)
@@ -381,33 +630,46 @@ async def get_model_performance_metrics(
             {
                 "model_name": row.model_name,
                 "provider": row.provider,
-                "total_requests": row.total_requests or 0,
+                "total_requests": int(row.total_requests or 0),
                 "avg_response_time": round(row.avg_response_time or 0, 2),
                 "min_response_time": row.min_response_time or 0,
                 "max_response_time": row.max_response_time or 0,
-                "success_rate": round(float(row.success_rate or 0), 2),
-                "total_revenue": float(row.total_revenue or 0)
+                "success_rate": round(row.success_rate or 0, 2),
+                "total_revenue": row.total_revenue
             }
             for row in performance_data
         ]
     }
 
 @router.get("/usage-summary/billing-health")
+@cached("usage", "billing-health", ttl=10)
 async def get_billing_system_health(
     db: AsyncSession = Depends(get_db),
     current_admin: Admin = Depends(get_current_admin)
 ):
     """Get billing system health metrics"""
     
+    # Rolling hourly counters maintained at ingest/processing time avoid
+    # re-aggregating the window; the database is the fallback
+    counters = await get_billing_health_counters()
+    if counters is not None:
+        return _billing_health_response(
+            total_entries=int(counters["total"]),
+            processed_entries=int(counters["processed"]),
+            failed_entries=int(counters["failed"]),
+            avg_processing_time_seconds=(
+                counters["proc_seconds"] / counters["proc_count"] if counters["proc_count"] else 0
+            )
+        )
+    
     # Recent entries (last 24 hours)
-    recent_cutoff = datetime.utcnow() - timedelta(hours=24)
+    recent_cutoff = datetime.utcnow() - timedelta(hours=HEALTH_WINDOW_HOURS)
     
     health_stmt = (
         select(
             func.count().label("total_recent_entries"),
-            func.sum(case((APIUsageLog.billing_processed == True, 1), else_=0)).label("processed_entries"),
-            func.sum(case((APIUsageLog.billing_processed == False, 1), else_=0)).label("unprocessed_entries"),
-            func.sum(case((APIUsageLog.error_message.isnot(None), 1), else_=0)).label("failed_entries"),
+            func.count().filter(APIUsageLog.billing_processed == True).label("processed_entries"),
+            func.count().filter(APIUsageLog.error_message.isnot(None)).label("failed_entries"),
             func.avg(
                 func.extract('epoch', APIUsageLog.processed_at - APIUsageLog.created_at)
             ).label("avg_processing_time_seconds")
@@ -418,19 +680,30 @@ async def get_billing_system_health(
     health_result = await db.execute(health_stmt)
     health_data = health_result.fetchone()
     
+    return _billing_health_response(
+        total_entries=health_data.total_recent_entries or 0,
+        processed_entries=health_data.processed_entries or 0,
+        failed_entries=health_data.failed_entries or 0,
+        avg_processing_time_seconds=health_data.avg_processing_time_seconds or 0
+    )
+
+def _billing_health_response(
+    total_entries: int,
+    processed_entries: int,
+    failed_entries: int,
+    avg_processing_time_seconds: float
+) -> Dict[str, Any]:
     # Processing rate
-    total_entries = health_data.total_recent_entries or 0
-    processed_entries = health_data.processed_entries or 0
     processing_rate = (processed_entries / total_entries * 100) if total_entries > 0 else 100
     
     return {
         "last_24_hours": {
             "total_entries": total_entries,
             "processed_entries": processed_entries,
-            "unprocessed_entries": health_data.unprocessed_entries or 0,
-            "failed_entries": health_data.failed_entries or 0,
+            "unprocessed_entries": max(total_entries - processed_entries, 0),
+            "failed_entries": failed_entries,
             "processing_rate": round(processing_rate, 2),
-            "avg_processing_time_seconds": round(health_data.avg_processing_time_seconds or 0, 2)
+            "avg_processing_time_seconds": round(avg_processing_time_seconds, 2)
         },
         "system_health": "healthy" if processing_rate >= 95 else "degraded" if processing_rate >= 80 else "unhealthy"
     }
\ No newline at end of file
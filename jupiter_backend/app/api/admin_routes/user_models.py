@@ -1,7 +1,8 @@
 # jupiter_backend/app/api/admin_routes/user_models.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List
 from pydantic import BaseModel
 
@@ -9,6 +10,7 @@ from app.models.user import User
 from app.models.ai_model import AIModel
 from app.models.user_model_access import UserModelAccess
 from app.api.deps import get_db
+from app.utils.cache import bump_cache_version
 
 router = APIRouter()
 
@@ -24,23 +26,28 @@ class UserModelResponse(BaseModel):
 async def get_user_assigned_models(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all models assigned to a specific user"""
     stmt = (
-        select(AIModel, UserModelAccess)
+        select(
+            AIModel.id,
+            AIModel.name,
+            AIModel.provider,
+            AIModel.status,
+            UserModelAccess.granted_at
+        )
         .join(UserModelAccess, AIModel.id == UserModelAccess.model_id)
         .where(UserModelAccess.user_id == user_id)
         .where(UserModelAccess.is_active == True)
     )
     result = await db.execute(stmt)
-    models_data = result.all()
     
     assigned_models = [
         {
-            "id": model.id,
-            "name": model.name,
-            "provider": model.provider,
-            "status": model.status,
-            "granted_at": access.granted_at.isoformat()
+            "id": row.id,
+            "name": row.name,
+            "provider": row.provider,
+            "status": row.status,
+            "granted_at": row.granted_at.isoformat()
         }
-        for model, access in models_data
+        for row in result
     ]
     
     return UserModelResponse(user_id=user_id, assigned_models=assigned_models)
@@ -54,41 +61,59 @@ async def assign_models_to_user(
     """Assign multiple models to a user (replaces existing assignments)"""
     
     # Verify user exists
-    user_stmt = select(User).where(User.id == user_id)
-    user = (await db.execute(user_stmt)).scalar_one_or_none()
-    if not user:
+    user_exists = await db.scalar(select(User.id).where(User.id == user_id))
+    if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Remove existing assignments
-    delete_stmt = delete(UserModelAccess).where(UserModelAccess.user_id == user_id)
-    await db.execute(delete_stmt)
+    # Verify all requested models exist in one query
+    model_ids = list(dict.fromkeys(assignment.model_ids))
+    model_stmt = select(AIModel.id).where(AIModel.id.in_(model_ids))
+    found_ids = set((await db.scalars(model_stmt)).all())
+    missing_ids = [model_id for model_id in model_ids if model_id not in found_ids]
+    if missing_ids:
+        raise HTTPException(status_code=404, detail=f"Model {missing_ids[0]} not found")
     
-    # Add new assignments
-    for model_id in assignment.model_ids:
-        # Verify model exists
-        model_stmt = select(AIModel).where(AIModel.id == model_id)
-        model = (await db.execute(model_stmt)).scalar_one_or_none()
-        if not model:
-            raise HTTPException(status_code=404, detail=f"Model {model_id} not found")
-        
-        access = UserModelAccess(user_id=user_id, model_id=model_id)
-        db.add(access)
+    # Upsert the requested set; rows that are already active are left untouched
+    if model_ids:
+        upsert_stmt = pg_insert(UserModelAccess).values(
+            [{"user_id": user_id, "model_id": model_id, "is_active": True} for model_id in model_ids]
+        )
+        upsert_stmt = upsert_stmt.on_conflict_do_update(
+            index_elements=[UserModelAccess.user_id, UserModelAccess.model_id],
+            set_={"is_active": True, "granted_at": func.now()},
+            where=UserModelAccess.is_active == False
+        )
+        await db.execute(upsert_stmt)
     
+    # Deactivate assignments that are no longer in the set
+    deactivate_stmt = (
+        update(UserModelAccess)
+        .where(
+            UserModelAccess.user_id == user_id,
+            UserModelAccess.model_id.notin_(model_ids),
+            UserModelAccess.is_active == True
+        )
+        .values(is_active=False)
+    )
+    await db.execute(deactivate_stmt)
+    
+    # Both statements commit together
     await db.commit()
+    await bump_cache_version("usage")
     return {"message": f"Successfully assigned {len(assignment.model_ids)} models to user {user_id}"}
 
 @router.delete("/users/{user_id}/models/{model_id}")
 async def remove_model_from_user(user_id: int, model_id: int, db: AsyncSession = Depends(get_db)):
     """Remove a specific model assignment from user"""
-    stmt = select(UserModelAccess).where(
+    stmt = delete(UserModelAccess).where(
         UserModelAccess.user_id == user_id,
         UserModelAccess.model_id == model_id
     )
-    access = (await db.execute(stmt)).scalar_one_or_none()
+    result = await db.execute(stmt)
     
-    if not access:
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Model assignment not found")
     
-    await db.delete(access)
     await db.commit()
+    await bump_cache_version("usage")
     return {"message": "Model assignment removed successfully"}
\ No newline at end of file
@@ -1,18 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from sqlalchemy import select, update, func, case, column, literal_column, table, tuple_, BigInteger
+from sqlalchemy.orm import raiseload, selectinload
+from typing import Optional, List, Dict, Any, Tuple
+from pydantic import BaseModel, ConfigDict, Field
 from decimal import Decimal
 from datetime import datetime
+import base64
 
 from app.models.user import User
 from app.models.user_model_assignment import UserModelAssignment
 from app.models.user_api_key import UserAPIKey
-from app.models.ai_model import AIModel
-from app.api.deps import get_db, get_current_admin
+from app.api.deps import get_db, get_current_admin, invalidate_cached_user, invalidate_cached_api_keys
 from app.models.admin import Admin
+from app.utils.cache import cached, bump_cache_version
+from app.utils.billing_processor import invalidate_billing_mappings
+from app.utils.responses import DecimalORJSONResponse
 
 router = APIRouter()
 
@@ -67,18 +70,23 @@ class UserDetailedResponse(BaseModel):
     last_login: Optional[datetime] = None
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     auth_id: str
     email: str
     full_name: str
     is_active: bool
-    created_at: Optional[str]
+    created_at: Optional[datetime]
     organization_name: Optional[str]
     subscription_tier_id: Optional[int]
     monthly_request_limit: Optional[int]
     monthly_token_limit: Optional[int]
     monthly_cost_limit: Optional[Decimal]
 
+# Columns projected by the user list, in UserResponse field order
+_USER_RESPONSE_COLUMNS = [getattr(User, field) for field in UserResponse.model_fields]
+
 class UserStatsResponse(BaseModel):
     total_users: int
     active_users: int
@@ -88,9 +96,38 @@ class UserStatsResponse(BaseModel):
     total_model_assignments: int
     total_api_keys: int
 
-@router.get("/users", response_model=List[UserResponse])
+def _encode_users_cursor(created_at: datetime, user_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{user_id}".encode()).decode()
+
+def _decode_users_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+_pg_class = table("pg_class", column("oid"), column("reltuples"))
+
+# Below this estimated size an exact count is cheap enough to run instead
+_EXACT_COUNT_THRESHOLD = 10000
+
+def _row_count(model):
+    """
+    Row count of a model's table from pg_class.reltuples (kept current by
+    autovacuum/ANALYZE). Small or never-analyzed tables, whose estimate is
+    below the threshold or -1, are counted exactly.
+    """
+    estimate = (
+        select(_pg_class.c.reltuples.cast(BigInteger))
+        .where(_pg_class.c.oid == literal_column(f"'{model.__tablename__}'::regclass"))
+        .scalar_subquery()
+    )
+    exact = select(func.count()).select_from(model).scalar_subquery()
+    return case((estimate < _EXACT_COUNT_THRESHOLD, exact), else_=estimate)
+
+@router.get("/users", response_model=List[UserResponse], response_class=DecimalORJSONResponse)
 async def get_all_users(
-    skip: int = Query(0, description="Records to skip"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     limit: int = Query(100, description="Max records to return"),
     search: Optional[str] = Query(None, description="Search by email or organization"),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
@@ -100,62 +137,57 @@ async def get_all_users(
     """
     Fetches all users from the database with filtering options.
     This is an admin-only endpoint.
+    Uses keyset pagination on (created_at, id); the cursor for the next page is
+    returned in the X-Next-Cursor response header.
     """
     query = select(User)
     
     # Apply filters
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.where(
-            User.email.ilike(search_term) | 
-            User.organization_name.ilike(search_term) |
-            User.full_name.ilike(search_term)
-        )
+        # searchable is already lowercased, so a plain LIKE matches
+        # case-insensitively and is served by ix_users_searchable_trgm
+        query = query.where(User.searchable.like(f"%{search.lower()}%"))
     
     if is_active is not None:
         query = query.where(User.is_active == is_active)
     
     if has_assignments is not None:
+        # Correlated EXISTS plans as a semi-join (or anti-join when negated)
+        has_active_assignment = (
+            select(UserModelAssignment.id)
+            .where(
+                UserModelAssignment.user_id == User.id,
+                UserModelAssignment.is_active == True
+            )
+            .exists()
+        )
         if has_assignments:
             # Users with at least one model assignment
-            query = query.where(
-                User.id.in_(
-                    select(UserModelAssignment.user_id).where(
-                        UserModelAssignment.is_active == True
-                    )
-                )
-            )
+            query = query.where(has_active_assignment)
         else:
             # Users without any model assignments
-            query = query.where(
-                ~User.id.in_(
-                    select(UserModelAssignment.user_id).where(
-                        UserModelAssignment.is_active == True
-                    )
-                )
-            )
-    
-    query = query.order_by(User.created_at.desc()).offset(skip).limit(limit)
-    
-    result = await db.execute(query)
-    users = result.scalars().all()
+            query = query.where(~has_active_assignment)
+    
+    if cursor:
+        after_created_at, after_id = _decode_users_cursor(cursor)
+        query = query.where(tuple_(User.created_at, User.id) < tuple_(after_created_at, after_id))
+    
+    query = query.order_by(User.created_at.desc(), User.id.desc()).limit(limit)
+    
+    # Read plain UserResponse columns through a server-side cursor and build the
+    # response rows directly, without materialising ORM instances first
+    query = query.with_only_columns(*_USER_RESPONSE_COLUMNS).execution_options(yield_per=200)
+    result = await db.stream(query)
+    users = []
+    async for partition in result.mappings().partitions():
+        users.extend(dict(row) for row in partition)
+    
+    headers = {}
+    # Expose the cursor for the next page when this page is full
+    if len(users) == limit and users[-1]["created_at"] is not None:
+        headers["X-Next-Cursor"] = _encode_users_cursor(users[-1]["created_at"], users[-1]["id"])
 
-    return [
-        {
-            "id": user.id,
-            "auth_id": user.auth_id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "is_active": user.is_active,
-            "created_at": user.created_at.isoformat() if user.created_at else None,
-            "organization_name": user.organization_name,
-            "subscription_tier_id": user.subscription_tier_id,
-            "monthly_request_limit": user.monthly_request_limit,
-            "monthly_token_limit": user.monthly_token_limit,
-            "monthly_cost_limit": user.monthly_cost_limit,
-        }
-        for user in users
-    ]
+    return DecimalORJSONResponse(users, headers=headers)
 
 @router.get("/users/{user_id}", response_model=UserDetailedResponse)
 async def get_user_details(
@@ -165,26 +197,27 @@ async def get_user_details(
     """
     Get detailed information about a specific user including assignments and API keys.
     """
-    # Get user
-    user_stmt = select(User).where(User.id == user_id)
+    # Get user with assignments (and their models) and API keys batch-loaded
+    user_stmt = (
+        select(User)
+        .options(
+            selectinload(User.model_assignments).selectinload(UserModelAssignment.model),
+            selectinload(User.api_keys),
+            raiseload("*")
+        )
+        .where(User.id == user_id)
+    )
     user_result = await db.execute(user_stmt)
     user = user_result.scalar_one_or_none()
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get model assignments with model details
-    assignments_stmt = select(UserModelAssignment, AIModel.name).join(
-        AIModel, UserModelAssignment.model_id == AIModel.id
-    ).where(UserModelAssignment.user_id == user_id)
-    assignments_result = await db.execute(assignments_stmt)
-    assignments_data = assignments_result.all()
-    
     model_assignments = []
     total_usage_cost = 0
     active_assignments = 0
     
-    for assignment, model_name in assignments_data:
+    for assignment in user.model_assignments:
         if assignment.is_active:
             active_assignments += 1
         total_usage_cost += float(assignment.total_cost_incurred)
@@ -192,7 +225,7 @@ async def get_user_details(
         model_assignments.append(ModelAssignmentSummary(
             assignment_id=assignment.id,
             model_id=assignment.model_id,
-            model_name=model_name,
+            model_name=assignment.model.name,
             access_level=assignment.access_level,
             is_active=assignment.is_active,
             total_requests=assignment.total_requests_made,
@@ -200,15 +233,10 @@ async def get_user_details(
             last_used_at=assignment.last_used_at
         ))
     
-    # Get API keys
-    api_keys_stmt = select(UserAPIKey).where(UserAPIKey.user_id == user_id)
-    api_keys_result = await db.execute(api_keys_stmt)
-    api_keys_data = api_keys_result.scalars().all()
-    
     api_keys = []
     active_api_keys = 0
     
-    for api_key in api_keys_data:
+    for api_key in user.api_keys:
         if api_key.is_active:
             active_api_keys += 1
             
@@ -252,31 +280,25 @@ async def update_user(
     """
     Updates a user's details.
     """
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
+    # Only the fields the client sent, read straight off the model
+    update_data = {field: getattr(payload, field) for field in payload.model_fields_set}
+
+    # UPDATE ... RETURNING checks the row exists, applies the change and reads
+    # back the updated row in one statement
+    if update_data:
+        user_stmt = update(User).where(User.id == user_id).values(**update_data).returning(User)
+    else:
+        user_stmt = select(User).where(User.id == user_id)
+    user = (await db.execute(user_stmt)).scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    update_data = payload.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(user, field, value)
-
     await db.commit()
-    await db.refresh(user)
+    invalidate_cached_user(user_id)
+    invalidate_billing_mappings()
+    await bump_cache_version("users")
 
-    return {
-        "id": user.id,
-        "auth_id": user.auth_id,
-        "email": user.email,
-        "full_name": user.full_name,
-        "is_active": user.is_active,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "organization_name": user.organization_name,
-        "subscription_tier_id": user.subscription_tier_id,
-        "monthly_request_limit": user.monthly_request_limit,
-        "monthly_token_limit": user.monthly_token_limit,
-        "monthly_cost_limit": user.monthly_cost_limit,
-    }
+    return UserResponse.model_validate(user)
 
 @router.get("/users/{user_id}/model-assignments")
 async def get_user_model_assignments(
@@ -286,27 +308,28 @@ async def get_user_model_assignments(
     """
     Get all model assignments for a specific user.
     """
-    user_stmt = select(User).where(User.id == user_id)
+    # Assignments come back newest first (the relationship's order_by)
+    user_stmt = (
+        select(User)
+        .options(
+            selectinload(User.model_assignments).selectinload(UserModelAssignment.model),
+            raiseload("*")
+        )
+        .where(User.id == user_id)
+    )
     user_result = await db.execute(user_stmt)
     user = user_result.scalar_one_or_none()
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    assignments_stmt = select(UserModelAssignment, AIModel.name, AIModel.provider).join(
-        AIModel, UserModelAssignment.model_id == AIModel.id
-    ).where(UserModelAssignment.user_id == user_id).order_by(UserModelAssignment.assigned_at.desc())
-    
-    assignments_result = await db.execute(assignments_stmt)
-    assignments_data = assignments_result.all()
-    
     assignments = []
-    for assignment, model_name, model_provider in assignments_data:
+    for assignment in user.model_assignments:
         assignments.append({
             "assignment_id": assignment.id,
             "model_id": assignment.model_id,
-            "model_name": model_name,
-            "model_provider": model_provider,
+            "model_name": assignment.model.name,
+            "model_provider": assignment.model.provider,
             "access_level": assignment.access_level,
             "is_active": assignment.is_active,
             "daily_request_limit": assignment.daily_request_limit,
@@ -335,20 +358,25 @@ async def get_user_api_keys(
     """
     Get all API keys for a specific user.
     """
-    user_stmt = select(User).where(User.id == user_id)
-    user_result = await db.execute(user_stmt)
-    user = user_result.scalar_one_or_none()
+    # The outer join returns one row per key, or a single keyless row when the
+    # user has none, so the existence check rides along with the key query
+    stmt = (
+        select(User.email, UserAPIKey)
+        .outerjoin(UserAPIKey, UserAPIKey.user_id == User.id)
+        .where(User.id == user_id)
+        .order_by(UserAPIKey.created_at.desc())
+    )
+    rows = (await db.execute(stmt)).all()
     
-    if not user:
+    if not rows:
         raise HTTPException(status_code=404, detail="User not found")
     
-    api_keys_stmt = select(UserAPIKey).where(UserAPIKey.user_id == user_id).order_by(UserAPIKey.created_at.desc())
-    api_keys_result = await db.execute(api_keys_stmt)
-    api_keys = api_keys_result.scalars().all()
+    user_email = rows[0].email
+    api_keys = [key for _, key in rows if key is not None]
     
     return {
         "user_id": user_id,
-        "user_email": user.email,
+        "user_email": user_email,
         "api_keys": [
             {
                 "id": key.id,
@@ -386,20 +414,23 @@ async def deactivate_user_api_keys(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Update all active API keys to inactive
-    api_keys_stmt = select(UserAPIKey).where(
-        UserAPIKey.user_id == user_id,
-        UserAPIKey.is_active == True
+    # Update all active API keys to inactive in one statement
+    deactivate_stmt = (
+        update(UserAPIKey)
+        .where(
+            UserAPIKey.user_id == user_id,
+            UserAPIKey.is_active == True
+        )
+        .values(is_active=False)
+        .returning(UserAPIKey.api_key_hash)
     )
-    api_keys_result = await db.execute(api_keys_stmt)
-    api_keys = api_keys_result.scalars().all()
-    
-    deactivated_count = 0
-    for api_key in api_keys:
-        api_key.is_active = False
-        deactivated_count += 1
+    deactivated_hashes = (await db.execute(deactivate_stmt)).scalars().all()
+    deactivated_count = len(deactivated_hashes)
     
     await db.commit()
+    invalidate_cached_user(user_id)
+    await invalidate_cached_api_keys(*deactivated_hashes)
+    await bump_cache_version("users")
     
     return {
         "message": f"Deactivated {deactivated_count} API keys for user {user.email}",
@@ -408,46 +439,36 @@ async def deactivate_user_api_keys(
     }
 
 @router.get("/users/stats", response_model=UserStatsResponse)
+@cached("users", "stats", ttl=30)
 async def get_users_stats(db: AsyncSession = Depends(get_db)):
     """
     Get overview statistics for all users.
     """
-    # Total users
-    total_users_stmt = select(func.count()).select_from(User)
-    total_users_result = await db.execute(total_users_stmt)
-    total_users = total_users_result.scalar() or 0
-    
-    # Active users
-    active_users_stmt = select(func.count()).select_from(User).where(User.is_active == True)
-    active_users_result = await db.execute(active_users_stmt)
-    active_users = active_users_result.scalar() or 0
-    
-    # Users with model assignments
-    users_with_models_stmt = select(func.count(func.distinct(UserModelAssignment.user_id))).select_from(UserModelAssignment).where(UserModelAssignment.is_active == True)
-    users_with_models_result = await db.execute(users_with_models_stmt)
-    users_with_models = users_with_models_result.scalar() or 0
-    
-    # Users with API keys
-    users_with_keys_stmt = select(func.count(func.distinct(UserAPIKey.user_id))).select_from(UserAPIKey).where(UserAPIKey.is_active == True)
-    users_with_keys_result = await db.execute(users_with_keys_stmt)
-    users_with_api_keys = users_with_keys_result.scalar() or 0
-    
-    # Total model assignments
-    total_assignments_stmt = select(func.count()).select_from(UserModelAssignment)
-    total_assignments_result = await db.execute(total_assignments_stmt)
-    total_model_assignments = total_assignments_result.scalar() or 0
-    
-    # Total API keys
-    total_keys_stmt = select(func.count()).select_from(UserAPIKey)
-    total_keys_result = await db.execute(total_keys_stmt)
-    total_api_keys = total_keys_result.scalar() or 0
+    # Table totals come from planner estimates; the filtered counts stay
+    # exact and are served by partial indexes on the active rows
+    stats_stmt = select(
+        _row_count(User).label("total_users"),
+        select(func.count()).select_from(User).where(User.is_active == True)
+            .scalar_subquery().label("active_users"),
+        select(func.count(func.distinct(UserModelAssignment.user_id)))
+            .where(UserModelAssignment.is_active == True)
+            .scalar_subquery().label("users_with_models"),
+        select(func.count(func.distinct(UserAPIKey.user_id)))
+            .where(UserAPIKey.is_active == True)
+            .scalar_subquery().label("users_with_api_keys"),
+        _row_count(UserModelAssignment).label("total_model_assignments"),
+        _row_count(UserAPIKey).label("total_api_keys")
+    )
+    stats = (await db.execute(stats_stmt)).one()
+    total_users = stats.total_users or 0
+    active_users = stats.active_users or 0
     
     return UserStatsResponse(
         total_users=total_users,
         active_users=active_users,
-        inactive_users=total_users - active_users,
-        users_with_models=users_with_models,
-        users_with_api_keys=users_with_api_keys,
-        total_model_assignments=total_model_assignments,
-        total_api_keys=total_api_keys
+        inactive_users=max(total_users - active_users, 0),
+        users_with_models=stats.users_with_models or 0,
+        users_with_api_keys=stats.users_with_api_keys or 0,
+        total_model_assignments=stats.total_model_assignments or 0,
+        total_api_keys=stats.total_api_keys or 0
     )
\ No newline at end of file
@@ -2,20 +2,148 @@ from fastapi import Request, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from jose import JWTError, jwt
+from sqlalchemy import update, values, column, Integer, DateTime
+import jwt
 from pydantic import BaseModel
-from typing import Optional, Union
+from typing import Dict, Optional, Tuple, Union
 from datetime import datetime
+import hashlib
+import json
+import logging
+import re
+import time
 
 from app.database import async_session
-from app.security import ALGORITHM, SECRET_KEY
+from app.security import decode_access_token
 from app.models.user import User
 from app.models.admin import Admin
 from app.models.user_api_key import UserAPIKey
+from app.utils.cache import LocalTTLCache, get_redis
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 security = HTTPBearer()
 
+# Tokens without a uid claim are remembered in Redis until they expire, mapped
+# to the id of the user/admin they resolved to, and those rows are kept briefly
+# per process, so repeat requests skip the lookup by name
+_principal_cache = LocalTTLCache(maxsize=1024, ttl=60)
+
+def _token_cache_key(kind: str, token: str) -> str:
+    return f"auth:tok:{kind}:{hashlib.sha256(token.encode()).hexdigest()}"
+
+async def _get_cached_token_subject(kind: str, token: str) -> Optional[int]:
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        subject_id = await client.get(_token_cache_key(kind, token))
+    except Exception as e:
+        logger.warning(f"Token cache lookup failed: {str(e)}")
+        return None
+    return int(subject_id) if subject_id is not None else None
+
+async def _cache_token_subject(kind: str, token: str, payload: dict, subject_id: int):
+    client = get_redis()
+    ttl = int(payload.get("exp", 0) - time.time())
+    if client is None or ttl <= 0:
+        return
+    try:
+        await client.set(_token_cache_key(kind, token), subject_id, ex=ttl)
+    except Exception as e:
+        logger.warning(f"Token cache store failed: {str(e)}")
+
+async def _load_principal(db: AsyncSession, model, subject_id: int):
+    principal = _principal_cache.get((model.__name__, subject_id))
+    if principal is None:
+        principal = await db.get(model, subject_id)
+        if principal is not None:
+            _principal_cache.set((model.__name__, subject_id), principal)
+    return principal
+
+def invalidate_cached_user(user_id: int):
+    """Drop this process's cached copy of a user after it has been changed"""
+    _principal_cache.pop((User.__name__, user_id))
+
+# Valid API keys are cached briefly in Redis by hash, and last_used_at is
+# buffered in memory and written in one UPDATE per flush instead of a commit
+# on every request
+_API_KEY_CACHE_TTL_SECONDS = 60
+_pending_api_key_usage: Dict[int, datetime] = {}
+
+# Shape of keys issued by UserAPIKey.generate_api_key (jb_ + URL-safe token);
+# anything else is rejected before it is hashed or looked up
+_API_KEY_RE = re.compile(r"^jb_[A-Za-z0-9_-]{32,128}$")
+
+def _api_key_cache_key(api_key_hash: str) -> str:
+    return f"auth:apikey:{api_key_hash}"
+
+async def _get_cached_api_key(api_key_hash: str) -> Optional[dict]:
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        cached_key = await client.get(_api_key_cache_key(api_key_hash))
+    except Exception as e:
+        logger.warning(f"API key cache lookup failed: {str(e)}")
+        return None
+    return json.loads(cached_key) if cached_key is not None else None
+
+async def _cache_api_key(api_key_hash: str, user_api_key: UserAPIKey):
+    client = get_redis()
+    if client is None:
+        return
+    cached_key = {
+        "id": user_api_key.id,
+        "user_id": user_api_key.user_id,
+        "expires_at": user_api_key.expires_at.isoformat() if user_api_key.expires_at else None,
+        "allowed_ips": user_api_key.allowed_ips
+    }
+    try:
+        await client.set(_api_key_cache_key(api_key_hash), json.dumps(cached_key), ex=_API_KEY_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"API key cache store failed: {str(e)}")
+
+async def invalidate_cached_api_keys(*api_key_hashes: str):
+    """Forget cached API keys after they are deactivated or deleted"""
+    client = get_redis()
+    if client is None or not api_key_hashes:
+        return
+    try:
+        await client.delete(*(_api_key_cache_key(api_key_hash) for api_key_hash in api_key_hashes))
+    except Exception as e:
+        logger.warning(f"API key cache invalidation failed: {str(e)}")
+
+def _record_api_key_usage(api_key_id: int):
+    _pending_api_key_usage[api_key_id] = datetime.utcnow()
+
+async def flush_api_key_usage():
+    """Write buffered last_used_at timestamps for API keys in one statement"""
+    if not _pending_api_key_usage:
+        return
+    pending = dict(_pending_api_key_usage)
+    _pending_api_key_usage.clear()
+    # Each key keeps its own timestamp: UPDATE ... FROM (VALUES (id, ts), ...)
+    usage = values(
+        column("id", Integer), column("last_used_at", DateTime), name="usage"
+    ).data(list(pending.items()))
+    try:
+        async with async_session() as db:
+            await db.execute(
+                update(UserAPIKey)
+                .where(UserAPIKey.id == usage.c.id)
+                .values(last_used_at=usage.c.last_used_at)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception:
+        # Put the timestamps back for the next flush, without overwriting
+        # newer ones recorded meanwhile
+        for api_key_id, used_at in pending.items():
+            _pending_api_key_usage.setdefault(api_key_id, used_at)
+        raise
+
 class TokenData(BaseModel):
     sub: Optional[str] = None
     role: Optional[str] = None
@@ -24,62 +152,106 @@ async def get_db():
     async with async_session() as session:
         yield session
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+def _token_payload(request: Request, token: str) -> Optional[dict]:
+    """
+    The verified payload of the request's bearer token, as decoded by
+    AuthTokenMiddleware, or None when it is invalid
+    """
+    state = request.scope.get("state", {})
+    if "token_payload" in state:
+        return state["token_payload"]
+    try:
+        return decode_access_token(token)
+    except jwt.InvalidTokenError:
+        return None
+
+async def _resolve_user_id(request: Request, token: str, db: AsyncSession) -> int:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        role: str = payload.get("role")
-        if email is None or role != "user":
-            raise credentials_exception
-        token_data = TokenData(sub=email, role=role)
-    except JWTError:
+    payload = _token_payload(request, token)
+    if payload is None or payload.get("sub") is None or payload.get("role") != "user":
         raise credentials_exception
 
-    stmt = select(User).where(User.email == token_data.sub)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-    
+    # Tokens issued at login carry the user id; older ones only the email
+    user_id = payload.get("uid")
+    if user_id is None:
+        user_id = await _get_cached_token_subject("user", token)
+    if user_id is None:
+        stmt = select(User).where(User.email == payload["sub"])
+        result = await db.execute(stmt)
+        user = result.scalar_one_or_none()
+        if user is None:
+            raise credentials_exception
+        user_id = user.id
+        _principal_cache.set((User.__name__, user_id), user)
+        await _cache_token_subject("user", token, payload, user_id)
+    return user_id
+
+async def get_current_user_id(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> int:
+    """Id of the authenticated user, for routes that do not need the User row"""
+    return await _resolve_user_id(request, token, db)
+
+async def get_current_user(
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    # Depending on get_current_user_id lets FastAPI reuse the id already
+    # resolved for the request (e.g. by a router-level dependency)
+    user = await _load_principal(db, User, user_id)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
-async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Admin:
+async def get_current_admin(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> Admin:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials for admin",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        role: str = payload.get("role")
-        if username is None or "admin" not in role: # Allows for 'admin', 'superadmin'
-            raise credentials_exception
-        token_data = TokenData(sub=username, role=role)
-    except JWTError:
+    payload = _token_payload(request, token)
+    # Allows for 'admin', 'superadmin'
+    if payload is None or payload.get("sub") is None or "admin" not in (payload.get("role") or ""):
         raise credentials_exception
 
-    stmt = select(Admin).where(Admin.username == token_data.sub)
+    admin_id = await _get_cached_token_subject("admin", token)
+    if admin_id is not None:
+        admin = await _load_principal(db, Admin, admin_id)
+        if admin is not None:
+            return admin
+
+    stmt = select(Admin).where(Admin.username == payload["sub"])
     result = await db.execute(stmt)
     admin = result.scalar_one_or_none()
     
     if admin is None:
         raise credentials_exception
+    _principal_cache.set((Admin.__name__, admin.id), admin)
+    await _cache_token_subject("admin", token, payload, admin.id)
     return admin
 
-# New function for API key authentication
-async def get_user_from_api_key(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
+async def _resolve_api_key(
+    credentials: HTTPAuthorizationCredentials,
+    db: AsyncSession
+) -> Tuple[User, UserAPIKey]:
     """
-    Authenticate user using API key instead of JWT token.
-    This is used for API requests where users provide their API key.
+    Validate an API key and return its user together with the key record.
+    On a cache hit the key record is a transient UserAPIKey rebuilt from the
+    cached fields, which is enough for the expiry and IP checks.
     """
     if not credentials:
         raise HTTPException(
@@ -91,7 +263,7 @@ async def get_user_from_api_key(
     api_key = credentials.credentials
     
     # Validate API key format
-    if not api_key.startswith("jb_"):
+    if not _API_KEY_RE.match(api_key):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key format",
@@ -100,19 +272,48 @@ async def get_user_from_api_key(
     # Hash the provided API key to compare with stored hash
     api_key_hash = UserAPIKey.hash_api_key(api_key)
     
-    # Find the API key in database
-    stmt = select(UserAPIKey).where(
-        UserAPIKey.api_key_hash == api_key_hash,
-        UserAPIKey.is_active == True
+    # Recently validated keys skip the database
+    cached_key = await _get_cached_api_key(api_key_hash)
+    if cached_key is not None:
+        expires_at = cached_key["expires_at"]
+        user_api_key = UserAPIKey(
+            id=cached_key["id"],
+            user_id=cached_key["user_id"],
+            expires_at=datetime.fromisoformat(expires_at) if expires_at is not None else None,
+            allowed_ips=cached_key.get("allowed_ips")
+        )
+        if user_api_key.is_expired():
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="API key has expired",
+            )
+        user = await _load_principal(db, User, cached_key["user_id"])
+        if not user or not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User account is inactive",
+            )
+        _record_api_key_usage(user_api_key.id)
+        return user, user_api_key
+    
+    # Find the API key and its user in one round-trip
+    stmt = (
+        select(UserAPIKey, User)
+        .join(User, User.id == UserAPIKey.user_id)
+        .where(
+            UserAPIKey.api_key_hash == api_key_hash,
+            UserAPIKey.is_active == True
+        )
     )
     result = await db.execute(stmt)
-    user_api_key = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not user_api_key:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
         )
+    user_api_key, user = row
     
     # Check if API key has expired
     if user_api_key.is_expired():
@@ -121,21 +322,29 @@ async def get_user_from_api_key(
             detail="API key has expired",
         )
     
-    # Get the user associated with this API key
-    stmt = select(User).where(User.id == user_api_key.user_id)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-    
-    if not user or not user.is_active:
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User account is inactive",
         )
     
-    # Update last used timestamp
-    user_api_key.update_last_used()
-    await db.commit()
+    _principal_cache.set((User.__name__, user.id), user)
+    await _cache_api_key(api_key_hash, user_api_key)
+    # last_used_at is written by the periodic flush
+    _record_api_key_usage(user_api_key.id)
     
+    return user, user_api_key
+
+# New function for API key authentication
+async def get_user_from_api_key(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Authenticate user using API key instead of JWT token.
+    This is used for API requests where users provide their API key.
+    """
+    user, _ = await _resolve_api_key(credentials, db)
     return user
 
 async def get_user_from_api_key_with_ip_check(
@@ -147,23 +356,11 @@ async def get_user_from_api_key_with_ip_check(
     Enhanced API key authentication with IP address validation.
     Use this for stricter API access control.
     """
-    # First get the user using standard API key validation
-    user = await get_user_from_api_key(credentials, db)
-    
-    # Get the API key record for additional validation
-    api_key = credentials.credentials
-    api_key_hash = UserAPIKey.hash_api_key(api_key)
-    
-    stmt = select(UserAPIKey).where(UserAPIKey.api_key_hash == api_key_hash)
-    result = await db.execute(stmt)
-    user_api_key = result.scalar_one_or_none()
+    # Standard API key validation also hands back the key record for the IP check
+    user, user_api_key = await _resolve_api_key(credentials, db)
     
-    # Get client IP address
-    client_ip = request.client.host
-    if request.headers.get("X-Forwarded-For"):
-        client_ip = request.headers.get("X-Forwarded-For").split(",")[0].strip()
-    elif request.headers.get("X-Real-IP"):
-        client_ip = request.headers.get("X-Real-IP")
+    # Resolved once per request by ClientIPMiddleware
+    client_ip = request.state.client_ip
     
     # Check IP restrictions if any are set
     if not user_api_key.is_ip_allowed(client_ip):
@@ -177,29 +374,25 @@ async def get_user_from_api_key_with_ip_check(
 # Flexible authentication function that supports both JWT and API key
 async def get_current_user_flexible(
     request: Request,
-    db: AsyncSession = Depends(get_db),
-    token: Optional[str] = Depends(oauth2_scheme),
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """
     Flexible authentication that accepts either JWT token or API key.
     Useful for endpoints that need to support both authentication methods.
+    The bearer token's prefix decides which check runs, so API keys are never
+    put through jwt.decode and JWTs never through the API key lookup.
     """
-    # Try JWT token first
-    if token:
-        try:
-            return await get_current_user(token, db)
-        except HTTPException:
-            pass  # Fall through to API key authentication
-    
-    # Try API key authentication
-    if credentials:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
         try:
-            return await get_user_from_api_key(credentials, db)
+            if token.startswith("jb_"):
+                credentials = HTTPAuthorizationCredentials(scheme=scheme, credentials=token)
+                return await get_user_from_api_key(credentials, db)
+            return await get_current_user(await get_current_user_id(request, token, db), db)
         except HTTPException:
             pass
     
-    # If both methods fail, raise authentication error
+    # If authentication fails, raise authentication error
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Valid JWT token or API key required",
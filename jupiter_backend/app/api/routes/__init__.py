@@ -9,7 +9,7 @@ from .billing import router as billing_router
 from .checkout_session import router as checkout_session_router
 from .auth import router as auth_router
 from .billing_receiver import router as billing_receiver_router  # NEW IMPORT
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user_id
 
 router = APIRouter()
 
@@ -19,8 +19,9 @@ router.include_router(auth_router, tags=["Authentication"])
 # Public billing receiver routes (no user session needed for external models)
 router.include_router(billing_receiver_router, prefix="/api", tags=["Billing Receiver"])
 
-# Protected user routes are now protected at the router level
-protected_user_api = APIRouter(dependencies=[Depends(get_current_user)])
+# Protected user routes are now protected at the router level. Only the token
+# is checked here; routes that need the User row load it themselves.
+protected_user_api = APIRouter(dependencies=[Depends(get_current_user_id)])
 protected_user_api.include_router(dashboard_router, prefix="/dashboard", tags=["Dashboard"])
 protected_user_api.include_router(usage_router, prefix="/usage", tags=["Usage"])
 protected_user_api.include_router(limits_router, prefix="/limits", tags=["Limits"])
@@ -1,14 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import and_, func
 from app.api.deps import get_db
-from app.models.api_usage_log import APIUsageLog
-from app.models.ai_model import AIModel, CostCalculationType
-from app.models.discount_rule import DiscountRule
+from app.models.usage_cost import USAGE_COST
+from app.utils.usage_log_queue import enqueue_usage_log, write_usage_logs
 from pydantic import BaseModel
-from decimal import Decimal
-from datetime import datetime
 
 router = APIRouter()
 
@@ -22,63 +17,35 @@ class UsageLogInput(BaseModel):
 
 @router.post("/")
 async def log_api_usage(data: UsageLogInput, db: AsyncSession = Depends(get_db)):
-    stmt = select(AIModel).where(AIModel.id == data.model_id)
-    result = await db.execute(stmt)
-    model = result.scalar_one_or_none()
-
-    if not model:
+    # Pricing, the monthly request count, the discount and the log id all come
+    # from the usage_cost database function in a single round trip
+    row = (await db.execute(USAGE_COST, {
+        "user_id": data.user_id,
+        "model_id": data.model_id,
+        "input_tokens": data.input_tokens,
+        "output_tokens": data.output_tokens,
+        "status": data.status
+    })).one_or_none()
+    if not row:
         raise HTTPException(status_code=404, detail="Model not found")
+    # Keep the counter increment; the log row itself is written separately
+    await db.commit()
 
-    original_cost = Decimal(0)
-    total_tokens = data.input_tokens + data.output_tokens
-
-    if data.status == 'success':
-        if model.cost_calculation_type == CostCalculationType.tokens:
-            input_cost = (Decimal(data.input_tokens) / 1000) * model.input_cost_per_1k_tokens
-            output_cost = (Decimal(data.output_tokens) / 1000) * model.output_cost_per_1k_tokens
-            original_cost = input_cost + output_cost
-        elif model.cost_calculation_type == CostCalculationType.request:
-            original_cost = model.request_cost
-
-    start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    request_count_stmt = select(func.count()).select_from(APIUsageLog).where(
-        APIUsageLog.user_id == data.user_id,
-        APIUsageLog.created_at >= start_of_month
-    )
-    request_count = (await db.execute(request_count_stmt)).scalar() or 0
-
-    discount_stmt = select(DiscountRule).where(
-        and_(
-            DiscountRule.is_active == True,
-            DiscountRule.user_id == data.user_id,
-            DiscountRule.model_id == data.model_id,
-            DiscountRule.min_requests <= request_count,
-            (DiscountRule.max_requests == None) | (DiscountRule.max_requests >= request_count)
-        )
-    ).order_by(DiscountRule.priority)
-    
-    discount_result = await db.execute(discount_stmt)
-    applicable_discount = discount_result.scalars().first()
-    
-    applied_discount_percentage = Decimal(0)
-    if applicable_discount:
-        applied_discount_percentage = Decimal(applicable_discount.discount_percentage)
-
-    total_cost = original_cost * (1 - (applied_discount_percentage / 100))
-
-    log_entry = APIUsageLog(
+    log_row = dict(
+        id=row.log_id,
         user_id=data.user_id,
         model_id=data.model_id,
-        total_tokens=total_tokens,
-        original_cost=original_cost,
-        applied_discount=applied_discount_percentage,
-        total_cost=total_cost,
+        total_tokens=data.input_tokens + data.output_tokens,
+        original_cost=row.original_cost,
+        applied_discount=row.applied_discount,
+        total_cost=row.total_cost,
         status=data.status,
         response_time_ms=data.response_time_ms
     )
 
-    db.add(log_entry)
-    await db.commit()
-    await db.refresh(log_entry)
+    # Written in the background with other queued rows; only a full queue
+    # makes this request write its row itself
+    if not enqueue_usage_log(log_row):
+        await write_usage_logs([log_row])
 
-    return {"message": "Usage logged successfully", "log_id": log_entry.id, "total_cost": float(total_cost)}
\ No newline at end of file
+    return {"message": "Usage logged successfully", "log_id": row.log_id, "total_cost": float(row.total_cost)}
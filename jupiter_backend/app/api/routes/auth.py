@@ -2,15 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from pydantic import BaseModel, EmailStr
+from sqlalchemy import func
+from pydantic import BaseModel, ConfigDict, EmailStr
+import asyncio
+import hashlib
+import hmac
+import secrets
 import uuid
 from datetime import datetime, timedelta
 
-from app.api.deps import get_db, get_current_user  # FIXED: Added get_current_user import
+import jwt
+
+from app.api.deps import get_db, get_current_user_id, invalidate_cached_user, invalidate_cached_api_keys
 from app.models.user import User
 from app.models.user_api_key import UserAPIKey
-from app.security import create_access_token, get_password_hash, verify_password
+from app.models.registration import REGISTER_USER_WITH_KEY
+from app.security import ALGORITHM, SECRET_KEY, create_access_token, get_password_hash, hash_otp, verify_otp, verify_password
 from app.utils.email import send_verification_email, generate_otp, send_password_reset_email
+from app.utils.cache import bump_cache_version
 
 router = APIRouter()
 
@@ -44,6 +53,8 @@ class APIKeyCreate(BaseModel):
     rate_limit_per_day: int = 10000
 
 class APIKeyResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     key_name: str
     api_key_prefix: str
@@ -53,10 +64,14 @@ class APIKeyResponse(BaseModel):
     last_used_at: datetime = None
 
 # --- Helper Function ---
+def _email_is(email: str):
+    """Case-insensitive email match, served by the unique lower(email) index"""
+    return func.lower(User.email) == email.lower()
+
 async def resend_otp(user: User, db: AsyncSession, background_tasks: BackgroundTasks):
     """Generates a new OTP, updates the user, and sends the email."""
     otp = generate_otp()
-    user.email_verification_token = get_password_hash(otp)
+    user.email_verification_token = hash_otp(otp)
     user.email_verification_token_expires = datetime.utcnow() + timedelta(minutes=10)
     await db.commit()
     background_tasks.add_task(send_verification_email, user.email, otp)
@@ -68,7 +83,7 @@ async def register_user(
     background_tasks: BackgroundTasks, 
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(User).where(User.email == user_in.email)
+    stmt = select(User).where(_email_is(user_in.email))
     result = await db.execute(stmt)
     existing_user = result.scalar_one_or_none()
 
@@ -83,24 +98,26 @@ async def register_user(
                 detail="Email already registered but not verified. A new verification code has been sent."
             )
 
-    hashed_password = get_password_hash(user_in.password)
+    # bcrypt is CPU-bound; hash in a worker thread so the event loop keeps serving
+    hashed_password = await asyncio.to_thread(get_password_hash, user_in.password)
     otp = generate_otp()
     
-    new_user = User(
-        email=user_in.email,
-        hashed_password=hashed_password,
-        full_name=user_in.full_name,
-        organization_name=user_in.organization_name,
-        auth_id=str(uuid.uuid4()),
-        email_verified=False,
-        email_verification_token=get_password_hash(otp),
-        email_verification_token_expires=datetime.utcnow() + timedelta(minutes=10)
-    )
-    db.add(new_user)
+    # The user and their default API key are inserted by one database function
+    # call, so no user is left without a key
+    _, default_key_hash, default_key_prefix = UserAPIKey.generate_api_key()
+    await db.execute(REGISTER_USER_WITH_KEY, {
+        "email": user_in.email.lower(),
+        "hashed_password": hashed_password,
+        "full_name": user_in.full_name,
+        "organization_name": user_in.organization_name,
+        "auth_id": str(uuid.uuid4()),
+        "otp_hash": hash_otp(otp),
+        "otp_expires": datetime.utcnow() + timedelta(minutes=10),
+        "api_key_hash": default_key_hash,
+        "api_key_prefix": default_key_prefix
+    })
     await db.commit()
-    
-    # Create default API key for new user
-    await _create_default_api_key(new_user, db)
+    await bump_cache_version("users")
     
     background_tasks.add_task(send_verification_email, user_in.email, otp)
 
@@ -108,7 +125,7 @@ async def register_user(
 
 @router.post("/verify-email")
 async def verify_email(payload: VerifyEmailRequest, db: AsyncSession = Depends(get_db)):
-    stmt = select(User).where(User.email == payload.email)
+    stmt = select(User).where(_email_is(payload.email))
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
 
@@ -118,7 +135,7 @@ async def verify_email(payload: VerifyEmailRequest, db: AsyncSession = Depends(g
         raise HTTPException(status_code=400, detail="Email already verified")
     if user.email_verification_token_expires < datetime.utcnow():
         raise HTTPException(status_code=400, detail="OTP has expired")
-    if not verify_password(payload.token, user.email_verification_token):
+    if not verify_otp(payload.token, user.email_verification_token):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     user.email_verified = True
@@ -134,7 +151,7 @@ async def resend_verification_email_route(
     background_tasks: BackgroundTasks, 
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(User).where(User.email == payload.email)
+    stmt = select(User).where(_email_is(payload.email))
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
     
@@ -153,11 +170,11 @@ async def login_user_for_access_token(
     background_tasks: BackgroundTasks = BackgroundTasks(),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(User).where(User.email == form_data.username)
+    stmt = select(User).where(_email_is(form_data.username))
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -171,7 +188,7 @@ async def login_user_for_access_token(
             detail="Email not verified. We've sent you a new verification code.",
         )
 
-    access_token = create_access_token(data={"sub": user.email, "role": "user"})
+    access_token = create_access_token(data={"sub": user.email, "role": "user", "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/forgot-password")
@@ -180,17 +197,20 @@ async def forgot_password(
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = select(User).where(User.email == payload.email)
+    stmt = select(User).where(_email_is(payload.email))
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
     
     if user:
-        # Generate a secure, single-use token for password reset
+        # Generate a secure, single-use token for password reset. The token is
+        # already random, so a sha256 digest is enough to store it safely.
+        jti = secrets.token_urlsafe(16)
         reset_token = create_access_token(
-            data={"sub": user.email, "scope": "password_reset"}, 
+            data={"sub": user.email, "jti": jti, "scope": "password_reset"}, 
             expires_delta=timedelta(minutes=15)
         )
-        user.password_reset_token = get_password_hash(reset_token)
+        user.password_reset_jti = jti
+        user.password_reset_token = hashlib.sha256(reset_token.encode()).hexdigest()
         user.password_reset_token_expires = datetime.utcnow() + timedelta(minutes=15)
         await db.commit()
 
@@ -203,36 +223,40 @@ async def forgot_password(
 async def reset_password(payload: ResetPasswordRequest, db: AsyncSession = Depends(get_db)):
     if payload.new_password != payload.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
+    # Only a token signed by us, unexpired and scoped for password reset gets
+    # as far as the database; anything else is rejected after the HMAC check
     try:
-        users = (await db.execute(select(User).where(User.password_reset_token.isnot(None)))).scalars().all()
-        
-        user_to_update = None
-        for user in users:
-            if verify_password(payload.token, user.password_reset_token):
-                user_to_update = user
-                break
-
-        if not user_to_update:
-            raise HTTPException(status_code=400, detail="Invalid token")
-
-        if user_to_update.password_reset_token_expires < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="Token has expired")
-            
-        user_to_update.hashed_password = get_password_hash(payload.new_password)
-        user_to_update.password_reset_token = None
-        user_to_update.password_reset_token_expires = None
-        await db.commit()
-
-        return {"message": "Password has been reset successfully."}
-        
-    except Exception:
+        claims = jwt.decode(payload.token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if claims.get("scope") != "password_reset" or not claims.get("jti"):
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    # The jti finds the user through the unique index; the stored digest
+    # confirms this is the token that was issued last
+    stmt = select(User).where(User.password_reset_jti == claims["jti"])
+    user_to_update = (await db.execute(stmt)).scalar_one_or_none()
+    token_hash = hashlib.sha256(payload.token.encode()).hexdigest()
+    if not user_to_update or not hmac.compare_digest(token_hash, user_to_update.password_reset_token or ""):
+        raise HTTPException(status_code=400, detail="Invalid token")
+
+    if user_to_update.password_reset_token_expires < datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Token has expired")
+
+    user_to_update.hashed_password = await asyncio.to_thread(get_password_hash, payload.new_password)
+    user_to_update.password_reset_token = None
+    user_to_update.password_reset_token_expires = None
+    user_to_update.password_reset_jti = None
+    await db.commit()
+    invalidate_cached_user(user_to_update.id)
+
+    return {"message": "Password has been reset successfully."}
 
 # --- API Key Management Routes ---
 @router.post("/api-keys", response_model=dict)
 async def create_api_key(
     payload: APIKeyCreate,
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new API key for the current user"""
@@ -246,7 +270,7 @@ async def create_api_key(
     
     # Create API key record
     api_key = UserAPIKey(
-        user_id=current_user.id,
+        user_id=current_user_id,
         key_name=payload.key_name,
         api_key_hash=key_hash,
         api_key_prefix=prefix,
@@ -258,7 +282,7 @@ async def create_api_key(
     
     db.add(api_key)
     await db.commit()
-    await db.refresh(api_key)
+    await bump_cache_version("users")
     
     return {
         "api_key": full_key,  # Only returned once!
@@ -274,37 +298,26 @@ async def create_api_key(
 
 @router.get("/api-keys", response_model=list[APIKeyResponse])
 async def list_api_keys(
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """List all API keys for the current user"""
-    stmt = select(UserAPIKey).where(UserAPIKey.user_id == current_user.id).order_by(UserAPIKey.created_at.desc())
+    stmt = select(UserAPIKey).where(UserAPIKey.user_id == current_user_id).order_by(UserAPIKey.created_at.desc())
     result = await db.execute(stmt)
-    api_keys = result.scalars().all()
     
-    return [
-        APIKeyResponse(
-            id=key.id,
-            key_name=key.key_name,
-            api_key_prefix=key.api_key_prefix,
-            is_active=key.is_active,
-            created_at=key.created_at,
-            expires_at=key.expires_at,
-            last_used_at=key.last_used_at
-        )
-        for key in api_keys
-    ]
+    # response_model validates the rows straight from their attributes
+    return result.scalars().all()
 
 @router.delete("/api-keys/{key_id}")
 async def delete_api_key(
     key_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete an API key"""
     stmt = select(UserAPIKey).where(
         UserAPIKey.id == key_id,
-        UserAPIKey.user_id == current_user.id
+        UserAPIKey.user_id == current_user_id
     )
     result = await db.execute(stmt)
     api_key = result.scalar_one_or_none()
@@ -314,19 +327,21 @@ async def delete_api_key(
     
     await db.delete(api_key)
     await db.commit()
+    await invalidate_cached_api_keys(api_key.api_key_hash)
+    await bump_cache_version("users")
     
     return {"message": "API key deleted successfully"}
 
 @router.put("/api-keys/{key_id}/toggle")
 async def toggle_api_key(
     key_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Toggle API key active status"""
     stmt = select(UserAPIKey).where(
         UserAPIKey.id == key_id,
-        UserAPIKey.user_id == current_user.id
+        UserAPIKey.user_id == current_user_id
     )
     result = await db.execute(stmt)
     api_key = result.scalar_one_or_none()
@@ -336,29 +351,9 @@ async def toggle_api_key(
     
     api_key.is_active = not api_key.is_active
     await db.commit()
+    if not api_key.is_active:
+        await invalidate_cached_api_keys(api_key.api_key_hash)
+    await bump_cache_version("users")
     
     status_text = "activated" if api_key.is_active else "deactivated"
     return {"message": f"API key {status_text} successfully"}
-
-# --- Helper Functions ---
-async def _create_default_api_key(user: User, db: AsyncSession):
-    """Create a default API key for new users"""
-    # Check if UserAPIKey model exists and has the generate_api_key method
-    try:
-        full_key, key_hash, prefix = UserAPIKey.generate_api_key()
-        
-        default_api_key = UserAPIKey(
-            user_id=user.id,
-            key_name="Default API Key",
-            api_key_hash=key_hash,
-            api_key_prefix=prefix,
-            rate_limit_per_minute=60,
-            rate_limit_per_hour=1000,
-            rate_limit_per_day=10000
-        )
-        
-        db.add(default_api_key)
-        await db.commit()
-    except Exception:
-        # If UserAPIKey model doesn't exist or method fails, continue without creating default key
-        pass
\ No newline at end of file
@@ -1,42 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import tuple_
+from typing import Optional, Tuple
 
-from app.models.user import User
 from app.models.billing_summary import MonthlyBillingSummary
-from app.api.deps import get_db, get_current_user
+from app.api.deps import get_db, get_current_user_id
 
 router = APIRouter()
 
+def _decode_bills_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        year, month = cursor.split("-")
+        return int(year), int(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/")
 async def get_all_bills(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (YYYY-MM)"),
+    limit: int = Query(50, ge=1, le=500, description="Max bills to return"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user_id: int = Depends(get_current_user_id)
 ):
+    """
+    The user's monthly bills, newest first. Uses keyset pagination on
+    (year, month); the cursor for the next page is returned in the
+    X-Next-Cursor response header.
+    """
+    # Only the columns the response uses, fetched as plain rows
     stmt = (
-        select(MonthlyBillingSummary)
-        .where(MonthlyBillingSummary.user_id == current_user.id)
+        select(
+            MonthlyBillingSummary.id,
+            MonthlyBillingSummary.year,
+            MonthlyBillingSummary.month,
+            MonthlyBillingSummary.total_cost,
+            MonthlyBillingSummary.is_paid,
+            MonthlyBillingSummary.stripe_invoice_url,
+            MonthlyBillingSummary.created_at,
+            MonthlyBillingSummary.payment_due_date,
+            MonthlyBillingSummary.paid_at
+        )
+        .where(MonthlyBillingSummary.user_id == current_user_id)
         .order_by(MonthlyBillingSummary.year.desc(), MonthlyBillingSummary.month.desc())
+        .limit(limit)
     )
+    if cursor:
+        after_year, after_month = _decode_bills_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(MonthlyBillingSummary.year, MonthlyBillingSummary.month) < tuple_(after_year, after_month)
+        )
 
     result = await db.execute(stmt)
-    bills = result.scalars().all()
+    bills = result.all()
 
     response_data = []
-    for bill in bills:
+    for bill_id, year, month, total_cost, is_paid, invoice_url, created_at, payment_due_date, paid_at in bills:
         data = {
-            "id": bill.id,
-            "year": bill.year,
-            "month": bill.month,
-            "total_cost": float(bill.total_cost),
-            "status": "paid" if bill.is_paid else "unpaid",
-            "invoice_url": bill.stripe_invoice_url,
-            "created_at": bill.created_at.isoformat() if bill.created_at else None,
-            "payment_due_date": bill.payment_due_date.isoformat() if bill.payment_due_date else None,
+            "id": bill_id,
+            "year": year,
+            "month": month,
+            "total_cost": float(total_cost),
+            "status": "paid" if is_paid else "unpaid",
+            "invoice_url": invoice_url,
+            "created_at": created_at.isoformat() if created_at else None,
+            "payment_due_date": payment_due_date.isoformat() if payment_due_date else None,
         }
-        if bill.is_paid:
-            data["paid_at"] = bill.paid_at.isoformat() if bill.paid_at else None
+        if is_paid:
+            data["paid_at"] = paid_at.isoformat() if paid_at else None
         
         response_data.append(data)
+    
+    # Expose the cursor for the next page when this page is full
+    if len(bills) == limit:
+        response.headers["X-Next-Cursor"] = f"{bills[-1].year}-{bills[-1].month:02d}"
         
     return response_data
\ No newline at end of file
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import and_, cast, func, insert, Float
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set, Tuple
 from datetime import datetime
 import logging
 
@@ -10,7 +11,11 @@ from app.api.deps import get_db
 from app.models.api_usage_log import APIUsageLog
 from app.models.user import User
 from app.models.ai_model import AIModel
-from app.utils.billing_processor import process_billing_entry  # We'll create this utility
+from app.utils.billing_processor import BillingProcessor, process_billing_entry  # We'll create this utility
+from app.utils.billing_health import record_usage_logged, record_usage_processed, record_usage_failed
+from app.utils.usage_log_queue import (
+    enqueue_usage_log, on_usage_logs_written, reserve_usage_log_ids, write_usage_logs
+)
 
 router = APIRouter()
 
@@ -19,13 +24,24 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Pydantic Models ---
+# Rows are written in batches shared with other requests, so values that would
+# not fit their api_usage_logs columns are rejected here rather than failing a
+# batch after the response
+_MAX_INT4 = 2_147_483_647
+
 class BillingData(BaseModel):
-    model_name: str = Field(..., description="Model name in format: company_name_model_type")
-    predicted_label: Optional[str] = Field(None, description="Model prediction result")
-    processing_time_ms: int = Field(default=0, description="Processing time in milliseconds")
-    timestamp: Optional[str] = Field(None, description="Request timestamp")
-    status: str = Field(default="success", description="Request status")
-    total_tokens: Optional[int] = Field(None, description="Number of tokens processed")
+    model_name: str = Field(
+        ...,
+        max_length=200,
+        # The company prefix is stored in company_name, String(100)
+        pattern=r"^(?s:[^_]{0,100}_.*|[^_]*)$",
+        description="Model name in format: company_name_model_type"
+    )
+    predicted_label: Optional[str] = Field(None, max_length=500, description="Model prediction result")
+    processing_time_ms: int = Field(default=0, le=_MAX_INT4, description="Processing time in milliseconds")
+    timestamp: Optional[str] = Field(None, max_length=100, description="Request timestamp")
+    status: str = Field(default="success", max_length=50, description="Request status")
+    total_tokens: Optional[int] = Field(None, le=_MAX_INT4, description="Number of tokens processed")
     user_identifier: Optional[str] = Field(None, description="Optional user identifier")
     additional_metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
@@ -35,12 +51,22 @@ class BillingResponse(BaseModel):
     log_id: Optional[int] = None
     processed: bool = False
 
+# Only the fields billing_row reads are dumped; additional_metadata can be an
+# arbitrarily nested payload that would otherwise be copied for nothing
+_BILLING_ROW_FIELDS = {"model_name", "predicted_label", "processing_time_ms", "timestamp", "status", "total_tokens"}
+
+def _billing_row(billing_data: BillingData, client_ip: str, user_agent: str, log_id: Optional[int] = None) -> Dict[str, Any]:
+    row = APIUsageLog.billing_row(billing_data.model_dump(include=_BILLING_ROW_FIELDS))
+    row.update(client_ip=client_ip, user_agent=user_agent)
+    if log_id is not None:
+        row["id"] = log_id
+    return row
+
 # --- Main Billing Endpoint ---
 @router.post("/billing", response_model=BillingResponse)
 async def receive_billing_data(
     billing_data: BillingData,
     request: Request,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -54,35 +80,22 @@ async def receive_billing_data(
         logger.info(f"Received billing data for model: {billing_data.model_name}")
         
         # Extract client information
-        client_ip = request.client.host
-        if request.headers.get("X-Forwarded-For"):
-            client_ip = request.headers.get("X-Forwarded-For").split(",")[0].strip()
-        
+        client_ip = request.state.client_ip
         user_agent = request.headers.get("User-Agent", "")
         
-        # Create API usage log entry
-        log_entry = APIUsageLog.create_from_billing_data(billing_data.dict())
-        log_entry.client_ip = client_ip
-        log_entry.user_agent = user_agent
-        
-        # Add to database
-        db.add(log_entry)
-        await db.commit()
-        await db.refresh(log_entry)
-        
-        logger.info(f"Created log entry with ID: {log_entry.id} for company: {log_entry.company_name}")
+        # The row is written by the usage log writer together with other
+        # queued rows; its id is reserved now so it can be returned
+        [log_id] = await reserve_usage_log_ids(db)
+        row = _billing_row(billing_data, client_ip, user_agent, log_id)
+        if not enqueue_usage_log(row):
+            await write_usage_logs([row])
         
-        # Process billing entry in background to map user and model
-        background_tasks.add_task(
-            process_billing_entry_async, 
-            log_entry.id, 
-            billing_data.model_name
-        )
+        logger.info(f"Queued log entry with ID: {log_id} for company: {row['company_name']}")
         
         return BillingResponse(
             success=True,
             message="Billing data received successfully",
-            log_id=log_entry.id,
+            log_id=log_id,
             processed=False
         )
         
@@ -105,28 +118,20 @@ async def receive_batch_billing_data(
     Useful for models that batch their billing data.
     """
     try:
-        log_ids = []
-        client_ip = request.client.host
+        client_ip = request.state.client_ip
         user_agent = request.headers.get("User-Agent", "")
         
-        for billing_data in billing_batch:
-            # Create log entry
-            log_entry = APIUsageLog.create_from_billing_data(billing_data.dict())
-            log_entry.client_ip = client_ip
-            log_entry.user_agent = user_agent
-            
-            db.add(log_entry)
-            log_ids.append(log_entry.id)
+        # One multi-row INSERT; ids come back in the order of the batch
+        rows = [_billing_row(billing_data, client_ip, user_agent) for billing_data in billing_batch]
+        stmt = insert(APIUsageLog).returning(APIUsageLog.id, sort_by_parameter_order=True)
+        result = await db.execute(stmt, rows)
+        log_ids = result.scalars().all()
         
         await db.commit()
+        await record_usage_logged(len(billing_batch))
         
-        # Process each entry in background
-        for i, billing_data in enumerate(billing_batch):
-            background_tasks.add_task(
-                process_billing_entry_async,
-                log_ids[i],
-                billing_data.model_name
-            )
+        # Process the whole batch in a single background task
+        background_tasks.add_task(process_billing_entries_async, log_ids)
         
         logger.info(f"Processed batch of {len(billing_batch)} billing entries")
         
@@ -182,101 +187,136 @@ async def get_recent_billing_by_company(
     Get recent billing entries for a specific company.
     Useful for debugging and monitoring.
     """
+    # Only the listed columns are read, with the cost already as float8
     stmt = (
-        select(APIUsageLog)
+        select(
+            APIUsageLog.id.label("log_id"),
+            APIUsageLog.raw_model_name.label("model_name"),
+            APIUsageLog.status,
+            func.coalesce(cast(APIUsageLog.total_cost, Float), 0).label("cost"),
+            APIUsageLog.billing_processed.label("processed"),
+            APIUsageLog.created_at
+        )
         .where(APIUsageLog.company_name == company_name.lower())
         .order_by(APIUsageLog.created_at.desc())
         .limit(limit)
     )
     result = await db.execute(stmt)
-    log_entries = result.scalars().all()
+    log_entries = [dict(row) for row in result.mappings()]
     
     return {
         "company_name": company_name,
-        "recent_entries": [
-            {
-                "log_id": entry.id,
-                "model_name": entry.raw_model_name,
-                "status": entry.status,
-                "cost": float(entry.total_cost) if entry.total_cost else 0,
-                "processed": entry.billing_processed,
-                "created_at": entry.created_at.isoformat()
-            }
-            for entry in log_entries
-        ],
+        "recent_entries": log_entries,
         "total_found": len(log_entries)
     }
 
 # --- Background Processing Function ---
-async def process_billing_entry_async(log_id: int, model_name: str):
+async def process_billing_entries_async(log_ids: List[int]):
     """
-    Background task to process billing entry:
+    Background task to process a batch of billing entries in one session:
     1. Map company name to user
     2. Map model name to AI model
     3. Calculate final costs
     4. Mark as processed
+    Entries left unprocessed (e.g. when the commit fails) are picked up again
+    by the periodic billing processor.
     """
     from app.database import async_session
     
+    if not log_ids:
+        return
+    
     async with async_session() as db:
-        try:
-            # Get the log entry
-            stmt = select(APIUsageLog).where(APIUsageLog.id == log_id)
-            result = await db.execute(stmt)
-            log_entry = result.scalar_one_or_none()
-            
-            if not log_entry:
-                logger.error(f"Log entry {log_id} not found")
-                return
-            
-            # Find user by company name
-            if log_entry.company_name:
-                user_stmt = select(User).where(
-                    User.organization_name.ilike(f"%{log_entry.company_name}%")
-                )
-                user_result = await db.execute(user_stmt)
-                user = user_result.scalar_one_or_none()
+        # Entries, their candidate users and candidate models in one query;
+        # an entry matching several users or models comes back once per match
+        stmt = (
+            select(APIUsageLog, User, AIModel)
+            .select_from(APIUsageLog)
+            .outerjoin(User, and_(
+                APIUsageLog.company_name != "",
+                User.organization_name.ilike(func.concat("%", APIUsageLog.company_name, "%"))
+            ))
+            .outerjoin(AIModel, AIModel.name.ilike(func.concat("%", APIUsageLog.raw_model_name, "%")))
+            .where(APIUsageLog.id.in_(log_ids))
+        )
+        matches: Dict[int, Tuple[APIUsageLog, Set[User], Set[AIModel]]] = {}
+        for log_entry, user, ai_model in (await db.execute(stmt)).all():
+            _, users, models = matches.setdefault(log_entry.id, (log_entry, set(), set()))
+            if user is not None:
+                users.add(user)
+            if ai_model is not None:
+                models.add(ai_model)
+        log_entries = [log_entry for log_entry, _, _ in matches.values()]
+        missing = set(log_ids) - set(matches)
+        if missing:
+            logger.error(f"Log entries {sorted(missing)} not found")
+        
+        failed_entries = []
+        
+        for log_entry, users, models in matches.values():
+            try:
+                if len(users) > 1:
+                    raise ValueError(f"Multiple users found for company: {log_entry.company_name}")
+                if len(models) > 1:
+                    raise ValueError(f"Multiple AI models found matching: {log_entry.raw_model_name}")
+                user = next(iter(users), None)
+                ai_model = next(iter(models), None)
+                
+                # Map user by company name
+                if log_entry.company_name:
+                    if user:
+                        await BillingProcessor.attribute_to_user(log_entry, user.id, db)
+                        logger.info(f"Mapped log {log_entry.id} to user {user.id} ({user.organization_name})")
+                    else:
+                        log_entry.error_message = f"No user found for company: {log_entry.company_name}"
+                        logger.warning(f"No user found for company: {log_entry.company_name}")
                 
-                if user:
-                    log_entry.user_id = user.id
-                    logger.info(f"Mapped log {log_id} to user {user.id} ({user.organization_name})")
+                # Map AI model by model name pattern
+                if ai_model:
+                    log_entry.model_id = ai_model.id
+                    # Recalculate cost based on actual model pricing
+                    model_pricing = {
+                        'cost_per_token': ai_model.input_cost_per_1k_tokens / 1000,
+                        'cost_per_request': ai_model.request_cost
+                    }
+                    log_entry.calculate_cost(model_pricing)
+                    logger.info(f"Mapped log {log_entry.id} to model {ai_model.id} ({ai_model.name})")
                 else:
-                    log_entry.error_message = f"No user found for company: {log_entry.company_name}"
-                    logger.warning(f"No user found for company: {log_entry.company_name}")
-            
-            # Find AI model by model name pattern
-            model_stmt = select(AIModel).where(
-                AIModel.name.ilike(f"%{log_entry.raw_model_name}%")
-            )
-            model_result = await db.execute(model_stmt)
-            ai_model = model_result.scalar_one_or_none()
-            
-            if ai_model:
-                log_entry.model_id = ai_model.id
-                # Recalculate cost based on actual model pricing
-                model_pricing = {
-                    'cost_per_token': ai_model.input_cost_per_1k_tokens / 1000,
-                    'cost_per_request': ai_model.request_cost
-                }
-                log_entry.calculate_cost(model_pricing)
-                logger.info(f"Mapped log {log_id} to model {ai_model.id} ({ai_model.name})")
-            else:
-                log_entry.error_message = f"No AI model found matching: {log_entry.raw_model_name}"
-                logger.warning(f"No AI model found matching: {log_entry.raw_model_name}")
-            
-            # Mark as processed
-            log_entry.mark_as_processed(log_entry.user_id, log_entry.model_id)
-            
+                    log_entry.error_message = f"No AI model found matching: {log_entry.raw_model_name}"
+                    logger.warning(f"No AI model found matching: {log_entry.raw_model_name}")
+                
+                # Mark as processed
+                log_entry.mark_as_processed(log_entry.user_id, log_entry.model_id)
+                
+            except Exception as e:
+                logger.error(f"Error processing billing entry {log_entry.id}: {str(e)}")
+                # Update log entry with error
+                if not log_entry.retry_count:
+                    failed_entries.append(log_entry)
+                log_entry.error_message = str(e)
+                log_entry.retry_count = (log_entry.retry_count or 0) + 1
+        
+        try:
             await db.commit()
-            logger.info(f"Successfully processed billing entry {log_id}")
-            
         except Exception as e:
-            logger.error(f"Error processing billing entry {log_id}: {str(e)}")
-            # Update log entry with error
-            if log_entry:
-                log_entry.error_message = str(e)
-                log_entry.retry_count += 1
-                await db.commit()
+            await db.rollback()
+            logger.error(f"Failed to save {len(log_entries)} processed billing entries: {str(e)}")
+            return
+        
+        for log_entry in log_entries:
+            if log_entry.billing_processed:
+                await record_usage_processed(
+                    log_entry.created_at, log_entry.processed_at, log_entry.error_message is not None,
+                    log_entry.retry_count
+                )
+        for log_entry in failed_entries:
+            await record_usage_failed()
+        logger.info(f"Processed {len(log_entries)} billing entries")
+
+@on_usage_logs_written
+async def process_written_billing_entries(rows: List[Dict[str, Any]]):
+    """Map the receiver rows of a written batch to their users and models"""
+    await process_billing_entries_async([row["id"] for row in rows if "raw_model_name" in row])
 
 # --- Health Check ---
 @router.get("/billing/health")
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -5,8 +6,7 @@ from sqlalchemy.future import select
 import stripe
 from pydantic import BaseModel
 
-from app.api.deps import get_db, get_current_user
-from app.models.user import User
+from app.api.deps import get_db, get_current_user_id
 from app.models.billing_summary import MonthlyBillingSummary
 
 router = APIRouter()
@@ -22,11 +22,11 @@ class CreateCheckoutSessionRequest(BaseModel):
 async def create_checkout_session(
     payload: CreateCheckoutSessionRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user_id: int = Depends(get_current_user_id)
 ):
     stmt = select(MonthlyBillingSummary).where(
         MonthlyBillingSummary.id == payload.bill_id,
-        MonthlyBillingSummary.user_id == current_user.id,
+        MonthlyBillingSummary.user_id == current_user_id,
         MonthlyBillingSummary.is_paid == False
     )
     result = await db.execute(stmt)
@@ -36,7 +36,10 @@ async def create_checkout_session(
         raise HTTPException(status_code=404, detail="Unpaid bill not found for this user")
 
     try:
-        checkout_session = stripe.checkout.Session.create(
+        # The Stripe client is synchronous; run the HTTP call in a worker
+        # thread so the event loop keeps serving other requests meanwhile
+        checkout_session = await asyncio.to_thread(
+            stripe.checkout.Session.create,
             payment_method_types=['card'],
             line_items=[
                 {
@@ -45,7 +48,7 @@ async def create_checkout_session(
                         'product_data': {
                             'name': f'Jupiter AI - Invoice for {bill.month}/{bill.year}',
                         },
-                        'unit_amount': int(bill.total_cost * 100),
+                        'unit_amount': bill.total_cost_cents,
                     },
                     'quantity': 1,
                 },
@@ -1,100 +1,148 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, cast, Date, case
-from datetime import datetime, timedelta
+from sqlalchemy import func, cast, Date, DateTime, Integer, JSON, bindparam, case, literal_column, union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from datetime import datetime, time, timedelta
 
-from app.api.deps import get_db, get_current_user
-from app.models.user import User
+from app.api.deps import get_db, get_current_user_id
 from app.models.api_usage_log import APIUsageLog
 from app.models.ai_model import AIModel
+from app.models.usage_daily_rollup import usage_daily_rollup
+from app.utils.cache import cached
 
 router = APIRouter()
 
-@router.get("/")
-async def get_dashboard(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
-    start_of_month = today_start.replace(day=1)
+# The dashboard statements are built once at import; each request only binds
+# the user (and, for the history, its date window), and SQLAlchemy reuses
+# the cached compilation
+_user_id = bindparam("user_id", type_=Integer)
+# Today and this month are bounded by Postgres' clock (in UTC) rather than
+# per-request Python datetimes
+_utc_now = func.timezone("UTC", func.now())
 
-    # Corrected CASE statement syntax
-    success_rate_query = func.coalesce(
-        func.sum(case((APIUsageLog.status == 'success', 1), else_=0)) / func.count(), 
-        0.0
-    )
+# Corrected CASE statement syntax
+_success_rate = func.coalesce(
+    func.sum(case((APIUsageLog.status == 'success', 1), else_=0)) / func.count(), 
+    0.0
+)
 
-    stmt = (
-        select(
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_cost).label("total_cost"),
-            func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
-            success_rate_query.label("success_rate")
-        )
-        .where(APIUsageLog.user_id == current_user.id)
-        .where(APIUsageLog.created_at >= today_start)
+_daily_stats = (
+    select(
+        func.count().label("total_requests"),
+        func.sum(APIUsageLog.total_cost).label("total_cost"),
+        func.avg(APIUsageLog.response_time_ms).label("avg_response_time"),
+        _success_rate.label("success_rate")
     )
+    .where(APIUsageLog.user_id == _user_id)
+    .where(APIUsageLog.created_at >= func.date_trunc("day", _utc_now))
+    .cte("daily")
+)
 
-    result = await db.execute(stmt)
-    daily_stats = result.first()
+# Model-wise summary for the current month
+_model_wise = (
+    select(
+        AIModel.name.label("model_name"),
+        func.count().label("total_requests"),
+        func.coalesce(func.sum(APIUsageLog.total_tokens), 0).label("total_tokens"),
+        func.coalesce(func.sum(APIUsageLog.total_cost), 0).label("total_cost")
+    )
+    .join(AIModel, AIModel.id == APIUsageLog.model_id)
+    .where(
+        APIUsageLog.user_id == _user_id,
+        APIUsageLog.created_at >= func.date_trunc("month", _utc_now)
+    )
+    .group_by(AIModel.name)
+    .cte("model_wise")
+)
 
-    # Model-wise summary for the current month
-    model_wise_stmt = (
-        select(
-            AIModel.name.label("model_name"),
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_tokens).label("total_tokens"),
-            func.sum(APIUsageLog.total_cost).label("total_cost")
+# Both aggregates in one round trip; the per-model rows are folded into a
+# JSON array by Postgres
+_DASHBOARD_STMT = select(
+    _daily_stats.c.total_requests,
+    _daily_stats.c.total_cost,
+    _daily_stats.c.avg_response_time,
+    _daily_stats.c.success_rate,
+    select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        literal_column("'model_name'"), _model_wise.c.model_name,
+                        literal_column("'total_requests'"), _model_wise.c.total_requests,
+                        literal_column("'total_tokens'"), _model_wise.c.total_tokens,
+                        literal_column("'total_cost'"), _model_wise.c.total_cost
+                    ),
+                    _model_wise.c.model_name
+                )
+            ),
+            literal_column("'[]'::json"),
+            type_=JSON
         )
-        .join(AIModel, AIModel.id == APIUsageLog.model_id)
-        .where(
-            APIUsageLog.user_id == current_user.id,
-            APIUsageLog.created_at >= start_of_month
-        )
-        .group_by(AIModel.name)
-        .order_by(AIModel.name)
+    ).scalar_subquery().label("model_wise_summary")
+).select_from(_daily_stats)
+
+# Usage history: finished days come from the usage_daily_rollup view, so
+# only today's rows are aggregated from api_usage_logs per request. Today is
+# a plain created_at range so ix_api_usage_logs_user_id_created_at serves it.
+_usage_date = cast(func.date_trunc("day", APIUsageLog.created_at), Date)
+_today_start = bindparam("today_start", type_=DateTime)
+_past_days = (
+    select(
+        usage_daily_rollup.c.day.label("usage_date"),
+        func.sum(usage_daily_rollup.c.requests).label("total_requests"),
+        func.sum(usage_daily_rollup.c.cost).label("total_cost")
     )
-    model_wise_result = await db.execute(model_wise_stmt)
-    model_wise_summary = model_wise_result.fetchall()
+    .where(usage_daily_rollup.c.user_id == _user_id)
+    .where(usage_daily_rollup.c.day >= bindparam("start_date", type_=Date))
+    .where(usage_daily_rollup.c.day < cast(_today_start, Date))
+    .group_by(usage_daily_rollup.c.day)
+)
+_today = (
+    select(
+        _usage_date.label("usage_date"),
+        func.count().label("total_requests"),
+        func.sum(APIUsageLog.total_cost).label("total_cost")
+    )
+    .where(APIUsageLog.user_id == _user_id)
+    .where(APIUsageLog.created_at >= _today_start)
+    .group_by(_usage_date)
+)
+_USAGE_HISTORY_STMT = union_all(_past_days, _today)
+
+@router.get("/")
+@cached("dashboard", "summary", ttl=60)
+async def get_dashboard(
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    result = await db.execute(_DASHBOARD_STMT, {"user_id": current_user_id})
+    daily_stats = result.first()
 
     return {
         "total_requests": daily_stats.total_requests or 0,
         "total_cost": float(daily_stats.total_cost or 0),
         "avg_response_time": float(daily_stats.avg_response_time or 0),
         "success_rate": float(daily_stats.success_rate or 0),
-        "model_wise_summary": [
-            {
-                "model_name": row.model_name,
-                "total_requests": row.total_requests or 0,
-                "total_tokens": row.total_tokens or 0,
-                "total_cost": float(row.total_cost or 0)
-            } for row in model_wise_summary
-        ]
+        "model_wise_summary": daily_stats.model_wise_summary
     }
 
 @router.get("/usage-history")
+# Past days no longer change, so the history can be cached for longer
+@cached("dashboard", "usage-history", ttl=300)
 async def get_usage_history(
     days: int = Query(7, ge=1, le=30),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user_id: int = Depends(get_current_user_id)
 ):
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=days - 1)
 
-    stmt = (
-        select(
-            cast(APIUsageLog.created_at, Date).label("usage_date"),
-            func.count().label("total_requests"),
-            func.sum(APIUsageLog.total_cost).label("total_cost")
-        )
-        .where(APIUsageLog.user_id == current_user.id)
-        .where(cast(APIUsageLog.created_at, Date).between(start_date, end_date))
-        .group_by(cast(APIUsageLog.created_at, Date))
-        .order_by(cast(APIUsageLog.created_at, Date))
-    )
-
-    result = await db.execute(stmt)
+    result = await db.execute(_USAGE_HISTORY_STMT, {
+        "user_id": current_user_id,
+        "start_date": start_date,
+        "today_start": datetime.combine(end_date, time.min)
+    })
     rows = result.all()
 
     usage_map = { (start_date + timedelta(days=i)).isoformat(): {"total_requests": 0, "total_cost": 0.0} for i in range(days) }
@@ -105,4 +153,4 @@ async def get_usage_history(
             "total_cost": float(row.total_cost or 0)
         }
 
-    return [{"usage_date": date, **data} for date, data in usage_map.items()]
\ No newline at end of file
+    return [{"usage_date": date, **data} for date, data in usage_map.items()]
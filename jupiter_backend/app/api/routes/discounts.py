@@ -317,8 +317,6 @@ async def enroll_in_discount(
     )
     
     db.add(enrollment)
-    await db.commit()
-    await db.refresh(enrollment)
     
     # Create success notification
     notification = UserNotification(
@@ -330,6 +328,8 @@ async def enroll_in_discount(
         is_popup_shown=True  # This will trigger a popup
     )
     
+    # The enrollment and its notification are saved together; the commit
+    # flushes the INSERTs, which fills in enrollment.id
     db.add(notification)
     await db.commit()
     
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from fastapi import APIRouter, Request, Depends, HTTPException, Header
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -44,7 +45,7 @@ async def stripe_webhook(
 
         # Retrieve full invoice to get the URL
         try:
-            invoice = stripe.Invoice.retrieve(invoice_id)
+            invoice = await asyncio.to_thread(stripe.Invoice.retrieve, invoice_id)
             hosted_invoice_url = invoice.hosted_invoice_url
         except Exception as e:
             hosted_invoice_url = None
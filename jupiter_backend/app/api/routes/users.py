@@ -6,7 +6,7 @@ from sqlalchemy.orm import selectinload
 from typing import List
 from pydantic import BaseModel
 
-from app.api.deps import get_db, get_current_user
+from app.api.deps import get_db, get_current_user, get_current_user_id
 from app.models.user import User
 from app.models.subscription_tier import SubscriptionTier
 from app.models.ai_model import AIModel
@@ -41,14 +41,14 @@ async def get_current_user_profile(
 
 @router.get("/my-models", response_model=List[AssignedModel])
 async def get_my_assigned_models(
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Get all AI models assigned to the current user"""
     stmt = (
         select_new(AIModel, UserModelAccess)
         .join(UserModelAccess, AIModel.id == UserModelAccess.model_id)
-        .where(UserModelAccess.user_id == current_user.id)
+        .where(UserModelAccess.user_id == current_user_id)
         .where(UserModelAccess.is_active == True)
         .where(AIModel.status == 'active')  # Only show active models
     )
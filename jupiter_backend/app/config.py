@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import EmailStr
+from typing import Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str
@@ -7,6 +8,37 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Connection pool of the SQLAlchemy engine behind every request session
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Seconds to wait for a free connection before failing the request, so an
+    # exhausted pool surfaces as errors instead of requests queuing indefinitely
+    DB_POOL_TIMEOUT_SECONDS: int = 5
+
+    # Raw asyncpg pool used by read-only admin endpoints
+    READ_POOL_MIN_SIZE: int = 10
+    READ_POOL_MAX_SIZE: int = 50
+    READ_POOL_STATEMENT_CACHE_SIZE: int = 1024
+
+    # Optional Redis used for response caching; caching is disabled when unset
+    REDIS_URL: Optional[str] = None
+
+    # How often the usage_daily_rollup materialized view is refreshed
+    USAGE_ROLLUP_REFRESH_SECONDS: int = 300
+
+    # How often buffered API key last_used_at timestamps are written
+    API_KEY_USAGE_FLUSH_SECONDS: int = 60
+
+    # Batched writes of usage logs posted to /api_log
+    USAGE_LOG_QUEUE_SIZE: int = 10000
+    USAGE_LOG_BATCH_SIZE: int = 500
+    USAGE_LOG_BATCH_WAIT_SECONDS: float = 0.05
+
+    # Comma-separated addresses of reverse proxies whose X-Forwarded-For and
+    # X-Real-IP headers are trusted when resolving the client IP
+    TRUSTED_PROXIES: str = "127.0.0.1,::1"
+
     # Email settings
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
@@ -3,7 +3,7 @@ from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.models.api_usage_log import APIUsageLog
-from app.models.billing_summary import MonthlyBillingSummary
+from app.models.billing_summary import MonthlyBillingSummary, to_cents
 
 async def generate_monthly_bills(db: AsyncSession):
     today = datetime.utcnow()
@@ -41,7 +41,7 @@ async def generate_monthly_bills(db: AsyncSession):
 
         subscription_cost = 0
         if user.subscription_tier:
-            subscription_cost = float(user.subscription_tier.monthly_cost or 0)
+            subscription_cost = user.subscription_tier.monthly_cost or 0
 
         total_cost = usage_cost + subscription_cost
         
@@ -57,6 +57,7 @@ async def generate_monthly_bills(db: AsyncSession):
             subscription_cost=subscription_cost,
             total_discount=total_discount,
             total_cost=total_cost,
+            total_cost_cents=to_cents(total_cost),
             payment_due_date=payment_due_date
         )
         db.add(billing)
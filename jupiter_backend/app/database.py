@@ -1,12 +1,58 @@
+import asyncio
+import json
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import declarative_base
 from app.config import settings
 
 # engine = create_async_engine(settings.DATABASE_URL, echo=True)
-engine = create_async_engine(settings.DATABASE_URL)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    # Recycle connections before server/proxy idle timeouts and check them on checkout
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=True
+)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 Base = declarative_base()
 
+# Raw asyncpg pool for hot read-only endpoints; writes stay on the ORM session
+_read_pool: Optional[asyncpg.Pool] = None
+_read_pool_lock = asyncio.Lock()
+
+async def _init_read_connection(conn: asyncpg.Connection):
+    # Decode JSON columns to Python objects like SQLAlchemy's JSON type does
+    await conn.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+async def get_read_pool() -> asyncpg.Pool:
+    global _read_pool
+    if _read_pool is None:
+        async with _read_pool_lock:
+            if _read_pool is None:
+                dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+                _read_pool = await asyncpg.create_pool(
+                    dsn.render_as_string(hide_password=False),
+                    min_size=settings.READ_POOL_MIN_SIZE,
+                    max_size=settings.READ_POOL_MAX_SIZE,
+                    statement_cache_size=settings.READ_POOL_STATEMENT_CACHE_SIZE,
+                    init=_init_read_connection
+                )
+    return _read_pool
+
+async def close_read_pool():
+    global _read_pool
+    if _read_pool is not None:
+        await _read_pool.close()
+        _read_pool = None
+
 async def init_db():
     async with engine.begin() as conn:
         # Import all models here before calling create_all
@@ -16,7 +62,8 @@ async def init_db():
                 api_usage_log, 
                 billing_summary, 
                 ai_model, 
-                user
+                user,
+                monthly_request_count
             )
             print("✅ Core models imported successfully")
         except ImportError as e:
@@ -39,6 +86,24 @@ async def init_db():
                 print(f"⚠️  Warning: Could not import {model_name}: {e}")
                 continue
         
+        # Trigram indexes on the models depend on this extension
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
         print("🔄 Creating database tables...")
         await conn.run_sync(Base.metadata.create_all)
-        print("✅ Database tables created successfully")
\ No newline at end of file
+        print("✅ Database tables created successfully")
+        
+        # Reporting views built on top of the tables above
+        from app.models.usage_daily_rollup import USAGE_DAILY_ROLLUP_DDL
+        for statement in USAGE_DAILY_ROLLUP_DDL:
+            await conn.execute(text(statement))
+        print("✅ Reporting views created successfully")
+        
+        # Database functions used by the API
+        from app.models.registration import REGISTRATION_DDL
+        for statement in REGISTRATION_DDL:
+            await conn.execute(text(statement))
+        from app.models.usage_cost import USAGE_COST_DDL
+        for statement in USAGE_COST_DDL:
+            await conn.execute(text(statement))
+        print("✅ Database functions created successfully")
\ No newline at end of file
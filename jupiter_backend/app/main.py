@@ -4,7 +4,17 @@ from contextlib import asynccontextmanager
 import logging
 import asyncio
 
-from app.database import init_db
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import init_db, close_read_pool, engine, async_session
+from app.models.usage_daily_rollup import REFRESH_USAGE_DAILY_ROLLUP
+from app.utils.cache import close_redis
+from app.utils.auth_token import AuthTokenMiddleware
+from app.utils.client_ip import ClientIPMiddleware
+from app.utils.usage_log_queue import flush_usage_logs, run_usage_log_writer, stop_usage_log_writer
+from app.utils.responses import DecimalORJSONResponse
+from app.api.deps import flush_api_key_usage
 from app.api.routes import router as api_router
 from app.api.admin_routes import router as admin_router
 from app.api.routes.stripe_webhooks import router as webhook_router
@@ -30,17 +40,36 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(background_billing_processor())
     logger.info("Background billing processor started")
     
+    # Keep the daily usage rollup used by the admin dashboards fresh
+    asyncio.create_task(background_rollup_refresher())
+    logger.info("Usage rollup refresher started")
+    
+    # Persist API key last_used_at timestamps buffered by the auth dependency
+    asyncio.create_task(background_api_key_usage_flusher())
+    logger.info("API key usage flusher started")
+    
+    # Write usage logs queued by POST /api_log in batches
+    usage_log_writer = asyncio.create_task(run_usage_log_writer())
+    logger.info("Usage log writer started")
+    
     yield
     
     # Shutdown events
     logger.info("Shutting down JupiterBrains Billing Platform...")
+    await stop_usage_log_writer(usage_log_writer)
+    await flush_usage_logs()
+    await flush_api_key_usage()
+    await close_read_pool()
+    await close_redis()
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="JupiterBrains Billing Platform",
         description="Multi-tier B2B SaaS billing platform with AI model usage tracking",
         version="1.0.0",
-        lifespan=lifespan
+        lifespan=lifespan,
+        # orjson encodes responses in C; Decimal values become JSON numbers
+        default_response_class=DecimalORJSONResponse
     )
 
     # CORS Middleware
@@ -50,6 +79,8 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Pagination cursors and ETags travel in response headers
+        expose_headers=["X-Next-Cursor", "X-Next-After-Assigned-At", "X-Next-After-Id", "ETag"],
     )
 
     # Billing Request Logging Middleware
@@ -62,11 +93,7 @@ def create_app() -> FastAPI:
         
         # Log billing requests
         if request.url.path.startswith("/api/billing"):
-            client_ip = request.client.host
-            if request.headers.get("X-Forwarded-For"):
-                client_ip = request.headers.get("X-Forwarded-For").split(",")[0].strip()
-            
-            logger.info(f"Billing request: {request.method} {request.url.path} from {client_ip}")
+            logger.info(f"Billing request: {request.method} {request.url.path} from {request.state.client_ip}")
         
         response = await call_next(request)
         
@@ -77,6 +104,14 @@ def create_app() -> FastAPI:
         
         return response
 
+    # Verifies the bearer JWT once per request for the auth dependencies
+    app.add_middleware(AuthTokenMiddleware)
+
+    # Added last so it runs first: resolves request.state.client_ip for the
+    # middleware above and the API key IP check. It is the only place
+    # forwarded headers are parsed; uvicorn runs with proxy headers disabled.
+    app.add_middleware(ClientIPMiddleware)
+
     # Include routers
     app.include_router(api_router)
     app.include_router(admin_router)
@@ -130,11 +165,13 @@ async def background_billing_processor():
             if unprocessed_entries:
                 logger.info(f"Processing {len(unprocessed_entries)} unprocessed billing entries")
                 
-                for entry in unprocessed_entries:
-                    try:
-                        await BillingProcessor.process_billing_entry(entry.id)
-                    except Exception as e:
-                        logger.error(f"Failed to process billing entry {entry.id}: {str(e)}")
+                # One session (and connection) for the whole batch
+                async with async_session() as db:
+                    for entry in unprocessed_entries:
+                        try:
+                            await BillingProcessor.process_billing_entry(entry.id, db)
+                        except Exception as e:
+                            logger.error(f"Failed to process billing entry {entry.id}: {str(e)}")
             
             # Every 5 minutes, retry failed entries
             if asyncio.get_event_loop().time() % 300 < 30:  # Rough 5-minute interval
@@ -148,6 +185,34 @@ async def background_billing_processor():
             # Sleep a bit longer if there's an error to avoid rapid retries
             await asyncio.sleep(60)
 
+async def background_rollup_refresher():
+    """
+    Background task that periodically refreshes the usage_daily_rollup
+    materialized view read by the admin usage dashboards.
+    """
+    while True:
+        try:
+            await asyncio.sleep(settings.USAGE_ROLLUP_REFRESH_SECONDS)
+            
+            async with engine.begin() as conn:
+                await conn.execute(text(REFRESH_USAGE_DAILY_ROLLUP))
+            
+        except Exception as e:
+            logger.error(f"Error refreshing usage rollup: {str(e)}")
+
+async def background_api_key_usage_flusher():
+    """
+    Background task that periodically writes buffered API key last_used_at
+    timestamps in a single UPDATE.
+    """
+    while True:
+        try:
+            await asyncio.sleep(settings.API_KEY_USAGE_FLUSH_SECONDS)
+            await flush_api_key_usage()
+            
+        except Exception as e:
+            logger.error(f"Error flushing API key usage: {str(e)}")
+
 # Create the app instance
 app = create_app()
 
@@ -163,11 +228,12 @@ async def startup_billing_processing():
         
         if unprocessed:
             logger.info(f"Found {len(unprocessed)} unprocessed entries, processing...")
-            for entry in unprocessed[:10]:  # Process first 10 on startup
-                try:
-                    await BillingProcessor.process_billing_entry(entry.id)
-                except Exception as e:
-                    logger.error(f"Startup processing failed for entry {entry.id}: {str(e)}")
+            async with async_session() as db:
+                for entry in unprocessed[:10]:  # Process first 10 on startup
+                    try:
+                        await BillingProcessor.process_billing_entry(entry.id, db)
+                    except Exception as e:
+                        logger.error(f"Startup processing failed for entry {entry.id}: {str(e)}")
         else:
             logger.info("No unprocessed billing entries found")
             
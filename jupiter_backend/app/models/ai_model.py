@@ -13,6 +13,7 @@ from sqlalchemy import (
     Integer,
     Numeric,
     String,
+    Index,
     Text,
     func,
 )
@@ -50,6 +51,15 @@ class AIModel(Base):
     """
 
     __tablename__ = "ai_models"
+    __table_args__ = (
+        # Billing entries are matched to models with name ILIKE '%<raw model name>%'
+        Index(
+            "ix_ai_models_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(255), nullable=False)
@@ -1,9 +1,29 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Numeric, Text, ForeignKey, JSON, func
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Numeric, Text, ForeignKey, JSON, Index, func, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 
+# Columns carried by the covering indexes so usage aggregations over a
+# created_at window can be answered with index-only scans
+_USAGE_AGGREGATE_COLUMNS = ["total_tokens", "total_cost", "response_time_ms", "status", "billing_processed"]
+
 class APIUsageLog(Base):
     __tablename__ = "api_usage_logs"
+    __table_args__ = (
+        Index("ix_api_usage_logs_created_at_brin", "created_at", postgresql_using="brin"),
+        Index("ix_api_usage_logs_created_at_user_id", "created_at", "user_id",
+              postgresql_include=_USAGE_AGGREGATE_COLUMNS),
+        Index("ix_api_usage_logs_created_at_model_id", "created_at", "model_id",
+              postgresql_include=_USAGE_AGGREGATE_COLUMNS),
+        Index("ix_api_usage_logs_created_at_company_name", "created_at", "company_name",
+              postgresql_include=["total_cost", "raw_model_name", "billing_processed"]),
+        # Per-user monthly request count in log_api_usage (user_id = ? AND created_at >= ?)
+        Index("ix_api_usage_logs_user_id_created_at", "user_id", "created_at"),
+        # Recent entries of one company (company_name = ? ORDER BY created_at DESC)
+        Index("ix_api_usage_logs_company_name_created_at", "company_name", "created_at"),
+        # Pending entries for the billing processor, oldest first
+        Index("ix_api_usage_logs_unprocessed_created_at", "created_at",
+              postgresql_where=text("NOT billing_processed")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Can be null initially
@@ -53,10 +73,10 @@ class APIUsageLog(Base):
         if not self.raw_model_name:
             return None
             
-        # Split by underscore and take the first part as company name
-        parts = self.raw_model_name.split('_')
-        if len(parts) >= 2:
-            self.company_name = parts[0].lower().strip()
+        # Take the part before the first underscore as company name
+        company, separator, _ = self.raw_model_name.partition('_')
+        if separator:
+            self.company_name = company.lower().strip()
             return self.company_name
         return None
 
@@ -104,6 +124,31 @@ class APIUsageLog(Base):
             self.status == "success"
         )
 
+    @classmethod
+    def billing_row(cls, billing_data: dict) -> dict:
+        """
+        Column values for a log entry built from incoming billing data, without
+        creating an ORM object, so batches can go straight to a Core INSERT.
+        Company name and initial cost follow extract_company_name and the
+        fallback pricing in calculate_cost.
+        """
+        raw_model_name = billing_data.get("model_name", "")
+        company, separator, _ = raw_model_name.partition('_')
+        total_tokens = billing_data.get("total_tokens", 0)
+        original_cost = float(total_tokens * 0.0001) if total_tokens else 0.01
+        return {
+            "raw_model_name": raw_model_name,
+            "company_name": company.lower().strip() if separator else None,
+            "predicted_label": billing_data.get("predicted_label", ""),
+            "response_time_ms": billing_data.get("processing_time_ms", 0),
+            "status": billing_data.get("status", "success"),
+            "request_timestamp": billing_data.get("timestamp", ""),
+            "total_tokens": total_tokens,
+            "original_cost": original_cost,
+            "applied_discount": 0,
+            "total_cost": original_cost
+        }
+
     @classmethod
     def create_from_billing_data(cls, billing_data: dict):
         """
@@ -117,19 +162,4 @@ class APIUsageLog(Base):
             "status": "success"
         }
         """
-        log_entry = cls(
-            raw_model_name=billing_data.get("model_name", ""),
-            predicted_label=billing_data.get("predicted_label", ""),
-            response_time_ms=billing_data.get("processing_time_ms", 0),
-            status=billing_data.get("status", "success"),
-            request_timestamp=billing_data.get("timestamp", ""),
-            total_tokens=billing_data.get("total_tokens", 0)  # If provided
-        )
-        
-        # Extract company name
-        log_entry.extract_company_name()
-        
-        # Calculate initial cost
-        log_entry.calculate_cost()
-        
-        return log_entry
\ No newline at end of file
+        return cls(**cls.billing_row(billing_data))
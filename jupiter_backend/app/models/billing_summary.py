@@ -1,8 +1,17 @@
-from sqlalchemy import Column, String, Integer, Numeric, ForeignKey, DateTime, func, Boolean, Date
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import Column, String, Integer, BigInteger, Numeric, ForeignKey, DateTime, func, Boolean, Date, Index
 from app.database import Base
 
+def to_cents(amount) -> int:
+    """Round a currency amount to whole cents without going through float"""
+    return int((Decimal(amount) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
 class MonthlyBillingSummary(Base):
     __tablename__ = "monthly_billing_summary"
+    __table_args__ = (
+        # A user's bills newest first, paged by (year, month)
+        Index("ix_monthly_billing_summary_user_year_month", "user_id", "year", "month"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -17,6 +26,8 @@ class MonthlyBillingSummary(Base):
     subscription_cost = Column(Numeric, nullable=False, default=0)
     total_discount = Column(Numeric, nullable=False, default=0)
     total_cost = Column(Numeric, nullable=False, default=0)
+    # total_cost in integer cents, fixed when the bill is generated and sent to Stripe as is
+    total_cost_cents = Column(BigInteger, nullable=True)
 
     is_paid = Column(Boolean, default=False)
     paid_at = Column(DateTime, nullable=True)
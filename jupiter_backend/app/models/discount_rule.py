@@ -1,9 +1,22 @@
-from sqlalchemy import Column, String, Integer, Numeric, ForeignKey, Boolean, DateTime, func, Text
+from sqlalchemy import Column, String, Integer, Numeric, ForeignKey, Boolean, DateTime, func, Text, Index, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class DiscountRule(Base):
     __tablename__ = "discount_rules"
+    __table_args__ = (
+        # Discount lookup in log_api_usage: equality on user/model over active
+        # rules, already in priority order, with the threshold and percentage
+        # columns carried for an index-only scan
+        Index(
+            "ix_discount_rules_active_user_model_priority",
+            "user_id",
+            "model_id",
+            "priority",
+            postgresql_include=["min_requests", "max_requests", "discount_percentage"],
+            postgresql_where=text("is_active")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.database import Base
+
+class MonthlyRequestCount(Base):
+    """Running count of a user's logged requests per calendar month, used for
+    the discount thresholds instead of counting api_usage_logs rows."""
+    __tablename__ = "monthly_request_counts"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    n = Column(BigInteger, nullable=False, default=0)
+
+def increment_request_count(user_id, year, month):
+    """
+    Upsert that adds one request to the user's month and returns the new count.
+    year and month may be Python values or SQL expressions.
+    """
+    stmt = pg_insert(MonthlyRequestCount).values(user_id=user_id, year=year, month=month, n=1)
+    return stmt.on_conflict_do_update(
+        index_elements=[MonthlyRequestCount.user_id, MonthlyRequestCount.year, MonthlyRequestCount.month],
+        set_={"n": MonthlyRequestCount.n + 1}
+    ).returning(MonthlyRequestCount.n)
@@ -0,0 +1,71 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app.models.user import User
+from app.models.user_api_key import UserAPIKey
+
+# Columns register_user_with_key leaves to their server defaults, declared on
+# the models. Tables created before those server defaults existed get them
+# set here, from the same column definitions.
+_DEFAULTED_COLUMNS = {
+    User.__table__: ("is_active", "created_at", "email_verified"),
+    UserAPIKey.__table__: (
+        "is_active", "created_at", "updated_at",
+        "rate_limit_per_minute", "rate_limit_per_hour", "rate_limit_per_day", "scopes"
+    ),
+}
+
+def _server_default_ddl():
+    dialect = postgresql.dialect()
+    compiler = dialect.ddl_compiler(dialect, None)
+    return [
+        f"ALTER TABLE {table.name} ALTER COLUMN {name} "
+        f"SET DEFAULT {compiler.get_column_default_string(table.c[name])}"
+        for table, names in _DEFAULTED_COLUMNS.items()
+        for name in names
+    ]
+
+# Server-side registration: inserts the user and their default API key in one
+# call. The key itself and every hash are generated in the application and
+# passed in; everything else not listed comes from the column defaults.
+REGISTRATION_DDL = _server_default_ddl() + [
+    """
+    CREATE OR REPLACE FUNCTION register_user_with_key(
+        p_email text,
+        p_hashed_password text,
+        p_full_name text,
+        p_organization_name text,
+        p_auth_id text,
+        p_otp_hash text,
+        p_otp_expires timestamp,
+        p_api_key_hash text,
+        p_api_key_prefix text
+    ) RETURNS integer
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        new_user_id integer;
+    BEGIN
+        INSERT INTO users (
+            auth_id, email, full_name, hashed_password, organization_name,
+            email_verification_token, email_verification_token_expires
+        )
+        VALUES (
+            p_auth_id, p_email, p_full_name, p_hashed_password, p_organization_name,
+            p_otp_hash, p_otp_expires
+        )
+        RETURNING id INTO new_user_id;
+
+        INSERT INTO user_api_keys (user_id, key_name, api_key_hash, api_key_prefix)
+        VALUES (new_user_id, 'Default API Key', p_api_key_hash, p_api_key_prefix);
+
+        RETURN new_user_id;
+    END;
+    $$
+    """,
+]
+
+REGISTER_USER_WITH_KEY = text(
+    "SELECT register_user_with_key("
+    ":email, :hashed_password, :full_name, :organization_name, :auth_id, "
+    ":otp_hash, :otp_expires, :api_key_hash, :api_key_prefix)"
+)
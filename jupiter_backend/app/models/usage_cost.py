@@ -0,0 +1,72 @@
+from sqlalchemy import text
+
+# Prices one usage log entry server-side: reads the model's pricing, bumps the
+# user's monthly_request_counts row, picks the best active discount for the
+# requests made before this one and reserves the log row's id. Returns no row
+# when the model does not exist. The log row itself is inserted afterwards by
+# the usage log writer.
+USAGE_COST_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION usage_cost(
+        p_user_id integer,
+        p_model_id integer,
+        p_input_tokens integer,
+        p_output_tokens integer,
+        p_status text
+    ) RETURNS TABLE (
+        log_id bigint,
+        original_cost numeric,
+        applied_discount numeric,
+        total_cost numeric
+    )
+    LANGUAGE plpgsql AS $$
+    #variable_conflict use_column
+    DECLARE
+        m ai_models%ROWTYPE;
+        utc_now timestamp := timezone('UTC', now());
+        previous_requests bigint;
+    BEGIN
+        SELECT * INTO m FROM ai_models WHERE id = p_model_id;
+        IF NOT FOUND THEN
+            RETURN;
+        END IF;
+
+        INSERT INTO monthly_request_counts AS c (user_id, year, month, n)
+        VALUES (p_user_id, extract(year FROM utc_now)::int, extract(month FROM utc_now)::int, 1)
+        ON CONFLICT (user_id, year, month) DO UPDATE SET n = c.n + 1
+        RETURNING c.n - 1 INTO previous_requests;
+
+        applied_discount := coalesce((
+            SELECT d.discount_percentage
+            FROM discount_rules d
+            WHERE d.is_active
+              AND d.user_id = p_user_id
+              AND d.model_id = p_model_id
+              AND d.min_requests <= previous_requests
+              AND (d.max_requests IS NULL OR d.max_requests >= previous_requests)
+            ORDER BY d.priority
+            LIMIT 1
+        ), 0);
+
+        original_cost := 0;
+        IF p_status = 'success' THEN
+            IF m.cost_calculation_type = 'tokens' THEN
+                original_cost := p_input_tokens * m.input_cost_per_1k_tokens / 1000
+                               + p_output_tokens * m.output_cost_per_1k_tokens / 1000;
+            ELSIF m.cost_calculation_type = 'request' THEN
+                original_cost := m.request_cost;
+            END IF;
+        END IF;
+
+        total_cost := original_cost * (1 - applied_discount / 100);
+        log_id := nextval(pg_get_serial_sequence('api_usage_logs', 'id'));
+        RETURN NEXT;
+    END;
+    $$
+    """,
+]
+
+USAGE_COST = text(
+    "SELECT log_id, original_cost, applied_discount, total_cost "
+    "FROM usage_cost(:user_id, :model_id, :input_tokens, :output_tokens, :status)"
+)
@@ -0,0 +1,55 @@
+from sqlalchemy import table, column, Integer, BigInteger, Numeric, String, Date
+
+# Daily usage rollup maintained as a Postgres materialized view over
+# api_usage_logs. It is declared as a lightweight table() rather than on
+# Base.metadata so create_all never tries to create it as a regular table.
+usage_daily_rollup = table(
+    "usage_daily_rollup",
+    column("day", Date),
+    column("user_id", Integer),
+    column("model_id", Integer),
+    column("company_name", String),
+    column("requests", BigInteger),
+    column("tokens", BigInteger),
+    column("cost", Numeric),
+    column("sum_response_time", BigInteger),
+    column("response_time_count", BigInteger),
+    column("min_response_time", Integer),
+    column("max_response_time", Integer),
+    column("success_count", BigInteger),
+    column("processed_count", BigInteger),
+    column("unprocessed_count", BigInteger),
+)
+
+USAGE_DAILY_ROLLUP_DDL = [
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS usage_daily_rollup AS
+    SELECT
+        date_trunc('day', created_at)::date AS day,
+        user_id,
+        model_id,
+        company_name,
+        count(*) AS requests,
+        coalesce(sum(total_tokens), 0) AS tokens,
+        coalesce(sum(total_cost), 0) AS cost,
+        sum(response_time_ms) AS sum_response_time,
+        count(response_time_ms) AS response_time_count,
+        min(response_time_ms) AS min_response_time,
+        max(response_time_ms) AS max_response_time,
+        count(*) FILTER (WHERE status = 'success') AS success_count,
+        count(*) FILTER (WHERE billing_processed) AS processed_count,
+        count(*) FILTER (WHERE NOT billing_processed) AS unprocessed_count
+    FROM api_usage_logs
+    GROUP BY 1, 2, 3, 4
+    """,
+    # REFRESH ... CONCURRENTLY requires a unique index on the view
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_usage_daily_rollup_day_user_model_company "
+    "ON usage_daily_rollup (day, user_id, model_id, company_name)",
+    "CREATE INDEX IF NOT EXISTS ix_usage_daily_rollup_day_model "
+    "ON usage_daily_rollup (day, model_id)",
+    # Per-user history on the user dashboard
+    "CREATE INDEX IF NOT EXISTS ix_usage_daily_rollup_user_day "
+    "ON usage_daily_rollup (user_id, day)",
+]
+
+REFRESH_USAGE_DAILY_ROLLUP = "REFRESH MATERIALIZED VIEW CONCURRENTLY usage_daily_rollup"
@@ -1,17 +1,54 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Numeric
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Numeric, Index, Text, Computed, text, true, false
+from sqlalchemy.orm import deferred, relationship
 from app.database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination for the admin user list (ORDER BY created_at DESC, id DESC)
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Case-insensitive email lookups at login, registration and password reset
+        Index("ix_users_email_lower", text("lower(email)"), unique=True),
+        # Exact company match when billing entries are mapped to users
+        Index("ix_users_organization_name_lower", text("lower(organization_name)")),
+        # Same ordering under an is_active filter; INCLUDE carries the rest of the
+        # listed columns so the page is an index-only scan
+        Index(
+            "ix_users_active_created_at_id",
+            "is_active",
+            "created_at",
+            "id",
+            postgresql_include=[
+                "auth_id", "email", "full_name", "organization_name", "subscription_tier_id",
+                "monthly_request_limit", "monthly_token_limit", "monthly_cost_limit"
+            ]
+        ),
+        # Exact active-user count in the admin stats
+        Index("ix_users_active", "is_active", postgresql_where=text("is_active")),
+        # Trigram index so organization_name ILIKE '%...%' filters avoid a full scan (needs pg_trgm)
+        Index(
+            "ix_users_organization_name_trgm",
+            "organization_name",
+            postgresql_using="gin",
+            postgresql_ops={"organization_name": "gin_trgm_ops"}
+        ),
+        # Trigram index behind the admin user search (searchable LIKE '%...%')
+        Index(
+            "ix_users_searchable_trgm",
+            "searchable",
+            postgresql_using="gin",
+            postgresql_ops={"searchable": "gin_trgm_ops"}
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     auth_id = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False, index=True)
     full_name = Column(String)
     hashed_password = Column(String, nullable=False)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=func.now())
+    # Defaults live in the database so register_user_with_key shares them
+    is_active = Column(Boolean, server_default=true())
+    created_at = Column(DateTime, server_default=func.now())
 
     # Fields from old Organization model
     organization_name = Column(String)
@@ -19,22 +56,44 @@ class User(Base):
     monthly_request_limit = Column(Integer)
     monthly_token_limit = Column(Integer)
     monthly_cost_limit = Column(Numeric)
+
+    # Lowercased email, organization and name kept by Postgres for substring
+    # search; deferred so it is never loaded with the user row
+    searchable = deferred(Column(
+        Text,
+        Computed(
+            "lower(coalesce(email, '') || ' ' || coalesce(organization_name, '') || ' ' || coalesce(full_name, ''))",
+            persisted=True
+        )
+    ))
     
     # FIXED: Removed lazy="joined" to prevent eager loading issues
     subscription_tier = relationship("SubscriptionTier")
 
     # Fields for email verification
-    email_verified = Column(Boolean, default=False)
+    email_verified = Column(Boolean, server_default=false())
     email_verification_token = Column(String, nullable=True)
     email_verification_token_expires = Column(DateTime, nullable=True)
 
     # New fields for password reset
-    password_reset_token = Column(String, nullable=True)
+    password_reset_token = Column(String, nullable=True)  # sha256 of the issued reset token
     password_reset_token_expires = Column(DateTime, nullable=True)
+    # Random id embedded in the reset token (jti) so a reset finds its user by index
+    password_reset_jti = Column(String, nullable=True, unique=True)
 
-    # TEMPORARILY COMMENTED OUT: Relationships causing SQLAlchemy errors
-    # Uncomment these once you create the corresponding model files properly
-    
-    # api_keys = relationship("UserAPIKey", back_populates="user", cascade="all, delete-orphan")
-    # model_assignments = relationship("UserModelAssignment", back_populates="user", cascade="all, delete-orphan") 
+    # Collections used by the admin user detail endpoints (loaded with selectinload)
+    api_keys = relationship("UserAPIKey", back_populates="user")
+    model_assignments = relationship(
+        "UserModelAssignment",
+        foreign_keys="UserModelAssignment.user_id",
+        back_populates="user",
+        order_by="UserModelAssignment.assigned_at.desc()"
+    )
+    organization_models = relationship(
+        "OrganizationModel",
+        foreign_keys="OrganizationModel.organization_id",
+        back_populates="organization"
+    )
+
+    # TEMPORARILY COMMENTED OUT: Relationship causing SQLAlchemy errors
     # api_usage_logs = relationship("APIUsageLog", back_populates="user")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Text
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Text, Index, text, true
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime, timedelta
@@ -7,33 +7,41 @@ import hashlib
 
 class UserAPIKey(Base):
     __tablename__ = "user_api_keys"
+    __table_args__ = (
+        # Users with an active key in the admin stats
+        Index("ix_user_api_keys_active_user_id", "user_id", postgresql_where=text("is_active")),
+    )
+    # Read id and the func.now() timestamps back with INSERT ... RETURNING, so a
+    # new key can be returned without refreshing it
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     key_name = Column(String(100), nullable=False)  # User-friendly name for the key
-    api_key_hash = Column(String(256), nullable=False, unique=True)  # Hashed version for security
+    # Hashed version for security; the unique index also serves the per-request auth lookup
+    api_key_hash = Column(String(256), nullable=False, unique=True)
     api_key_prefix = Column(String(20), nullable=False)  # First few chars for display (e.g., "jb_1234...")
-    is_active = Column(Boolean, default=True)
+    # Defaults live in the database so register_user_with_key shares them
+    is_active = Column(Boolean, server_default=true())
     last_used_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)  # Optional expiration
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # Rate limiting and permissions
-    rate_limit_per_minute = Column(Integer, default=60)
-    rate_limit_per_hour = Column(Integer, default=1000)
-    rate_limit_per_day = Column(Integer, default=10000)
+    rate_limit_per_minute = Column(Integer, server_default="60")
+    rate_limit_per_hour = Column(Integer, server_default="1000")
+    rate_limit_per_day = Column(Integer, server_default="10000")
     
     # Allowed IP addresses (JSON array as string)
     allowed_ips = Column(Text, nullable=True)  # Store as JSON string: ["192.168.1.1", "10.0.0.1"]
     
     # Scopes/permissions (JSON array as string)
-    scopes = Column(Text, default='["read", "write"]')  # ["read", "write", "admin"]
+    scopes = Column(Text, server_default='["read", "write"]')  # ["read", "write", "admin"]
 
-    # FIXED: Relationships - removed back_populates since User doesn't have api_keys anymore
-    user = relationship("User")
-    # ALSO COMMENTED OUT: UserModelAssignment relationship until that model is properly defined
-    # model_access = relationship("UserModelAssignment", back_populates="api_key")
+    # Relationships
+    user = relationship("User", back_populates="api_keys")
+    model_access = relationship("UserModelAssignment", back_populates="api_key")
 
     @classmethod
     def generate_api_key(cls) -> tuple[str, str, str]:
@@ -1,10 +1,14 @@
 # jupiter_backend/app/models/user_model_access.py
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, func
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class UserModelAccess(Base):
     __tablename__ = "user_model_access"
+    __table_args__ = (
+        # Conflict target for the assignment upsert in admin user_models
+        UniqueConstraint("user_id", "model_id", name="ux_user_model_access_user_model"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
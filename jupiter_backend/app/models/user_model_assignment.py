@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Text, Numeric
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, func, Text, Numeric, Index, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime, timedelta
@@ -7,6 +7,12 @@ import json
 
 class UserModelAssignment(Base):
     __tablename__ = "user_model_assignments"
+    __table_args__ = (
+        # Keyset pagination for the admin assignment list (ORDER BY assigned_at DESC, id DESC)
+        Index("ix_user_model_assignments_assigned_at_id", "assigned_at", "id"),
+        # EXISTS probes for users with an active assignment
+        Index("ix_user_model_assignments_active_user_id", "user_id", postgresql_where=text("is_active")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -1,10 +1,15 @@
+import hashlib
+import hmac
 import os
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
+from app.utils.cache import LocalTTLCache
+
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -13,6 +18,10 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Verified token payloads, keyed by the full token, so a client reusing its
+# token is only signature-checked once per process until the entry expires
+_decoded_tokens = LocalTTLCache(maxsize=4096, ttl=300)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed one."""
     return pwd_context.verify(plain_password, hashed_password)
@@ -21,6 +30,14 @@ def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
     return pwd_context.hash(password)
 
+def hash_otp(otp: str) -> str:
+    """Keyed hash for short-lived one-time codes; bcrypt is kept for passwords."""
+    return hmac.new(SECRET_KEY.encode(), otp.encode(), hashlib.sha256).hexdigest()
+
+def verify_otp(otp: str, otp_hash: str) -> bool:
+    """Verifies a one-time code against its stored hash in constant time."""
+    return hmac.compare_digest(hash_otp(otp), otp_hash)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a new JWT access token."""
     to_encode = data.copy()
@@ -30,4 +47,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+def decode_access_token(token: str) -> dict:
+    """Verifies a JWT and returns its payload. Raises jwt.InvalidTokenError."""
+    payload = _decoded_tokens.get(token)
+    if payload is None or payload.get("exp", 0) <= time.time():
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        _decoded_tokens.set(token, payload)
+    return payload
\ No newline at end of file
@@ -0,0 +1,33 @@
+import jwt
+
+from app.security import decode_access_token
+
+def _bearer_token(scope):
+    for key, value in scope["headers"]:
+        if key == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+            return None
+    return None
+
+class AuthTokenMiddleware:
+    """
+    ASGI middleware that verifies a bearer JWT once per request and exposes its
+    payload as request.state.token_payload (None when the token is invalid).
+    API keys (jb_...) are left to the API key dependencies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            token = _bearer_token(scope)
+            if token and not token.startswith("jb_"):
+                try:
+                    payload = decode_access_token(token)
+                except jwt.InvalidTokenError:
+                    payload = None
+                scope.setdefault("state", {})["token_payload"] = payload
+        await self.app(scope, receive, send)
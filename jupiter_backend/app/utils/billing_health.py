@@ -0,0 +1,91 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.utils.cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Usage log counters kept in hourly Redis buckets, keyed by the UTC hour in
+# which they were counted, so the billing health dashboard can read the last
+# 24 hours without aggregating api_usage_logs. Every counter uses the same
+# clock; entry timestamps come from the database and may be in its local
+# time zone. Buckets expire on their own once they fall out of the window.
+HEALTH_WINDOW_HOURS = 24
+_BUCKET_TTL_SECONDS = (HEALTH_WINDOW_HOURS + 1) * 3600
+_COUNTER_FIELDS = ("total", "processed", "failed", "proc_seconds", "proc_count")
+
+def _bucket(moment: datetime) -> str:
+    return moment.strftime("%Y%m%d%H")
+
+def _key(bucket: str, field: str) -> str:
+    return f"billing:h:{bucket}:{field}"
+
+async def _increment(amounts: Dict[str, float]):
+    client = get_redis()
+    if client is None:
+        return
+    bucket = _bucket(datetime.utcnow())
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for field, amount in amounts.items():
+                key = _key(bucket, field)
+                if isinstance(amount, float):
+                    pipe.incrbyfloat(key, amount)
+                else:
+                    pipe.incrby(key, amount)
+                pipe.expire(key, _BUCKET_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to update billing health counters: {str(e)}")
+
+async def record_usage_logged(count: int = 1):
+    """Count newly written usage log entries"""
+    await _increment({"total": count})
+
+async def record_usage_processed(created_at: datetime, processed_at: datetime, failed: bool, retry_count: int = 0):
+    """
+    Count a usage log entry that billing processing has marked as processed.
+    An entry that raised on an earlier attempt (retry_count > 0) was already
+    counted by record_usage_failed, so its failure is not counted again.
+    """
+    amounts = {
+        "processed": 1,
+        "proc_seconds": (processed_at - created_at).total_seconds(),
+        "proc_count": 1
+    }
+    if failed and not retry_count:
+        amounts["failed"] = 1
+    await _increment(amounts)
+
+async def record_usage_failed():
+    """Count a usage log entry whose processing raised before completing"""
+    await _increment({"failed": 1})
+
+async def get_billing_health_counters() -> Optional[Dict[str, float]]:
+    """
+    Sum the hourly counters over the health window. Returns None when Redis
+    is not configured, unreachable, or holds no buckets for the window yet, in
+    which case callers should aggregate from the database instead.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+
+    now = datetime.utcnow()
+    buckets = [_bucket(now - timedelta(hours=hours)) for hours in range(HEALTH_WINDOW_HOURS)]
+    keys = [_key(bucket, field) for bucket in buckets for field in _COUNTER_FIELDS]
+    try:
+        values = await client.mget(keys)
+    except Exception as e:
+        logger.warning(f"Failed to read billing health counters: {str(e)}")
+        return None
+
+    if all(value is None for value in values):
+        return None
+
+    totals = dict.fromkeys(_COUNTER_FIELDS, 0.0)
+    for index, value in enumerate(values):
+        if value is not None:
+            totals[_COUNTER_FIELDS[index % len(_COUNTER_FIELDS)]] += float(value)
+    return totals
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, update
 from typing import Optional, Dict, Any, List
 import logging
 from datetime import datetime, timedelta
@@ -9,11 +9,25 @@ from app.models.api_usage_log import APIUsageLog
 from app.models.user import User
 from app.models.ai_model import AIModel
 from app.models.user_api_key import UserAPIKey
+from app.models.monthly_request_count import increment_request_count
 from app.database import async_session
+from app.utils.billing_health import record_usage_processed, record_usage_failed
+from app.utils.cache import LocalTTLCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Billing streams repeat the same company and model names, so the ids they
+# resolved to are remembered per process; only successful matches are kept,
+# so newly added users and models are still found
+_user_ids_by_company = LocalTTLCache(maxsize=4096, ttl=3600)
+_model_ids_by_name = LocalTTLCache(maxsize=4096, ttl=3600)
+
+def invalidate_billing_mappings():
+    """Forget this process's resolved company/model mappings after users or models change"""
+    _user_ids_by_company.clear()
+    _model_ids_by_name.clear()
+
 class BillingProcessor:
     """
     Utility class for processing billing entries and mapping them to users/models.
@@ -29,6 +43,20 @@ class BillingProcessor:
         
         company_lower = company_name.lower().strip()
         
+        user_id = _user_ids_by_company.get(company_lower)
+        if user_id is not None:
+            user = await db.get(User, user_id)
+            if user:
+                return user
+            _user_ids_by_company.pop(company_lower)
+        
+        user = await BillingProcessor._match_user_by_company(company_lower, company_name, db)
+        if user:
+            _user_ids_by_company.set(company_lower, user.id)
+        return user
+    
+    @staticmethod
+    async def _match_user_by_company(company_lower: str, company_name: str, db: AsyncSession) -> Optional[User]:
         # Strategy 1: Exact match on organization_name
         stmt = select(User).where(
             func.lower(User.organization_name) == company_lower
@@ -76,6 +104,20 @@ class BillingProcessor:
         
         model_lower = model_name.lower().strip()
         
+        model_id = _model_ids_by_name.get(model_name)
+        if model_id is not None:
+            model = await db.get(AIModel, model_id)
+            if model:
+                return model
+            _model_ids_by_name.pop(model_name)
+        
+        model = await BillingProcessor._match_model_by_name(model_lower, model_name, db)
+        if model:
+            _model_ids_by_name.set(model_name, model.id)
+        return model
+    
+    @staticmethod
+    async def _match_model_by_name(model_lower: str, model_name: str, db: AsyncSession) -> Optional[AIModel]:
         # Strategy 1: Exact match on model_identifier
         stmt = select(AIModel).where(
             func.lower(AIModel.model_identifier) == model_lower
@@ -112,7 +154,7 @@ class BillingProcessor:
         # Strategy 4: Extract model type and search (e.g., "email_classifier" from "company_email_classifier")
         if '_' in model_name:
             # Try matching against the model type part
-            model_type = '_'.join(model_name.split('_')[1:])  # Get everything after first underscore
+            model_type = model_name.partition('_')[2]  # Get everything after first underscore
             stmt = select(AIModel).where(
                 or_(
                     func.lower(AIModel.name).contains(model_type.lower()),
@@ -128,6 +170,28 @@ class BillingProcessor:
         logger.warning(f"No model found for: {model_name}")
         return None
     
+    @staticmethod
+    async def attribute_to_user(log_entry: APIUsageLog, user_id: int, db: AsyncSession):
+        """
+        Map a log entry to its user and, the first time it is attributed,
+        count it towards that user's month. The attribution is claimed with a
+        conditional UPDATE, so when the post-write hook and the periodic sweep
+        process the same entry only one of them counts it.
+        """
+        if log_entry.user_id is None:
+            claimed = await db.execute(
+                update(APIUsageLog)
+                .where(APIUsageLog.id == log_entry.id, APIUsageLog.user_id.is_(None))
+                .values(user_id=user_id)
+                .returning(APIUsageLog.id)
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.first() is not None:
+                await db.execute(increment_request_count(
+                    user_id, log_entry.created_at.year, log_entry.created_at.month
+                ))
+        log_entry.user_id = user_id
+    
     @staticmethod
     async def calculate_model_cost(
         log_entry: APIUsageLog, 
@@ -167,103 +231,115 @@ class BillingProcessor:
             return 0.01  # Fallback minimal cost
 
     @staticmethod
-    async def process_billing_entry(log_id: int) -> Dict[str, Any]:
+    async def process_billing_entry(log_id: int, db: Optional[AsyncSession] = None) -> Dict[str, Any]:
         """
         Main function to process a billing entry.
-        Returns processing results for monitoring.
+        Returns processing results for monitoring. Pass `db` to process
+        several entries on one session.
         """
-        async with async_session() as db:
-            try:
-                # Get the log entry
-                stmt = select(APIUsageLog).where(APIUsageLog.id == log_id)
-                result = await db.execute(stmt)
-                log_entry = result.scalar_one_or_none()
-                
-                if not log_entry:
-                    return {
-                        "success": False,
-                        "error": f"Log entry {log_id} not found"
-                    }
-                
-                processing_results = {
-                    "log_id": log_id,
-                    "company_name": log_entry.company_name,
-                    "model_name": log_entry.raw_model_name,
-                    "user_found": False,
-                    "model_found": False,
-                    "cost_calculated": False,
-                    "errors": []
-                }
-                
-                # Find and map user
-                if log_entry.company_name:
-                    user = await BillingProcessor.find_user_by_company(
-                        log_entry.company_name, db
-                    )
-                    if user:
-                        log_entry.user_id = user.id
-                        processing_results["user_found"] = True
-                        processing_results["user_id"] = user.id
-                        processing_results["user_organization"] = user.organization_name
-                    else:
-                        error_msg = f"No user found for company: {log_entry.company_name}"
-                        log_entry.error_message = error_msg
-                        processing_results["errors"].append(error_msg)
-                
-                # Find and map model
-                if log_entry.raw_model_name:
-                    ai_model = await BillingProcessor.find_model_by_name(
-                        log_entry.raw_model_name, db
-                    )
-                    if ai_model:
-                        log_entry.model_id = ai_model.id
-                        processing_results["model_found"] = True
-                        processing_results["model_id"] = ai_model.id
-                        processing_results["model_name_matched"] = ai_model.name
-                        
-                        # Recalculate cost with actual model pricing
-                        new_cost = await BillingProcessor.calculate_model_cost(log_entry, ai_model)
-                        log_entry.original_cost = new_cost
-                        log_entry.total_cost = new_cost * (1 - log_entry.applied_discount / 100)
-                        processing_results["cost_calculated"] = True
-                        processing_results["final_cost"] = float(log_entry.total_cost)
-                    else:
-                        error_msg = f"No AI model found for: {log_entry.raw_model_name}"
-                        log_entry.error_message = error_msg
-                        processing_results["errors"].append(error_msg)
-                
-                # Mark as processed
-                log_entry.mark_as_processed(log_entry.user_id, log_entry.model_id)
-                
-                await db.commit()
-                
-                processing_results["success"] = True
-                processing_results["processed_at"] = datetime.utcnow().isoformat()
-                
-                logger.info(f"Successfully processed billing entry {log_id}: "
-                          f"User={processing_results['user_found']}, "
-                          f"Model={processing_results['model_found']}")
-                
-                return processing_results
-                
-            except Exception as e:
-                error_msg = f"Error processing billing entry {log_id}: {str(e)}"
-                logger.error(error_msg)
-                
-                # Update log entry with error
-                try:
-                    if log_entry:
-                        log_entry.error_message = str(e)
-                        log_entry.retry_count += 1
-                        await db.commit()
-                except:
-                    pass  # Don't let error handling fail
-                
+        if db is None:
+            async with async_session() as db:
+                return await BillingProcessor.process_billing_entry(log_id, db)
+        
+        try:
+            # Get the log entry
+            stmt = select(APIUsageLog).where(APIUsageLog.id == log_id)
+            result = await db.execute(stmt)
+            log_entry = result.scalar_one_or_none()
+            
+            if not log_entry:
                 return {
                     "success": False,
-                    "log_id": log_id,
-                    "error": error_msg
+                    "error": f"Log entry {log_id} not found"
                 }
+            
+            processing_results = {
+                "log_id": log_id,
+                "company_name": log_entry.company_name,
+                "model_name": log_entry.raw_model_name,
+                "user_found": False,
+                "model_found": False,
+                "cost_calculated": False,
+                "errors": []
+            }
+            
+            # Find and map user
+            if log_entry.company_name:
+                user = await BillingProcessor.find_user_by_company(
+                    log_entry.company_name, db
+                )
+                if user:
+                    await BillingProcessor.attribute_to_user(log_entry, user.id, db)
+                    processing_results["user_found"] = True
+                    processing_results["user_id"] = user.id
+                    processing_results["user_organization"] = user.organization_name
+                else:
+                    error_msg = f"No user found for company: {log_entry.company_name}"
+                    log_entry.error_message = error_msg
+                    processing_results["errors"].append(error_msg)
+            
+            # Find and map model
+            if log_entry.raw_model_name:
+                ai_model = await BillingProcessor.find_model_by_name(
+                    log_entry.raw_model_name, db
+                )
+                if ai_model:
+                    log_entry.model_id = ai_model.id
+                    processing_results["model_found"] = True
+                    processing_results["model_id"] = ai_model.id
+                    processing_results["model_name_matched"] = ai_model.name
+                    
+                    # Recalculate cost with actual model pricing
+                    new_cost = await BillingProcessor.calculate_model_cost(log_entry, ai_model)
+                    log_entry.original_cost = new_cost
+                    log_entry.total_cost = new_cost * (1 - log_entry.applied_discount / 100)
+                    processing_results["cost_calculated"] = True
+                    processing_results["final_cost"] = float(log_entry.total_cost)
+                else:
+                    error_msg = f"No AI model found for: {log_entry.raw_model_name}"
+                    log_entry.error_message = error_msg
+                    processing_results["errors"].append(error_msg)
+            
+            # Mark as processed
+            log_entry.mark_as_processed(log_entry.user_id, log_entry.model_id)
+            
+            await db.commit()
+            await record_usage_processed(
+                log_entry.created_at, log_entry.processed_at, bool(processing_results["errors"]),
+                log_entry.retry_count
+            )
+            
+            processing_results["success"] = True
+            processing_results["processed_at"] = datetime.utcnow().isoformat()
+            
+            logger.info(f"Successfully processed billing entry {log_id}: "
+                      f"User={processing_results['user_found']}, "
+                      f"Model={processing_results['model_found']}")
+            
+            return processing_results
+            
+        except Exception as e:
+            error_msg = f"Error processing billing entry {log_id}: {str(e)}"
+            logger.error(error_msg)
+            
+            # Update log entry with error
+            try:
+                if log_entry:
+                    first_failure = not log_entry.retry_count
+                    log_entry.error_message = str(e)
+                    log_entry.retry_count += 1
+                    await db.commit()
+                    if first_failure:
+                        await record_usage_failed()
+            except Exception:
+                # Don't let error handling fail, but leave the session usable
+                await db.rollback()
+            
+            return {
+                "success": False,
+                "log_id": log_id,
+                "error": error_msg
+            }
 
     @staticmethod
     async def get_unprocessed_entries(limit: int = 100) -> List[APIUsageLog]:
@@ -310,7 +386,7 @@ class BillingProcessor:
             
             for entry in failed_entries:
                 try:
-                    processing_result = await BillingProcessor.process_billing_entry(entry.id)
+                    processing_result = await BillingProcessor.process_billing_entry(entry.id, db)
                     results["processed"] += 1
                     
                     if processing_result.get("success", False):
@@ -0,0 +1,158 @@
+import functools
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+
+# Redis is optional: without the package or a REDIS_URL every helper here is a no-op
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Clients may reuse a response carrying an ETag briefly before revalidating
+CONDITIONAL_CACHE_CONTROL = "private, max-age=5"
+
+_client = None
+
+def get_redis():
+    """Return the shared Redis client, or None when caching is not configured"""
+    global _client
+    if _client is None and redis is not None and settings.REDIS_URL:
+        _client = redis.from_url(settings.REDIS_URL)
+    return _client
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class LocalTTLCache:
+    """
+    Small per-process LRU cache whose entries expire after `ttl` seconds.
+    Meant for hot lookups that may be briefly stale; each worker process
+    keeps its own copy, so invalidation only reaches the current process.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+def _version_key(namespace: str) -> str:
+    return f"{namespace}:version"
+
+async def bump_cache_version(namespace: str):
+    """
+    Invalidate every cached response in a namespace. Keys embed the current
+    version, so bumping it orphans the old entries until their TTL expires.
+    """
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        await client.incr(_version_key(namespace))
+    except Exception as e:
+        logger.warning(f"Failed to bump cache version for {namespace}: {str(e)}")
+
+def _is_cache_param(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool)) or hasattr(value, "isoformat")
+
+def cached(namespace: str, name: str, ttl: int) -> Callable:
+    """
+    Cache a JSON endpoint's response in Redis for `ttl` seconds.
+
+    The key is built from the namespace version and the endpoint's scalar
+    arguments (query/path params); dependencies such as the DB session and
+    current admin are left out. Cache hits return the stored JSON bytes as-is.
+    When the endpoint sets an ETag it is cached alongside the body, so cache
+    hits can also answer If-None-Match with a 304.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            client = get_redis()
+            if client is None:
+                return await func(*args, **kwargs)
+
+            params = sorted(
+                (key, value.isoformat() if hasattr(value, "isoformat") else value)
+                for key, value in kwargs.items()
+                if _is_cache_param(value)
+            )
+            digest = hashlib.blake2b(json.dumps(params).encode(), digest_size=16).hexdigest()
+
+            try:
+                version = int(await client.get(_version_key(namespace)) or 0)
+                cache_key = f"{namespace}:{name}:v{version}:{digest}"
+                etag_key = f"{cache_key}:etag"
+                cached_body, cached_etag = await client.mget(cache_key, etag_key)
+            except Exception as e:
+                logger.warning(f"Cache lookup failed for {namespace}:{name}: {str(e)}")
+                return await func(*args, **kwargs)
+
+            if cached_body is not None:
+                headers = {}
+                if cached_etag is not None:
+                    headers = {"ETag": cached_etag.decode(), "Cache-Control": CONDITIONAL_CACHE_CONTROL}
+                    request = next((value for value in kwargs.values() if isinstance(value, Request)), None)
+                    if request is not None and request.headers.get("if-none-match") == headers["ETag"]:
+                        return Response(status_code=304, headers=headers)
+                return Response(content=cached_body, media_type="application/json", headers=headers)
+
+            result = await func(*args, **kwargs)
+            if isinstance(result, Response):
+                # Only complete responses are cached, not 304s or errors
+                if result.status_code != 200:
+                    return result
+                body = result.body
+                etag = result.headers.get("etag")
+            else:
+                body = json.dumps(jsonable_encoder(result)).encode()
+                etag = None
+                result = Response(content=body, media_type="application/json")
+
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.set(cache_key, body, ex=ttl)
+                    if etag is not None:
+                        pipe.set(etag_key, etag, ex=ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Cache store failed for {namespace}:{name}: {str(e)}")
+
+            return result
+        return wrapper
+    return decorator
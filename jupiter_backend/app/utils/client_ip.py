@@ -0,0 +1,52 @@
+from typing import FrozenSet, Optional
+
+from app.config import settings
+
+# Peers whose X-Forwarded-For / X-Real-IP headers are believed. Headers sent by
+# any other peer are ignored, since a client can put whatever it likes there.
+TRUSTED_PROXIES: FrozenSet[str] = frozenset(
+    proxy.strip() for proxy in settings.TRUSTED_PROXIES.split(",") if proxy.strip()
+)
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def resolve_client_ip(scope) -> Optional[str]:
+    """
+    Work out the originating client address for an HTTP scope. When the peer
+    is a trusted proxy, X-Forwarded-For is walked from the right past any other
+    trusted hops, falling back to X-Real-IP.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else None
+    if peer not in TRUSTED_PROXIES:
+        return peer
+
+    forwarded_for = _header(scope, b"x-forwarded-for")
+    if forwarded_for:
+        for hop in reversed(forwarded_for.split(",")):
+            hop = hop.strip()
+            if hop and hop not in TRUSTED_PROXIES:
+                return hop
+
+    real_ip = _header(scope, b"x-real-ip")
+    if real_ip:
+        return real_ip.strip()
+    return peer
+
+class ClientIPMiddleware:
+    """
+    ASGI middleware that resolves the client address once per request and
+    exposes it as request.state.client_ip.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["client_ip"] = resolve_client_ip(scope)
+        await self.app(scope, receive, send)
@@ -0,0 +1,17 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+def _orjson_default(value: Any) -> Any:
+    # Numeric columns come back from Postgres as Decimal, which orjson does not encode natively
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class DecimalORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also encodes Decimal values as JSON numbers"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
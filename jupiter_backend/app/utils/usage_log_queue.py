@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.api_usage_log import APIUsageLog
+from app.utils.billing_health import record_usage_logged
+
+logger = logging.getLogger(__name__)
+
+# Usage log rows from POST /api_log and POST /billing wait here and are written
+# by run_usage_log_writer in multi-row INSERTs, so the request path never waits
+# on a commit
+_queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=settings.USAGE_LOG_QUEUE_SIZE)
+
+# Queued by stop_usage_log_writer: the writer finishes everything ahead of it
+# and returns
+_STOP = object()
+
+# Coroutines run with each batch of rows once it is committed
+_written_hooks: List[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = []
+_hook_tasks = set()
+
+def on_usage_logs_written(hook):
+    """Register a coroutine function to be called with every written batch"""
+    _written_hooks.append(hook)
+    return hook
+
+async def reserve_usage_log_ids(db: AsyncSession, count: int = 1) -> List[int]:
+    """Reserve ids from the api_usage_logs sequence for rows written later"""
+    next_id = func.nextval(func.pg_get_serial_sequence(APIUsageLog.__tablename__, "id"))
+    result = await db.execute(select(next_id).select_from(func.generate_series(1, count)))
+    return result.scalars().all()
+
+def enqueue_usage_log(row: Dict[str, Any]) -> bool:
+    """Queue a usage log row for the writer. Returns False when the queue is full."""
+    try:
+        _queue.put_nowait(row)
+    except asyncio.QueueFull:
+        return False
+    return True
+
+async def write_usage_logs(rows: List[Dict[str, Any]]):
+    """Insert usage log rows, one statement per distinct set of columns"""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    async with async_session() as db:
+        for group in groups.values():
+            await db.execute(insert(APIUsageLog), group)
+        await db.commit()
+    await record_usage_logged(len(rows))
+
+    # Follow-up work runs on its own so it never holds up the writer
+    for hook in _written_hooks:
+        task = asyncio.create_task(hook(rows))
+        _hook_tasks.add(task)
+        task.add_done_callback(_hook_tasks.discard)
+
+async def _write_batch(rows: List[Dict[str, Any]]):
+    """
+    Write a batch for the writer. A batch rejected for its data is split in
+    halves until only the offending rows are left out, so one bad row does
+    not cost the other callers their usage.
+    """
+    try:
+        await write_usage_logs(rows)
+    except (DataError, IntegrityError) as e:
+        if len(rows) == 1:
+            logger.error(f"Dropped usage log entry {rows[0].get('id')}: {str(e)}")
+            return
+        middle = len(rows) // 2
+        await _write_batch(rows[:middle])
+        await _write_batch(rows[middle:])
+    except Exception as e:
+        logger.error(f"Failed to write {len(rows)} usage log entries: {str(e)}")
+
+def _drain(batch: List[Dict[str, Any]], limit: int) -> bool:
+    """Move queued rows into batch up to limit; True once the stop marker is reached"""
+    while len(batch) < limit and not _queue.empty():
+        row = _queue.get_nowait()
+        if row is _STOP:
+            return True
+        batch.append(row)
+    return False
+
+async def run_usage_log_writer():
+    """
+    Background task that waits for queued usage log rows and writes them in
+    batches of up to USAGE_LOG_BATCH_SIZE, collecting for at most
+    USAGE_LOG_BATCH_WAIT_SECONDS after the first row of a batch arrives.
+    Returns once stop_usage_log_writer has been called and the rows queued
+    before that are written.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await _queue.get()
+        if row is _STOP:
+            break
+        batch = [row]
+        deadline = loop.time() + settings.USAGE_LOG_BATCH_WAIT_SECONDS
+        while len(batch) < settings.USAGE_LOG_BATCH_SIZE:
+            stopping = _drain(batch, settings.USAGE_LOG_BATCH_SIZE)
+            remaining = deadline - loop.time()
+            if stopping or remaining <= 0 or len(batch) >= settings.USAGE_LOG_BATCH_SIZE:
+                break
+            try:
+                row = await asyncio.wait_for(_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if row is _STOP:
+                stopping = True
+                break
+            batch.append(row)
+
+        await _write_batch(batch)
+
+async def stop_usage_log_writer(writer: "asyncio.Task[None]"):
+    """Let the writer finish its current batch and the rows queued so far, then wait for it"""
+    if not writer.done():
+        await _queue.put(_STOP)
+    await writer
+
+async def flush_usage_logs():
+    """Write rows queued after the writer stopped; called on shutdown"""
+    while not _queue.empty():
+        batch: List[Dict[str, Any]] = []
+        _drain(batch, settings.USAGE_LOG_BATCH_SIZE)
+        if batch:
+            await _write_batch(batch)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Migration script for query performance indexes
+Run this from jupiter_backend directory: python migrate_performance_indexes.py
+"""
+
+import asyncio
+import os
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+# Each statement is idempotent so the script can be re-run safely.
+# CONCURRENTLY avoids locking writes on large production tables.
+INDEXES = [
+    # Keyset pagination for GET /admin/model-assignments
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_model_assignments_assigned_at_id "
+    "ON user_model_assignments (assigned_at, id)",
+    # has_assignments filter on GET /admin/users
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_model_assignments_active_user_id "
+    "ON user_model_assignments (user_id) WHERE is_active",
+    # Usage summary aggregations over a created_at window
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_created_at_brin "
+    "ON api_usage_logs USING brin (created_at)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_created_at_user_id "
+    "ON api_usage_logs (created_at, user_id) "
+    "INCLUDE (total_tokens, total_cost, response_time_ms, status, billing_processed)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_created_at_model_id "
+    "ON api_usage_logs (created_at, model_id) "
+    "INCLUDE (total_tokens, total_cost, response_time_ms, status, billing_processed)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_created_at_company_name "
+    "ON api_usage_logs (created_at, company_name) "
+    "INCLUDE (total_cost, raw_model_name, billing_processed)",
+    # Monthly request count and discount lookup in POST /api_log
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_user_id_created_at "
+    "ON api_usage_logs (user_id, created_at)",
+    # Recent entries of one company (company_name = ? ORDER BY created_at DESC)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_company_name_created_at "
+    "ON api_usage_logs (company_name, created_at)",
+    # Pending entries for the billing processor, oldest first; stays small
+    # because processed rows drop out of it
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_usage_logs_unprocessed_created_at "
+    "ON api_usage_logs (created_at) WHERE NOT billing_processed",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_discount_rules_active_user_model_priority "
+    "ON discount_rules (user_id, model_id, priority) "
+    "INCLUDE (min_requests, max_requests, discount_percentage) WHERE is_active",
+    # Keyset pagination for GET /billing
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_monthly_billing_summary_user_year_month "
+    "ON monthly_billing_summary (user_id, year, month)",
+    # Keyset pagination for GET /admin/users
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_created_at_id "
+    "ON users (created_at, id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_active_created_at_id "
+    "ON users (is_active, created_at, id) "
+    "INCLUDE (auth_id, email, full_name, organization_name, subscription_tier_id, "
+    "monthly_request_limit, monthly_token_limit, monthly_cost_limit)",
+    # API key authentication looks keys up by hash on every request. Tables
+    # created from the model already have this as a unique constraint (same
+    # name), so this only adds it to databases that predate it.
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS user_api_keys_api_key_hash_key "
+    "ON user_api_keys (api_key_hash)",
+    # Exact filtered counts in GET /admin/users/stats
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_active "
+    "ON users (is_active) WHERE is_active",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_api_keys_active_user_id "
+    "ON user_api_keys (user_id) WHERE is_active",
+    # Substring organization filters (ILIKE '%org%') on users
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_organization_name_trgm "
+    "ON users USING gin (organization_name gin_trgm_ops)",
+    # Billing entry mapping: exact company match on users, substring match on models
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_organization_name_lower "
+    "ON users (lower(organization_name))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ai_models_name_trgm "
+    "ON ai_models USING gin (name gin_trgm_ops)",
+    # Admin user search over email, organization and name. Adding a stored
+    # generated column rewrites the users table, so run this off-peak.
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS searchable text GENERATED ALWAYS AS "
+    "(lower(coalesce(email, '') || ' ' || coalesce(organization_name, '') || ' ' || coalesce(full_name, ''))) STORED",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_searchable_trgm "
+    "ON users USING gin (searchable gin_trgm_ops)",
+    # Case-insensitive email lookups in the auth routes. Fails (and is
+    # reported) if existing emails differ only by case; resolve those and drop
+    # the invalid index left behind before re-running.
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_lower "
+    "ON users (lower(email))",
+    # Password reset looks the user up by the jti carried in the reset token
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_reset_jti varchar",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_password_reset_jti_key "
+    "ON users (password_reset_jti)",
+    # Conflict target for the user model access upsert. Assignments used to be
+    # inserted without de-duplicating, so first keep one row per user/model
+    # (the active one, else the newest) and drop an INVALID index left by an
+    # earlier failed run, which IF NOT EXISTS would otherwise skip over.
+    "DELETE FROM user_model_access a USING user_model_access b "
+    "WHERE a.user_id = b.user_id AND a.model_id = b.model_id "
+    "AND (coalesce(b.is_active, false), b.id) > (coalesce(a.is_active, false), a.id)",
+    "DO $$ BEGIN "
+    "IF EXISTS (SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+    "WHERE c.relname = 'ux_user_model_access_user_model' AND NOT i.indisvalid) THEN "
+    "DROP INDEX ux_user_model_access_user_model; "
+    "END IF; END $$",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_user_model_access_user_model "
+    "ON user_model_access (user_id, model_id)",
+    # Bill totals in integer cents for Stripe, backfilled for existing bills
+    "ALTER TABLE monthly_billing_summary ADD COLUMN IF NOT EXISTS total_cost_cents bigint",
+    "UPDATE monthly_billing_summary SET total_cost_cents = round(total_cost * 100) "
+    "WHERE total_cost_cents IS NULL",
+    # Per-user monthly request counter behind the discount thresholds, seeded
+    # from the logs of the current month (the backfill only raises counts)
+    "CREATE TABLE IF NOT EXISTS monthly_request_counts ("
+    "user_id integer NOT NULL REFERENCES users (id), year integer NOT NULL, "
+    "month integer NOT NULL, n bigint NOT NULL, PRIMARY KEY (user_id, year, month))",
+    "INSERT INTO monthly_request_counts (user_id, year, month, n) "
+    "SELECT user_id, extract(year FROM created_at)::int, extract(month FROM created_at)::int, count(*) "
+    "FROM api_usage_logs "
+    "WHERE user_id IS NOT NULL AND created_at >= date_trunc('month', timezone('UTC', now())) "
+    "GROUP BY 1, 2, 3 "
+    "ON CONFLICT (user_id, year, month) DO UPDATE SET n = GREATEST(monthly_request_counts.n, EXCLUDED.n)",
+]
+
+async def migrate_performance_indexes():
+    """Create performance indexes on existing databases"""
+    
+    # Load environment variables
+    load_dotenv()
+    
+    # Get database URL
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not found in environment variables")
+        return
+    
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    engine = create_async_engine(database_url, isolation_level="AUTOCOMMIT")
+    
+    try:
+        async with engine.connect() as conn:
+            print("🚀 Starting performance index migration...")
+            
+            for statement in INDEXES:
+                try:
+                    await conn.execute(text(statement))
+                    print(f"✅ {statement.split(' ON ')[0]}")
+                except Exception as e:
+                    print(f"⚠️ Failed: {statement}\n   {e}")
+            
+            # Vacuum also updates the visibility map, which index-only scans rely on
+            print("📝 Refreshing planner statistics...")
+            await conn.execute(text("VACUUM ANALYZE"))
+            print("🎉 Migration completed successfully!")
+                
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_performance_indexes())
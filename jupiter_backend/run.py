@@ -11,4 +11,4 @@ async def on_startup():
     await init_db()
 
 if __name__ == "__main__":
-    uvicorn.run("run:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("run:app", host="0.0.0.0", port=8000, reload=True, proxy_headers=False)